@@ -1,3 +1,19 @@
 from django.contrib import admin
 
+from .models import PipelineRun
+
+
 # Register your models here.
+@admin.register(PipelineRun)
+class PipelineRunAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'mode', 'generator', 'status', 'wall_seconds', 'candidates_generated',
+                    'candidates_scored', 'llm_requests', 'total_tokens', 'cost_usd', 'accepted', 'above_threshold',
+                    'candidates_per_above_threshold', 'validated', 'cost_per_accepted')
+    list_filter = ('status', 'mode', 'generator', 'started_at')
+    search_fields = ('run_id',)
+    date_hierarchy = 'started_at'
+    readonly_fields = [field.name for field in PipelineRun._meta.fields]
+
+    def has_add_permission(self, request):
+        # Runs are written by the pipeline itself
+        return False
@@ -0,0 +1,190 @@
+# ###################################### ###################################### #
+# Agent Scores
+#
+# Every agent's raw score of every username it scored is kept in agent_scores (one row per username and agent,
+# the latest score wins), not only the weighted average stored in high_rated_unames. New agent weights or another
+# aggregation rule can then be tried on the whole scoring history without paying for the LLM calls again:
+# I. The rows are read into a score matrix, usernames x agents, NaN where an agent did not score a username.
+#    `manage.py rerank_scores --export` saves it as a compressed .npz file, which can stand in for the table.
+# II. aggregate_score_matrix() reduces the matrix per username with NumPy, under any weights and rule:
+#    'mean' (weighted by the agents that scored the username, as the pipeline ranks a cycle), 'median', 'min'
+#    or 'max' (over the agents with a weight above 0).
+# III. rank_scores() sorts the usernames by their aggregated score, the cycle's ranking is the same call.
+#
+# NumPy is imported on first use, like the step modules' other heavy dependencies.
+# ###################################### ###################################### #
+
+import warnings
+
+from .pipeline_events import emit
+from .step2_MariaDB_database_engine import async_ensure_table, connect_to_database, ensure_table, iter_row_batches
+
+AGGREGATION_RULES = ('mean', 'median', 'min', 'max')
+
+CREATE_AGENT_SCORES_QUERY = '''
+CREATE TABLE IF NOT EXISTS agent_scores (
+    username VARCHAR(255) NOT NULL,
+    agent VARCHAR(64) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    score FLOAT NOT NULL,
+    run_id VARCHAR(32) NULL,
+    scored_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (username, agent)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
+'''
+
+INSERT_AGENT_SCORES_QUERY = '''
+INSERT INTO agent_scores (username, agent, model, score, run_id) VALUES (%s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE model = VALUES(model), score = VALUES(score), run_id = VALUES(run_id)
+'''
+
+AGENT_SCORES_QUERY = '''
+SELECT username, agent, score FROM agent_scores
+'''
+
+
+# ###################################### #
+# Storage
+# ###################################### #
+
+def agent_score_rows(agent, results, run_id=None):
+    return [(usern, agent.name[:64], agent.model[:64], float(score), run_id)
+            for entry in results for usern, score in entry.items()]
+
+
+def store_agent_scores(agent, results, run_id=None):
+    """Upserts one agent's [{username: score}, ...] results into agent_scores."""
+    rows = agent_score_rows(agent, results, run_id)
+    if not rows:
+        return
+    # The raw scores only matter to later re-rankings, failing to keep them must not fail the run
+    try:
+        conn = connect_to_database()
+        cursor = conn.cursor()
+        try:
+            ensure_table(cursor, 'agent_scores', CREATE_AGENT_SCORES_QUERY)
+            cursor.executemany(INSERT_AGENT_SCORES_QUERY, rows)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+    except Exception as e:
+        emit(f"Could not store the raw scores of {agent.name}: {e}")
+
+
+async def async_store_agent_scores(pool, agent, results, run_id=None):
+    """store_agent_scores() on the async pipeline's aiomysql pool."""
+    rows = agent_score_rows(agent, results, run_id)
+    if not rows:
+        return
+    try:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await async_ensure_table(cursor, 'agent_scores', CREATE_AGENT_SCORES_QUERY)
+                await cursor.executemany(INSERT_AGENT_SCORES_QUERY, rows)
+            await conn.commit()
+    except Exception as e:
+        emit(f"Could not store the raw scores of {agent.name}: {e}")
+
+
+# ###################################### #
+# I. Score matrix
+# ###################################### #
+
+def build_score_matrix(agent_columns):
+    """(usernames, scores) of one iterable of (username, score) pairs per agent, scores usernames x agents."""
+    import numpy as np
+
+    index = {}
+    columns = []
+    for pairs in agent_columns:
+        rows, values = [], []
+        for usern, score in pairs:
+            rows.append(index.setdefault(usern, len(index)))
+            values.append(score)
+        columns.append((rows, values))
+
+    scores = np.full((len(index), len(columns)), np.nan)
+    for column, (rows, values) in enumerate(columns):
+        scores[rows, column] = values
+    return list(index), scores
+
+
+def load_score_matrix():
+    """(usernames, agents, scores) of the whole agent_scores table, streamed in batches."""
+    import numpy as np
+
+    conn = connect_to_database()
+    cursor = conn.cursor(buffered=False)
+    usernames, agents = {}, {}
+    rows, columns, values = [], [], []
+    try:
+        cursor.execute(CREATE_AGENT_SCORES_QUERY)
+        cursor.execute(AGENT_SCORES_QUERY)
+        for batch in iter_row_batches(cursor):
+            for usern, agent, score in batch:
+                rows.append(usernames.setdefault(usern, len(usernames)))
+                columns.append(agents.setdefault(agent, len(agents)))
+                values.append(score)
+    finally:
+        cursor.close()
+        conn.close()
+
+    scores = np.full((len(usernames), len(agents)), np.nan)
+    if values:
+        scores[rows, columns] = values
+    return list(usernames), list(agents), scores
+
+
+def export_score_matrix(path, usernames, agents, scores):
+    """Saves the matrix as a compressed .npz file (float32 scores, NaN where an agent did not score)."""
+    import numpy as np
+
+    np.savez_compressed(path, usernames=np.array(usernames, dtype=str), agents=np.array(agents, dtype=str),
+                        scores=scores.astype(np.float32))
+
+
+def load_exported_score_matrix(path):
+    import numpy as np
+
+    with np.load(path, allow_pickle=False) as data:
+        return data['usernames'].tolist(), data['agents'].tolist(), data['scores'].astype(np.float64)
+
+
+# ###################################### #
+# II-III. Aggregation and ranking
+# ###################################### #
+
+def aggregate_score_matrix(scores, weights, rule='mean'):
+    """Aggregated score of every row of the matrix, NaN for a username no weighted agent scored."""
+    import numpy as np
+
+    if rule not in AGGREGATION_RULES:
+        raise ValueError(f"Unknown aggregation rule {rule!r}, expected one of {', '.join(AGGREGATION_RULES)}")
+    weights = np.asarray(weights, dtype=np.float64)
+    scored = ~np.isnan(scores)
+
+    if rule == 'mean':
+        weight_sums = np.where(scored, weights, 0.0).sum(axis=1)
+        totals = np.where(scored, scores * weights, 0.0).sum(axis=1)
+        aggregated = np.full(len(scores), np.nan)
+        np.divide(totals, weight_sums, out=aggregated, where=weight_sums > 0)
+        return aggregated
+
+    weighted = scores[:, weights > 0]
+    if weighted.shape[1] == 0:
+        return np.full(len(scores), np.nan)
+    reduce = {'median': np.nanmedian, 'min': np.nanmin, 'max': np.nanmax}[rule]
+    with warnings.catch_warnings():
+        # A username none of the weighted agents scored reduces to NaN, and is left out of the ranking
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return reduce(weighted, axis=1)
+
+
+def rank_scores(usernames, aggregated):
+    """[(username, score), ...] from high to low, ties in the usernames' order, NaN scores left out."""
+    import numpy as np
+
+    order = np.argsort(-aggregated, kind='stable')
+    order = order[~np.isnan(aggregated[order])]
+    return list(zip([usernames[i] for i in order.tolist()], aggregated[order].tolist()))
@@ -0,0 +1,353 @@
+# ###################################### ###################################### #
+# Async Pipeline for the ASGI Deployment
+#
+# The same cycle as views.main_script (generate, score, store, validate, save), written for asyncio:
+# - aiomysql instead of mysql.connector, with one connection pool per event loop
+# - AsyncOpenAI instead of the blocking client, still paced by the shared request scheduler
+# - asyncio.sleep instead of time.sleep, and the Google lookups run off the event loop
+#
+# Under uvicorn (email_alchemist/asgi.py) one worker can then keep many pipeline runs in flight,
+# since a run waiting on the database, the LLM or the search API no longer holds a thread.
+# Queries, prompts, parsing and aggregation are shared with the blocking step modules.
+# ###################################### ###################################### #
+
+import asyncio
+import json
+import time
+import weakref
+
+from .llm_request_scheduler import scoring_scheduler, RequestFailedError
+from .pipeline_events import emit, async_pace
+from .pipeline_checkpoints import batch_checkpoint_key
+from .pipeline_metrics import count, span
+from .pipeline_runs import (async_load_run_checkpoint, async_pipeline_run, async_save_run_agent_scores,
+                            async_save_run_checkpoint, record_llm_failure, record_ranking, record_validated)
+from .results_api import invalidate_results_cache
+from .step2_MariaDB_database_engine import (
+    history_sync_queries,
+    top_scores_query,
+    scoring_row_to_dict,
+    final_table_query,
+    final_row_to_dict,
+    format_final_row
+)
+from .step3_generate_emails_patterns import generate_usernames
+from .step4_scoring_potential_records_wLLM import (
+    SCORING_AGENTS,
+    CREATE_HIGH_RATED_UNAMES_QUERY,
+    INSERT_HIGH_RATED_UNAMES_QUERY,
+    ProgressiveEnsemble,
+    calculate_average_scores,
+    collect_batch_scores,
+    estimate_tokens,
+    extract_json_from_response,
+    plan_agent_batches,
+    ranked_usernames_from_checkpoint,
+    record_completion_metrics
+)
+from .step5_custom_search_engine_API import (
+    CREATE_FINAL_TABLE_QUERY,
+    INSERT_FINAL_TABLE_QUERY,
+    WEB_SEARCH_ENABLED,
+    delete_checked_query,
+    final_table_rows,
+    google_search,
+    match_search_results,
+    scoring_usernames_query
+)
+from .vocabulary_versions import history_version_queries
+
+DATABASE = {
+    "host": "localhost",
+    "user": "root",
+    "password": "",
+    "db": "email_generation",
+    "charset": "utf8mb4",
+}
+
+# Connection pools and LLM clients belong to the event loop that created them
+database_pools = weakref.WeakKeyDictionary()
+openai_clients = weakref.WeakKeyDictionary()
+
+
+async def get_database_pool():
+    loop = asyncio.get_running_loop()
+    if loop not in database_pools:
+        import aiomysql
+
+        database_pools[loop] = await aiomysql.create_pool(minsize=1, maxsize=10, **DATABASE)
+    return database_pools[loop]
+
+
+def get_async_openai_client():
+    loop = asyncio.get_running_loop()
+    if loop not in openai_clients:
+        from openai import AsyncOpenAI
+
+        # Retries are left to the request scheduler
+        openai_clients[loop] = AsyncOpenAI(max_retries=0)
+    return openai_clients[loop]
+
+
+async def async_request_scoring_completion(agent, messages):
+    client = get_async_openai_client()
+    started_at = time.perf_counter()
+    response = await scoring_scheduler.submit_async(
+        lambda timeout: client.chat.completions.create(
+            model=agent.model,
+            messages=messages,
+            temperature=agent.temperature,
+            max_tokens=agent.max_tokens,
+            timeout=timeout
+        ),
+        estimated_tokens=estimate_tokens(agent, messages)
+    )
+    record_completion_metrics(agent, response, started_at)
+    return response.choices[0].message.content
+
+
+async def async_score_batch(agent, batch, cached=(), to_score=None):
+    """asyncio counterpart of score_batch."""
+    pool = await get_database_pool()
+    checkpoint_key = batch_checkpoint_key(agent, batch)
+    batch_result = await async_load_run_checkpoint(pool, 'agent_batch', checkpoint_key)
+    if batch_result is not None:
+        return batch_result
+
+    to_score = batch if to_score is None else to_score
+    batch_result = list(cached)
+    if to_score:
+        messages = agent.build_messages({"usernames": to_score})
+        try:
+            response_text = await async_request_scoring_completion(agent, messages)
+        except RequestFailedError as e:
+            emit(f"{agent.name} failed on a batch of {len(to_score)}, continuing without its scores: {e}")
+            record_llm_failure(agent)
+            return batch_result
+        batch_result.extend(extract_json_from_response(response_text))
+    await async_save_run_checkpoint(pool, 'agent_batch', batch_result, checkpoint_key)
+    return batch_result
+
+
+async def async_score_with_agent(agent, generated_usernames):
+    """asyncio counterpart of score_with_agent, the agent's batches are awaited together."""
+    results = []
+    with span('agent_scoring', agent=agent.name):
+        plan = plan_agent_batches(agent, generated_usernames)
+        batch_results = await asyncio.gather(*(async_score_batch(agent, *planned) for planned in plan))
+        for (batch, _, _), batch_result in zip(plan, batch_results):
+            collect_batch_scores(agent, batch, batch_result, results)
+    await async_save_run_agent_scores(await get_database_pool(), agent, results)
+    return results, sum(len(to_score) for _, _, to_score in plan)
+
+
+async def async_run_scoring_agent(agent, generated_usernames):
+    return (await async_score_with_agent(agent, generated_usernames))[0]
+
+
+async def async_progressive_ensemble_scoring(generated_usernames, top_k, agents=None, early_exit_margin=None):
+    ensemble = ProgressiveEnsemble(generated_usernames, top_k, agents or SCORING_AGENTS, early_exit_margin)
+
+    while ensemble.next_agent is not None:
+        agent = ensemble.next_agent
+        if not ensemble.undecided:
+            ensemble.skip_agent()
+            continue
+
+        emit(f"Calling {agent.name} for scoring ({len(ensemble.undecided)} undecided usernames)...")
+        result, scored = await async_score_with_agent(agent, {"usernames": ensemble.undecided})
+        emit(f"{agent.name} Results: {json.dumps(result, separators=(',', ':'), ensure_ascii=False)}\n")
+        with span('aggregation'):
+            ensemble.record(result, scored)
+
+    return ensemble.ranked_usernames()
+
+
+async def async_generate_usernames_with_AI_Scoring_agents(no_of_raw, no_of_sorted, progressive=True,
+                                                          early_exit_margin=None, run_id=None):
+    pool = await get_database_pool()
+    async with async_pipeline_run(pool, run_id=run_id):
+        if await async_load_run_checkpoint(pool, 'stored') is not None:
+            emit("The usernames of this cycle were stored before the run was interrupted, skipping to the next step.")
+            return
+
+        generated_usernames = await async_load_run_checkpoint(pool, 'generated')
+        if generated_usernames is not None:
+            emit("Phase I: Reusing the usernames generated before the run was interrupted...")
+        else:
+            emit("Phase I: Generating usernames...")
+            generated_usernames = await asyncio.to_thread(generate_usernames, no_of_raw)
+            await async_save_run_checkpoint(pool, 'generated', generated_usernames)
+        emit(f"Generated Usernames: {generated_usernames}\n")
+
+        sorted_usernames = ranked_usernames_from_checkpoint(await async_load_run_checkpoint(pool, 'aggregated'))
+        if sorted_usernames is None:
+            if progressive:
+                sorted_usernames = await async_progressive_ensemble_scoring(generated_usernames, no_of_sorted,
+                                                                            early_exit_margin=early_exit_margin)
+            else:
+                # Without early exit the agents are independent, so they all score at the same time
+                emit(f"Calling {', '.join(agent.name for agent in SCORING_AGENTS)} for scoring...")
+                all_agent_results = await asyncio.gather(
+                    *(async_run_scoring_agent(agent, generated_usernames) for agent in SCORING_AGENTS))
+                for agent, result in zip(SCORING_AGENTS, all_agent_results):
+                    emit(f"{agent.name} Results: {json.dumps(result, separators=(',', ':'), ensure_ascii=False)}\n")
+
+                emit("\nCalculating average scores and sorting usernames...")
+                with span('aggregation'):
+                    sorted_usernames = calculate_average_scores(all_agent_results,
+                                                                weights=[agent.weight for agent in SCORING_AGENTS])
+        await async_save_run_checkpoint(pool, 'aggregated', sorted_usernames)
+        await async_pace(0.55)
+
+        top_usernames = sorted_usernames[:no_of_sorted]
+        record_ranking(sorted_usernames, len(top_usernames))
+        emit(f"Calculated High-Performing usernames from this cycle: {top_usernames}")
+
+        with span('store_top_usernames'):
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(CREATE_HIGH_RATED_UNAMES_QUERY)
+                    await cursor.executemany(INSERT_HIGH_RATED_UNAMES_QUERY, top_usernames)
+                await conn.commit()
+        count('pipeline_db_rows_written_total', len(top_usernames), table='high_rated_unames')
+        await async_save_run_checkpoint(pool, 'stored', len(top_usernames))
+
+        emit(f"\nInserted top {no_of_sorted} high scoring usernames into the database (high_rated_unames).")
+        await async_pace(1.33)
+
+
+async def async_interrogate_scoring_table(table='high_rated_unames', history_table='high_rated_unames_history',
+                                          limit_records=25):
+    pool = await get_database_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            with span('history_sync'):
+                rows_written = 0
+                for query in history_sync_queries(table, history_table):
+                    await cursor.execute(query)
+                    rows_written += max(cursor.rowcount, 0)
+                    count('pipeline_db_rows_written_total', max(cursor.rowcount, 0), table=history_table)
+                if rows_written:
+                    for query, params in history_version_queries(rows_written):
+                        await cursor.execute(query, params)
+                await conn.commit()
+            if rows_written:
+                await asyncio.to_thread(invalidate_results_cache)
+
+            await cursor.execute(top_scores_query(table, limit_records))
+            column_names = [i[0] for i in cursor.description]
+            rows = await cursor.fetchall()
+
+    for row in rows:
+        emit(scoring_row_to_dict(column_names, row))
+        await async_pace(0.25)
+
+
+async def async_fetch_usernames_for_search(limit=10, table='high_rated_unames', remove_checked=False):
+    emit(f"\nLoading Data from All time AI High scoring usernames (Production Table) "
+         f"\n(First Top {limit} Records as selected by User, to be processed in Search Engine)..")
+
+    pool = await get_database_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(scoring_usernames_query(table, limit))
+            rows = await cursor.fetchall()
+
+            ids_to_remove = [row[0] for row in rows]
+            if remove_checked and ids_to_remove:
+                await cursor.execute(delete_checked_query(table, len(ids_to_remove)), ids_to_remove)
+                await conn.commit()
+
+    return [row[1] for row in rows]
+
+
+async def async_scrape_google_for_validity(no_of_records, remove_record_after=False,
+                                           exact_search_engine_match=False):
+    AI_high_scoring_usernames = await async_fetch_usernames_for_search(limit=no_of_records,
+                                                                       remove_checked=remove_record_after)
+    emit(AI_high_scoring_usernames)
+
+    high_probability_real_usernames = []
+    for record_username in AI_high_scoring_usernames:
+        # The search client is blocking, it runs on a thread so the event loop stays free
+        with span('web_search'):
+            search_results = await asyncio.to_thread(google_search, record_username)
+        emit(f"\nSearching for *{record_username}*...")
+        match = match_search_results(record_username, search_results, exact_search_engine_match)
+        if match:
+            high_probability_real_usernames.append(match)
+
+        # Keep the search API pacing
+        if WEB_SEARCH_ENABLED:
+            await asyncio.sleep(1.3)
+
+    emit(f"\nTotal usernames saved to Final Production Table: {len(high_probability_real_usernames)}")
+    for entry in high_probability_real_usernames:
+        emit(f"Username: {entry['username']}, Search Result Title: {entry['title']}, URL: {entry['url']}")
+
+    return high_probability_real_usernames
+
+
+async def async_save_final_high_prob_users(usernames_list):
+    pool = await get_database_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(CREATE_FINAL_TABLE_QUERY)
+            await cursor.executemany(INSERT_FINAL_TABLE_QUERY, final_table_rows(usernames_list))
+        await conn.commit()
+    count('pipeline_db_rows_written_total', len(usernames_list), table='high_probability_real_usernames')
+
+
+async def async_interrogate_final_table(fetch_top_production_records):
+    emit("Current Main Production Final Table: ")
+
+    pool = await get_database_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(final_table_query(fetch_top_production_records))
+            rows = await cursor.fetchall()
+
+    final_rows = []
+    for row in rows:
+        row_dict = final_row_to_dict(row)
+        emit(format_final_row(row_dict))
+        final_rows.append(row_dict)
+    return final_rows
+
+
+async def async_main_script(progress=None, run_id=None, no_of_raw_generated_usernames=50, no_of_sorted=None,
+                            limit_ai_high_scoring_records=10, no_of_validated_records=10,
+                            fetch_top_production_records=10, exact_search_engine_match=False):
+    """asyncio counterpart of views.main_script, with the same stages, sizes and return value."""
+    if progress is None:
+        def progress(stage, fraction):
+            pass
+
+    if no_of_sorted is None:
+        no_of_sorted = int(no_of_raw_generated_usernames / 7)
+
+    async with async_pipeline_run(await get_database_pool(), run_id=run_id):
+        progress('generating_and_scoring', 0.05)
+        await async_generate_usernames_with_AI_Scoring_agents(no_of_raw=no_of_raw_generated_usernames,
+                                                              no_of_sorted=no_of_sorted)
+
+        progress('reviewing_scores', 0.5)
+        emit(f"\nCurrent top {limit_ai_high_scoring_records} High Scoring usernames from current cycle: ")
+        await async_interrogate_scoring_table(limit_records=limit_ai_high_scoring_records)
+
+        progress('web_validation', 0.6)
+        high_prob_real_usernames = await async_scrape_google_for_validity(
+            no_of_validated_records, remove_record_after=True, exact_search_engine_match=exact_search_engine_match)
+
+        progress('saving_results', 0.9)
+        await async_save_final_high_prob_users(high_prob_real_usernames)
+        record_validated(len(high_prob_real_usernames))
+
+        emit(f"\n\nCurrent top {limit_ai_high_scoring_records} Final High Scoring usernames (Final Production Table):")
+        final_rows = await async_interrogate_final_table(fetch_top_production_records)
+
+        return {
+            'high_probability_usernames': high_prob_real_usernames,
+            'final_table': final_rows,
+        }
@@ -0,0 +1,306 @@
+# ###################################### ###################################### #
+# Offline Benchmark Suite
+#
+# Times the pipeline's hot paths without MariaDB, OpenAI or Google:
+# - username generation (EmailGenerator.generate_email / generate_usernames) on synthetic vocabularies
+# - blocklist matching of generated usernames (username_blocklist), with the shipped list and a large one
+# - score aggregation (calculate_average_scores) on large agent outputs
+# - response parsing (extract_json_from_response) on large responses from a fake LLM
+# - bulk inserts into the score tables and the history sync query, against an in-memory SQLite stand-in
+#   running the same statements as MariaDB (translated by sqlite_query)
+#
+# `manage.py run_benchmarks` runs the suite, appends the results to a JSON history file and fails
+# when a benchmark got slower than its recent runs by more than the regression threshold.
+# SQLite timings track the Python side and the shape of the queries, not MariaDB's own performance.
+# ###################################### ###################################### #
+
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import string
+import time
+
+from .step2_MariaDB_database_engine import history_sync_queries
+from .step3_generate_emails_patterns import EmailGenerator, generate_usernames
+from .step4_scoring_potential_records_wLLM import (
+    CREATE_HIGH_RATED_UNAMES_QUERY,
+    INSERT_HIGH_RATED_UNAMES_QUERY,
+    calculate_average_scores,
+    extract_json_from_response
+)
+from .step5_custom_search_engine_API import CREATE_FINAL_TABLE_QUERY, INSERT_FINAL_TABLE_QUERY
+from .username_blocklist import BlocklistAutomaton, load_blocklist_terms
+
+# Runs compared against: a benchmark regresses when it is slower than the median of its last runs
+BASELINE_RUNS = 5
+
+
+# ###################################### #
+# Synthetic data and stand-ins
+# ###################################### #
+
+def synthetic_vocabulary(size, seed=0):
+    """EmailGenerator over size random words and names (3 to 5 letters), plus the usual years and numbers."""
+    rnd = random.Random(seed)
+
+    def random_word(capitalize=False):
+        length = rnd.randint(3, 5)
+        word = ''.join(rnd.choice(string.ascii_lowercase) for _ in range(length))
+        return {"word": word.capitalize() if capitalize else word, "NoOfLetters": length}
+
+    words_data = [random_word() for _ in range(size)]
+    names_data = [random_word(capitalize=True) for _ in range(size)]
+    years_data = [{"ID": idx, "word": str(year)} for idx, year in enumerate(range(1950, 2025), start=1)]
+    numbers_data = [{"ID": idx, "word": str(number)} for idx, number in enumerate(range(100), start=1)]
+    return EmailGenerator(words_data, names_data, years_data, numbers_data)
+
+
+def synthetic_usernames(count, seed=0):
+    rnd = random.Random(seed)
+    return [''.join(rnd.choice(string.ascii_lowercase + '_') for _ in range(rnd.randint(6, 14))) + str(idx)
+            for idx in range(count)]
+
+
+def synthetic_score_rows(count):
+    """(username, score) rows as stored in high_rated_unames."""
+    return [(usern, score) for entry in FakeLLM().scores(synthetic_usernames(count)) for usern, score in entry.items()]
+
+
+class FakeLLM:
+    """Answers a scoring prompt the way the agents do: a little prose around a JSON list of {username: score}."""
+
+    def __init__(self, seed=0, omit_rate=0.02):
+        self.random = random.Random(seed)
+        self.omit_rate = omit_rate
+
+    def scores(self, usernames):
+        return [{usern: round(self.random.uniform(0.01, 0.99), 2)}
+                for usern in usernames if self.random.random() >= self.omit_rate]
+
+    def respond(self, usernames):
+        return ("Here are the plausibility scores for the usernames you provided:\n\n```json\n"
+                + json.dumps(self.scores(usernames), indent=2)
+                + "\n```\n\nScores closer to 0.99 indicate a more realistic username.")
+
+
+def sqlite_query(query):
+    """Translates the MariaDB statements of the step modules to SQLite, for the in-memory stand-in."""
+    query = query.strip().rstrip(';').strip()
+    query = query.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE')
+    query = re.sub(r'\b(?:BIG)?INT AUTO_INCREMENT PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT', query)
+    query = re.sub(r'\s*CHARACTER SET \w+ COLLATE \w+', '', query)
+    query = query.replace(' ON UPDATE CURRENT_TIMESTAMP', '')
+    query = re.sub(r'(CREATE TABLE IF NOT EXISTS \S+) LIKE (\S+)', r'\1 AS SELECT * FROM \2 WHERE 0', query)
+    # Secondary keys and partitions of a CREATE TABLE, upserts
+    query = re.sub(r',\s*KEY \w+ \([\w, ]+\)', '', query)
+    query = re.sub(r'\s*PARTITION BY .*$', '', query, flags=re.DOTALL)
+    query = re.sub(r'ON DUPLICATE KEY UPDATE', 'ON CONFLICT DO UPDATE SET', query)
+    query = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', query).replace('GREATEST(', 'MAX(')
+    # INSERT ... (SELECT ...) -> INSERT ... SELECT ...
+    query = re.sub(r'(INSERT OR IGNORE INTO \S+(?: \([^)]*\))?)\s*\((SELECT .*)\)$', r'\1 \2', query,
+                   flags=re.DOTALL)
+    return query
+
+
+def sqlite_database():
+    return sqlite3.connect(':memory:')
+
+
+# ###################################### #
+# Benchmarks
+#
+# Each setup function prepares its data and returns (run, items): run() is the timed call,
+# items the number of units it processes (usernames, rows, ...) for the throughput figure.
+# ###################################### #
+
+def bench_generate_email(vocabulary_size):
+    def setup():
+        generator = synthetic_vocabulary(vocabulary_size)
+
+        def run():
+            for _ in range(5000):
+                generator.generate_email()
+        return run, 5000
+    return setup
+
+
+def bench_generate_usernames(vocabulary_size):
+    def setup():
+        generator = synthetic_vocabulary(vocabulary_size)
+        return (lambda: generate_usernames(5000, generator=generator)), 5000
+    return setup
+
+
+def bench_blocklist_scan(usernames_count, terms_count=None):
+    """Blocklist matching of generated usernames, against the shipped list or terms_count random terms."""
+    def setup():
+        generator = synthetic_vocabulary(1000)
+        if terms_count is None:
+            terms = load_blocklist_terms()
+        else:
+            rnd = random.Random(1)
+            terms = {''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(3, 6)))
+                     for _ in range(terms_count)}
+        automaton = BlocklistAutomaton(terms)
+        usernames = [[part for part in generator.generate_username_parts() if part != "_"]
+                     for _ in range(usernames_count)]
+
+        def run():
+            for elements in usernames:
+                automaton.blocks(elements)
+        return run, usernames_count
+    return setup
+
+
+def bench_calculate_average_scores(usernames_count, agents_count=3):
+    def setup():
+        usernames = synthetic_usernames(usernames_count)
+        llm = FakeLLM()
+        agent_results = [llm.scores(usernames) for _ in range(agents_count)]
+        return (lambda: calculate_average_scores(agent_results, [1.0] * agents_count)), usernames_count
+    return setup
+
+
+def bench_extract_json(usernames_count):
+    def setup():
+        response_text = FakeLLM().respond(synthetic_usernames(usernames_count))
+        return (lambda: extract_json_from_response(response_text)), usernames_count
+    return setup
+
+
+def bench_insert_scores(rows_count):
+    def setup():
+        rows = synthetic_score_rows(rows_count)
+
+        def run():
+            conn = sqlite_database()
+            cursor = conn.cursor()
+            cursor.execute(sqlite_query(CREATE_HIGH_RATED_UNAMES_QUERY))
+            cursor.executemany(sqlite_query(INSERT_HIGH_RATED_UNAMES_QUERY), rows)
+            conn.commit()
+            conn.close()
+        return run, len(rows)
+    return setup
+
+
+def bench_insert_final_rows(rows_count):
+    def setup():
+        rows = [(usern, f"{usern} - profile", f"https://example.com/{usern}")
+                for usern in synthetic_usernames(rows_count)]
+
+        def run():
+            conn = sqlite_database()
+            cursor = conn.cursor()
+            cursor.execute(sqlite_query(CREATE_FINAL_TABLE_QUERY))
+            cursor.executemany(sqlite_query(INSERT_FINAL_TABLE_QUERY), rows)
+            conn.commit()
+            conn.close()
+        return run, rows_count
+    return setup
+
+
+def bench_history_sync(rows_count, already_synced=0.5):
+    def setup():
+        rows = synthetic_score_rows(rows_count)
+        synced_count = int(len(rows) * already_synced)
+
+        def run():
+            conn = sqlite_database()
+            cursor = conn.cursor()
+            cursor.execute(sqlite_query(CREATE_HIGH_RATED_UNAMES_QUERY))
+            cursor.executemany(sqlite_query(INSERT_HIGH_RATED_UNAMES_QUERY), rows)
+            queries = history_sync_queries()
+            cursor.execute(sqlite_query(queries[0]))
+            cursor.execute("INSERT INTO high_rated_unames_history (ID, username, score) "
+                           "SELECT ID, username, score FROM high_rated_unames WHERE ID <= ?", (synced_count,))
+            start_time = time.perf_counter()
+            for query in queries:
+                cursor.execute(sqlite_query(query))
+            conn.commit()
+            elapsed = time.perf_counter() - start_time
+            conn.close()
+            # Only the sync itself is timed, see run_benchmark
+            return elapsed
+        return run, rows_count
+    return setup
+
+
+BENCHMARKS = {
+    'generate_email[vocab=100]': bench_generate_email(100),
+    'generate_email[vocab=10000]': bench_generate_email(10000),
+    'generate_usernames[vocab=1000]': bench_generate_usernames(1000),
+    'blocklist_scan[100000]': bench_blocklist_scan(100000),
+    'blocklist_scan[100000x5000 terms]': bench_blocklist_scan(100000, 5000),
+    'calculate_average_scores[50000x3]': bench_calculate_average_scores(50000),
+    'extract_json_from_response[10000]': bench_extract_json(10000),
+    'insert_high_rated_unames[20000]': bench_insert_scores(20000),
+    'insert_final_table[20000]': bench_insert_final_rows(20000),
+    'history_sync[5000]': bench_history_sync(5000),
+}
+
+
+def run_benchmark(setup, repeat=5):
+    """Times run() repeat times, returns median/min seconds and the throughput at the median."""
+    run, items = setup()
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        measured = run()
+        elapsed = time.perf_counter() - start_time
+        # A benchmark timing only part of its run returns that part's duration
+        timings.append(measured if isinstance(measured, float) else elapsed)
+
+    median = statistics.median(timings)
+    return {
+        'median_seconds': median,
+        'min_seconds': min(timings),
+        'items': items,
+        'items_per_second': items / median if median > 0 else None,
+    }
+
+
+def run_benchmarks(names=None, repeat=5, report=print):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results[name] = run_benchmark(setup, repeat=repeat)
+        report(f"{name:40s} {results[name]['median_seconds'] * 1000:10.2f} ms "
+               f"({results[name]['items_per_second'] or 0:,.0f} items/s)")
+    return results
+
+
+# ###################################### #
+# History and regression check
+# ###################################### #
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as history_file:
+        return json.load(history_file)
+
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as history_file:
+        json.dump(history, history_file, indent=2)
+
+
+def find_regressions(results, history, threshold):
+    """
+    Benchmarks whose median is more than threshold (0.2 = 20%) above the median of their last BASELINE_RUNS runs.
+    Returns [(name, seconds, baseline seconds), ...].
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = [run['results'][name]['median_seconds'] for run in history if name in run['results']]
+        if not previous:
+            continue
+        baseline = statistics.median(previous[-BASELINE_RUNS:])
+        if result['median_seconds'] > baseline * (1 + threshold):
+            regressions.append((name, result['median_seconds'], baseline))
+    return regressions
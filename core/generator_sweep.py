@@ -0,0 +1,178 @@
+# ###################################### ###################################### #
+# Generator Parameter Sweep
+#
+# Tunes the fixed generator's probabilities (step3.DEFAULT_GENERATOR_PARAMS) offline, with no LLM call:
+# I. A proxy scorer is fitted to usernames that were already scored (agent_scores, or the history table):
+#    the share above the score threshold of every username shape (element types and separators) and of every
+#    element, pulled towards the overall share while they are rare. A username already scored keeps its verdict.
+# II. Each configuration of a grid or random search generates the same number of usernames in a process pool
+#    (same seed for all, so they differ by their parameters only, not by luck), blocklist included.
+# III. The configurations are ranked by effective yield: expected new usernames above the threshold per generated
+#    candidate, counting each distinct username once and the usernames already scored not at all, so a configuration
+#    repeating its best usernames, or the history's, gains nothing.
+#
+# The proxy only knows the shapes and elements the agents have seen, a sweep points at promising settings that a
+# real cycle (EMAIL_GENERATOR_PARAMS, run ledger) still has to confirm.
+# ###################################### ###################################### #
+
+import itertools
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from .learned_patterns import PATTERN_MODEL_HISTORY_ROWS, load_history, split_username
+from .pipeline_events import event_sink
+from .pipeline_runs import SCORE_THRESHOLD
+from .step3_generate_emails_patterns import (DEFAULT_GENERATOR_PARAMS, EmailGenerator, generate_usernames,
+                                             validate_generator_params)
+
+PROXY_SOURCES = ('agent-scores', 'history')
+# Pseudo-counts pulling the share of a shape or an element towards the overall share
+PROXY_PRIOR_WEIGHT = 5.0
+
+
+# ###################################### #
+# I. Proxy scorer
+# ###################################### #
+
+def shape_key(elements):
+    """'name_word-year' style key of a split username, '_' where a separator precedes the element."""
+    return '-'.join(f"{'_' if separator else ''}{element_type}" for _, element_type, separator in elements)
+
+
+class ProxyScorer:
+    """Chance of a username to score above the threshold, estimated from usernames already scored."""
+
+    def __init__(self, vocabulary, known, shape_rates, element_rates, base_rate):
+        self.vocabulary = vocabulary
+        self.max_length = max(map(len, vocabulary), default=0)
+        self.known = known
+        self.shape_rates = shape_rates
+        self.element_rates = element_rates
+        self.base_rate = base_rate
+
+    @classmethod
+    def fit(cls, rows, vocabulary, threshold=SCORE_THRESHOLD, prior_weight=PROXY_PRIOR_WEIGHT):
+        """Fits the proxy to (username, score) rows."""
+        max_length = max(map(len, vocabulary), default=0)
+        known = {}
+        above, total = Counter(), Counter()
+        for username, score in rows:
+            high = float(score) >= threshold
+            known[username] = high
+            elements = split_username(username, vocabulary, max_length)
+            if elements is None:
+                continue
+            keys = [('shape', shape_key(elements))] + [('element', element) for element, _, _ in elements]
+            total.update(keys)
+            if high:
+                above.update(keys)
+
+        base_rate = sum(known.values()) / len(known) if known else 0.0
+        rates = {key: (above[key] + prior_weight * base_rate) / (count + prior_weight) for key, count in total.items()}
+        return cls(vocabulary, known,
+                   shape_rates={name: rate for (kind, name), rate in rates.items() if kind == 'shape'},
+                   element_rates={name: rate for (kind, name), rate in rates.items() if kind == 'element'},
+                   base_rate=base_rate)
+
+    def probability(self, username):
+        if username in self.known:
+            return 1.0 if self.known[username] else 0.0
+        elements = split_username(username, self.vocabulary, self.max_length)
+        if elements is None:
+            return self.base_rate
+        rates = [self.shape_rates.get(shape_key(elements), self.base_rate)]
+        rates.extend(self.element_rates.get(element, self.base_rate) for element, _, _ in elements)
+        return sum(rates) / len(rates)
+
+
+def load_proxy_rows(source, history_rows=PATTERN_MODEL_HISTORY_ROWS):
+    """(username, score) rows to fit the proxy to: every agent's raw scores averaged, or the history table."""
+    if source == 'history':
+        return list(load_history(history_rows))
+
+    from .agent_scores import aggregate_score_matrix, load_score_matrix, rank_scores
+    from .scoring_agents import load_scoring_agents
+
+    usernames, agents, scores = load_score_matrix()
+    weights = {agent.name: agent.weight for agent in load_scoring_agents()}
+    return rank_scores(usernames, aggregate_score_matrix(scores, [weights.get(agent, 0.0) for agent in agents]))
+
+
+# ###################################### #
+# II. Configurations and their evaluation
+# ###################################### #
+
+def random_weights(rnd, size):
+    """Weights drawn uniformly over the simplex."""
+    draws = [rnd.gammavariate(1.0, 1.0) for _ in range(size)]
+    total = sum(draws)
+    return [round(draw / total, 3) for draw in draws]
+
+
+def random_configurations(count, seed=0):
+    rnd = random.Random(seed)
+    configurations = []
+    for _ in range(count):
+        configurations.append({
+            name: random_weights(rnd, len(default)) if isinstance(default, list) else round(rnd.random(), 3)
+            for name, default in DEFAULT_GENERATOR_PARAMS.items()
+        })
+    return configurations
+
+
+def grid_configurations(grid):
+    """Every combination of {parameter: [values, ...]}, the other parameters keep their defaults."""
+    names = list(grid)
+    return [validate_generator_params(dict(zip(names, values)))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+# Vocabulary and proxy of a worker process, sent once by the pool's initializer instead of with every configuration
+worker_state = {}
+
+
+def init_sweep_worker(vocabulary_data, proxy):
+    worker_state['vocabulary_data'] = vocabulary_data
+    worker_state['proxy'] = proxy
+
+
+def evaluate_configuration(params, samples, seed):
+    """Generates samples usernames under params and measures them with the proxy."""
+    started_at = time.perf_counter()
+    proxy = worker_state['proxy']
+    generator = EmailGenerator(*worker_state['vocabulary_data'], params=params)
+    random.seed(seed)
+    with event_sink(lambda event: None):
+        usernames = generate_usernames(samples, generator=generator)['usernames']
+
+    probabilities = {username: proxy.probability(username) for username in set(usernames)}
+    # A username already scored is already in the history, finding it again is no yield
+    novel = [username for username in probabilities if username not in proxy.known]
+    generated = max(len(usernames), 1)
+    return {
+        'params': generator.params,
+        'changed': {name: value for name, value in params.items() if DEFAULT_GENERATOR_PARAMS[name] != value},
+        'effective_yield': sum(probabilities[username] for username in novel) / generated,
+        'expected_yield': sum(probabilities[username] for username in usernames) / generated,
+        'unique_fraction': len(probabilities) / generated,
+        'novel_fraction': len(novel) / generated,
+        'generated': len(usernames),
+        'seconds': time.perf_counter() - started_at,
+    }
+
+
+# ###################################### #
+# III. Sweep
+# ###################################### #
+
+def run_sweep(configurations, vocabulary_data, proxy, samples=5000, workers=None, seed=0):
+    """Evaluates the defaults and every configuration, returns the results by effective yield, best first."""
+    configurations = [{}] + list(configurations)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_sweep_worker,
+                             initargs=(vocabulary_data, proxy)) as executor:
+        results = list(executor.map(evaluate_configuration, configurations, itertools.repeat(samples),
+                                    itertools.repeat(seed)))
+    results[0]['baseline'] = True
+    return sorted(results, key=lambda result: result['effective_yield'], reverse=True)
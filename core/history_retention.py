@@ -0,0 +1,140 @@
+# ###################################### ###################################### #
+# History Retention
+#
+# high_rated_unames_history grows by every cycle's top usernames and is partitioned by month of created_at
+# (see history_sync_queries in step 2). `manage.py archive_history`, run daily or monthly:
+# I. Adds the partitions of the coming months, split off the catch-all one while it is still empty.
+# II. Compacts every month past the retention into a gzip'd CSV file of the archive directory, streamed out
+#    of its partition alone, written to a temporary file and renamed once complete.
+# III. Drops the archived partitions, a metadata change instead of a DELETE over millions of rows.
+# A partition is only dropped once its archive file is on disk, a failed run is safe to run again.
+# ###################################### ###################################### #
+
+import csv
+import gzip
+import os
+from datetime import date
+
+from .pipeline_events import emit
+from .results_api import invalidate_results_cache
+from .step2_MariaDB_database_engine import (
+    HISTORY_FUTURE_PARTITION,
+    add_months,
+    connect_to_database,
+    history_partition_definition,
+    history_partition_name,
+    iter_row_batches,
+)
+
+HISTORY_TABLE = 'high_rated_unames_history'
+ARCHIVE_COLUMNS = ['ID', 'username', 'score', 'created_at']
+
+PARTITIONS_QUERY = '''
+SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+ORDER BY PARTITION_ORDINAL_POSITION
+'''
+
+
+def partition_month(partition):
+    """First day of the month of a pYYYYMM partition, None for the catch-all one."""
+    if partition == HISTORY_FUTURE_PARTITION:
+        return None
+    return date(int(partition[1:5]), int(partition[5:7]), 1)
+
+
+def list_history_partitions(cur, table=HISTORY_TABLE):
+    cur.execute(PARTITIONS_QUERY, (table,))
+    return [partition for partition, in cur.fetchall()]
+
+
+def ensure_history_partitions(cur, table=HISTORY_TABLE, months_ahead=1, today=None):
+    """Splits the partitions of the months up to months_ahead off the catch-all partition, returns their names."""
+    partitions = list_history_partitions(cur, table)
+    if not partitions:
+        # Not partitioned (yet), nothing to split
+        return []
+    months = [partition_month(partition) for partition in partitions if partition != HISTORY_FUTURE_PARTITION]
+    current_month = add_months(today or date.today(), 0)
+    # Months only ever get appended after the last one, the catch-all partition holds no row before it
+    next_month = add_months(max(months), 1) if months else current_month
+    missing = []
+    while next_month <= add_months(current_month, months_ahead):
+        missing.append(next_month)
+        next_month = add_months(next_month, 1)
+    if not missing:
+        return []
+
+    definitions = [history_partition_definition(month) for month in missing]
+    definitions.append(f"PARTITION {HISTORY_FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+    cur.execute(f"ALTER TABLE `{table}` REORGANIZE PARTITION {HISTORY_FUTURE_PARTITION} INTO "
+                f"({', '.join(definitions)})")
+    return [history_partition_name(month) for month in missing]
+
+
+def expired_partitions(partitions, retention_months, today=None):
+    """Partitions whose whole month is older than the last retention_months months."""
+    cutoff = add_months(today or date.today(), -retention_months)
+    return [partition for partition in partitions
+            if partition_month(partition) is not None and add_months(partition_month(partition), 1) <= cutoff]
+
+
+def archive_partition(conn, partition, archive_dir, table=HISTORY_TABLE):
+    """Streams one partition into archive_dir/<table>-<partition>.csv.gz, returns (path, rows written)."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{table}-{partition}.csv.gz")
+    temporary_path = path + '.tmp'
+    rows_written = 0
+
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM `{table}` PARTITION ({partition}) ORDER BY ID")
+        with gzip.open(temporary_path, 'wt', newline='', encoding='utf-8') as archive_file:
+            writer = csv.writer(archive_file)
+            writer.writerow(ARCHIVE_COLUMNS)
+            for rows in iter_row_batches(cursor):
+                writer.writerows(rows)
+                rows_written += len(rows)
+    except Exception:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    finally:
+        cursor.close()
+
+    os.replace(temporary_path, path)
+    return path, rows_written
+
+
+def archive_history(archive_dir, retention_months, months_ahead=1, dry_run=False, table=HISTORY_TABLE):
+    """Runs the retention job (I-III above), returns {'added': [...], 'archived': [{partition, path, rows}]}."""
+    conn = connect_to_database()
+    cur = conn.cursor()
+    report = {'added': [], 'archived': []}
+    try:
+        if dry_run:
+            partitions = list_history_partitions(cur, table)
+        else:
+            report['added'] = ensure_history_partitions(cur, table, months_ahead)
+            partitions = list_history_partitions(cur, table)
+        if not partitions:
+            emit(f"{table} is not partitioned, run the migrations first")
+            return report
+        if report['added']:
+            emit(f"Added history partitions {', '.join(report['added'])}")
+
+        for partition in expired_partitions(partitions, retention_months):
+            if dry_run:
+                emit(f"Would archive and drop history partition {partition}")
+                report['archived'].append({'partition': partition, 'path': None, 'rows': None})
+                continue
+            path, rows_written = archive_partition(conn, partition, archive_dir, table)
+            cur.execute(f"ALTER TABLE `{table}` DROP PARTITION {partition}")
+            emit(f"Archived {rows_written} history rows of {partition} to {path} and dropped the partition")
+            report['archived'].append({'partition': partition, 'path': path, 'rows': rows_written})
+    finally:
+        if report['archived'] and not dry_run:
+            invalidate_results_cache()
+        cur.close()
+        conn.close()
+    return report
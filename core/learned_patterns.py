@@ -0,0 +1,223 @@
+# ###################################### ###################################### #
+# Learned Username Patterns
+#
+# The fixed generator (step 3) draws element types and separators with hand-set weights. The learned mode
+# (EMAIL_GENERATOR_MODE=learned) fits them from the scoring history instead:
+# I. Every username of high_rated_unames_history is split back into its elements (name, word, year, number)
+#    and separators, using the vocabulary the generator draws from; usernames that do not split are skipped.
+# II. A Markov chain over the element types (start -> type -> ... -> end) and the separator probability
+#    of each type pair are counted separately for the usernames above and below the score threshold.
+# III. The sampling distribution favours what the high scorers do more often than the low scorers:
+#    p ~ p_high * (p_high / p_low) ** PATTERN_MODEL_CONTRAST, with add-one smoothing so nothing gets ruled out.
+#    Sampling still keeps to the fixed generator's rules (one year or number per username, no username of three
+#    elements or more made of a single type): the types a rule excludes are masked out of each draw.
+#
+# The history only holds usernames that made a cycle's top-K, so "low" means stored below the threshold.
+# Whether the learned mode pays off shows in the run ledger: candidates generated per username above the
+# threshold, by generator (`manage.py pattern_model`).
+# ###################################### ###################################### #
+
+import os
+import random
+from collections import Counter
+
+from .pipeline_runs import SCORE_THRESHOLD
+from .step2_MariaDB_database_engine import connect_to_database, iter_row_batches
+
+ELEMENT_TYPES = ('name', 'word', 'year', 'number')
+START = 'start'
+END = 'end'
+# Same bounds as layer_1_select_number_of_elements, and usernames still open with a name or a word
+MIN_ELEMENTS = 2
+MAX_ELEMENTS = 4
+FIRST_ELEMENT_TYPES = ('name', 'word')
+# At most one of these per username, as in layer_2_select_elements
+NUMERIC_TYPES = ('year', 'number')
+
+# Weight of the high scorers over the low scorers, 0 samples the high scorers' own distribution.
+# Kept moderate: the model learns from its own output, a sharper tilt stops it from exploring other shapes
+PATTERN_MODEL_CONTRAST = float(os.getenv('PATTERN_MODEL_CONTRAST', 0.5))
+# Segmented usernames needed before the learned mode is used, and how much recent history is read
+PATTERN_MODEL_MIN_ROWS = int(os.getenv('PATTERN_MODEL_MIN_ROWS', 200))
+PATTERN_MODEL_HISTORY_ROWS = int(os.getenv('PATTERN_MODEL_HISTORY_ROWS', 20000))
+# History rows added since the fit before a running worker fits its model again
+PATTERN_MODEL_REFIT_ROWS = int(os.getenv('PATTERN_MODEL_REFIT_ROWS', 500))
+
+HISTORY_QUERY = '''
+SELECT username, score FROM high_rated_unames_history ORDER BY created_at DESC, ID DESC LIMIT %s
+'''
+
+
+# ###################################### #
+# I. Splitting usernames into elements
+# ###################################### #
+
+def build_vocabulary(words_data, names_data, years_data, numbers_data):
+    """{element: type} of the generator's vocabulary, a year wins over a number and a name over a word."""
+    vocabulary = {}
+    for element_type, data in (('word', words_data), ('name', names_data), ('number', numbers_data),
+                               ('year', years_data)):
+        for row in data:
+            vocabulary[str(row["word"])] = element_type
+    return vocabulary
+
+
+def segment_part(part, vocabulary, max_length):
+    """Fewest-elements split of a separator-free part, [(element, type), ...] or None when it does not split."""
+    # best[i]: shortest list of elements covering part[:i]
+    best = [None] * (len(part) + 1)
+    best[0] = []
+    for end in range(1, len(part) + 1):
+        for start in range(max(0, end - max_length), end):
+            element_type = vocabulary.get(part[start:end])
+            if element_type is None or best[start] is None:
+                continue
+            if best[end] is None or len(best[start]) + 1 < len(best[end]):
+                best[end] = best[start] + [(part[start:end], element_type)]
+    return best[-1]
+
+
+def split_username(username, vocabulary, max_length=None):
+    """[(element, type, separator before it), ...] of a generated username, None when it does not split."""
+    if max_length is None:
+        max_length = max(map(len, vocabulary), default=0)
+    elements = []
+    for part_index, part in enumerate(username.split('_')):
+        pieces = segment_part(part, vocabulary, max_length) if part else None
+        if not pieces:
+            return None
+        elements.extend((element, element_type, part_index > 0 and idx == 0)
+                        for idx, (element, element_type) in enumerate(pieces))
+    return elements
+
+
+def segment_username(username, vocabulary, max_length=None):
+    """[(type, separator before it), ...] of a generated username, None when it is not made of the vocabulary."""
+    elements = split_username(username, vocabulary, max_length)
+    if elements is None:
+        return None
+    return [(element_type, separator) for _, element_type, separator in elements]
+
+
+# ###################################### #
+# II-III. Fitting and sampling
+# ###################################### #
+
+def tilted_distribution(outcomes, high_counts, low_counts, contrast=PATTERN_MODEL_CONTRAST, smoothing=1.0):
+    """{outcome: probability} favouring the outcomes more frequent among the high scorers than the low ones."""
+    high_total = sum(high_counts[outcome] for outcome in outcomes) + smoothing * len(outcomes)
+    low_total = sum(low_counts[outcome] for outcome in outcomes) + smoothing * len(outcomes)
+    weights = {}
+    for outcome in outcomes:
+        p_high = (high_counts[outcome] + smoothing) / high_total
+        p_low = (low_counts[outcome] + smoothing) / low_total
+        weights[outcome] = p_high * (p_high / p_low) ** contrast
+    total = sum(weights.values())
+    return {outcome: weight / total for outcome, weight in weights.items()}
+
+
+def allowed_following(types, following):
+    """Whether following may come after the element types drawn so far, under the fixed generator's rules."""
+    if following == END:
+        return len(types) >= MIN_ELEMENTS
+    if following in NUMERIC_TYPES and any(element_type in NUMERIC_TYPES for element_type in types):
+        return False
+    # A third element of the only type drawn so far would make a single-type username
+    return len(types) < 2 or set(types) != {following}
+
+
+class PatternModel:
+    """
+    Element-type transitions {previous type: {next type: probability}} (START/END included) and
+    separator probabilities {"previous>next": probability} fitted from the scoring history.
+    """
+
+    def __init__(self, transitions, separators, high_rows=0, low_rows=0):
+        self.transitions = transitions
+        self.separators = separators
+        self.high_rows = high_rows
+        self.low_rows = low_rows
+
+    @classmethod
+    def fit(cls, rows, vocabulary, threshold=SCORE_THRESHOLD, contrast=PATTERN_MODEL_CONTRAST):
+        """Fits the model to (username, score) rows, returns None when no row splits into elements."""
+        transition_counts = {True: Counter(), False: Counter()}
+        separator_counts = {True: Counter(), False: Counter()}
+        rows_count = Counter()
+        max_length = max(map(len, vocabulary), default=0)
+
+        for username, score in rows:
+            elements = segment_username(username, vocabulary, max_length)
+            if elements is None or not MIN_ELEMENTS <= len(elements) <= MAX_ELEMENTS:
+                continue
+            high = float(score) >= threshold
+            rows_count[high] += 1
+            path = [START] + [element_type for element_type, _ in elements] + [END]
+            transition_counts[high].update(zip(path, path[1:]))
+            separator_counts[high].update((previous[0], element_type, separator)
+                                          for previous, (element_type, separator) in zip(elements, elements[1:]))
+
+        if not rows_count:
+            return None
+
+        transitions = {}
+        for previous in (START,) + ELEMENT_TYPES:
+            outcomes = [(previous, element_type) for element_type in
+                        (FIRST_ELEMENT_TYPES if previous == START else ELEMENT_TYPES + (END,))]
+            distribution = tilted_distribution(outcomes, transition_counts[True], transition_counts[False], contrast)
+            transitions[previous] = {following: p for (_, following), p in distribution.items()}
+
+        separators = {}
+        for previous in ELEMENT_TYPES:
+            for following in ELEMENT_TYPES:
+                outcomes = [(previous, following, True), (previous, following, False)]
+                distribution = tilted_distribution(outcomes, separator_counts[True], separator_counts[False],
+                                                   contrast)
+                separators[f"{previous}>{following}"] = distribution[(previous, following, True)]
+
+        return cls(transitions, separators, high_rows=rows_count[True], low_rows=rows_count[False])
+
+    def sample_shape(self, rnd=random):
+        """[(type, separator before it), ...] of one username, between MIN_ELEMENTS and MAX_ELEMENTS long."""
+        elements = []
+        previous = START
+        while len(elements) < MAX_ELEMENTS:
+            types = [element_type for element_type, _ in elements]
+            options = {following: p for following, p in self.transitions[previous].items()
+                       if allowed_following(types, following)}
+            following = rnd.choices(list(options), weights=list(options.values()), k=1)[0]
+            if following == END:
+                break
+            separator = bool(elements) and rnd.random() < self.separators[f"{previous}>{following}"]
+            elements.append((following, separator))
+            previous = following
+        return elements
+
+    def to_dict(self):
+        return {
+            'transitions': self.transitions,
+            'separators': self.separators,
+            'high_rows': self.high_rows,
+            'low_rows': self.low_rows,
+        }
+
+
+def load_history(limit=PATTERN_MODEL_HISTORY_ROWS):
+    """Yields the most recent (username, score) rows of the scoring history, streamed in batches."""
+    conn = connect_to_database()
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(HISTORY_QUERY, (limit,))
+        for rows in iter_row_batches(cursor):
+            yield from rows
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def load_pattern_model(vocabulary, min_rows=PATTERN_MODEL_MIN_ROWS, history_rows=PATTERN_MODEL_HISTORY_ROWS):
+    """The model fitted to the recent history, None when too little of it splits into the vocabulary."""
+    model = PatternModel.fit(load_history(history_rows), vocabulary)
+    if model is None or model.high_rows + model.low_rows < min_rows:
+        return None
+    return model
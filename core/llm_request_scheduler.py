@@ -0,0 +1,248 @@
+# ###################################### ###################################### #
+# Central Request Scheduler for the LLM Scoring Agents
+#
+# Every agent call of Step 4 goes through one scheduler, so the provider's limits are respected
+# no matter how many agents, batches or pipeline runs are in flight at the same time.
+#
+# I. Token buckets pace the calls against the requests-per-minute and tokens-per-minute quota.
+# II. A concurrency cap bounds the number of calls in flight (per event loop for the asyncio path).
+# III. Failed calls (429, 5xx, timeouts, dropped connections) are retried with jittered exponential
+#      backoff, and a Retry-After sent by the provider pauses every caller for that long.
+# IV. Queue depth, in-flight calls, throttling and retries are counted for monitoring.
+#
+# Limits are read from the environment (see RequestScheduler.from_env) so they can follow the account's quota.
+# ###################################### ###################################### #
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+from .pipeline_events import emit
+from .pipeline_metrics import register_gauge
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Client-side failures worth retrying, matched by name so the scheduler does not depend on one SDK
+RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout",
+                         "ConnectionError"}
+
+
+class RequestFailedError(Exception):
+    """Raised when a scheduled call failed for good, either not retryable or out of retries."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at rate_per_minute.
+    reserve() takes the tokens right away and returns how long the caller must wait before using them,
+    which keeps callers in arrival order and works for both blocking and asyncio callers.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        if self.rate_per_second <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+            self.updated_at = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate_per_second
+
+    def refund(self, amount):
+        """Gives back (or, with a negative amount, charges) tokens once the real usage is known."""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def is_retryable(exc):
+    if getattr(exc, "status_code", None) in RETRYABLE_STATUS_CODES:
+        return True
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return type(exc).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def retry_after_seconds(exc):
+    """Reads Retry-After (or OpenAI's retry-after-ms) from a failed call's response, if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers.get("retry-after-ms")) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        # HTTP-date form of Retry-After, fall back to the regular backoff
+        return None
+    return None
+
+
+class RequestScheduler:
+    def __init__(self, requests_per_minute=500, tokens_per_minute=200000, max_concurrency=4,
+                 timeout=60.0, max_retries=5, base_backoff=1.0, max_backoff=60.0):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.concurrency = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        # Per event loop concurrency caps for submit_async
+        self.async_concurrency = weakref.WeakKeyDictionary()
+
+        # Set by a Retry-After, every caller holds off until then
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.counters = {
+            "queued": 0,
+            "in_flight": 0,
+            "requests": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retries": 0,
+            "throttled": 0,
+            "throttled_seconds": 0.0,
+            "tokens_used": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            requests_per_minute=float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 500)),
+            tokens_per_minute=float(os.getenv("OPENAI_TOKENS_PER_MINUTE", 200000)),
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", 4)),
+            timeout=float(os.getenv("OPENAI_REQUEST_TIMEOUT", 60)),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", 5)),
+        )
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.counters[key] += amount
+
+    def _throttle_delay(self, estimated_tokens):
+        """Reserves the next attempt's share of the quota and returns how long to hold off before it."""
+        delay = max(self.paused_until - time.monotonic(),
+                    self.request_bucket.reserve(1),
+                    self.token_bucket.reserve(estimated_tokens))
+        if delay > 0:
+            self._count("throttled")
+            self._count("throttled_seconds", delay)
+        return max(delay, 0.0)
+
+    def _backoff(self, attempt):
+        # Full jitter keeps callers that failed together from retrying together
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    def _retry_delay(self, exc, attempt):
+        """Delay before retrying a failed attempt, raises RequestFailedError when it should not be retried."""
+        if not is_retryable(exc) or attempt == self.max_retries:
+            self._count("failed")
+            raise RequestFailedError(f"Request failed after {attempt + 1} attempt(s): {exc}") from exc
+
+        delay = retry_after_seconds(exc)
+        if delay is not None:
+            with self.lock:
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            delay += random.uniform(0, self.base_backoff)
+        else:
+            delay = self._backoff(attempt)
+        self._count("retries")
+        emit(f"Request failed ({exc}), retrying in {delay:.2f}s (attempt {attempt + 1} of {self.max_retries})...")
+        return delay
+
+    def _record_success(self, response, estimated_tokens):
+        usage = getattr(response, "usage", None)
+        used_tokens = getattr(usage, "total_tokens", None)
+        if used_tokens is not None:
+            self.token_bucket.refund(estimated_tokens - used_tokens)
+            self._count("tokens_used", used_tokens)
+        self._count("succeeded")
+
+    def submit(self, request_function, estimated_tokens=0):
+        """
+        Runs request_function(timeout=...) under the rate limits, retrying transient failures.
+        The response's usage.total_tokens, when present, replaces the estimate in the token bucket.
+        Raises RequestFailedError when the call cannot be completed.
+        """
+        self._count("queued")
+        self.concurrency.acquire()
+        self._count("queued", -1)
+        self._count("in_flight")
+        try:
+            for attempt in range(self.max_retries + 1):
+                time.sleep(self._throttle_delay(estimated_tokens))
+                self._count("requests")
+                try:
+                    response = request_function(timeout=self.timeout)
+                except Exception as exc:
+                    time.sleep(self._retry_delay(exc, attempt))
+                    continue
+                self._record_success(response, estimated_tokens)
+                return response
+        finally:
+            self._count("in_flight", -1)
+            self.concurrency.release()
+
+    def _async_concurrency(self):
+        # asyncio semaphores belong to one event loop, each loop gets its own with the same cap
+        loop = asyncio.get_running_loop()
+        if loop not in self.async_concurrency:
+            self.async_concurrency[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self.async_concurrency[loop]
+
+    async def submit_async(self, request_coroutine_function, estimated_tokens=0):
+        """
+        asyncio counterpart of submit(): awaits request_coroutine_function(timeout=...) under the same
+        token buckets, Retry-After pause and counters, waiting with asyncio.sleep so the event loop stays free.
+        """
+        self._count("queued")
+        async with self._async_concurrency():
+            self._count("queued", -1)
+            self._count("in_flight")
+            try:
+                for attempt in range(self.max_retries + 1):
+                    await asyncio.sleep(self._throttle_delay(estimated_tokens))
+                    self._count("requests")
+                    try:
+                        response = await request_coroutine_function(timeout=self.timeout)
+                    except Exception as exc:
+                        await asyncio.sleep(self._retry_delay(exc, attempt))
+                        continue
+                    self._record_success(response, estimated_tokens)
+                    return response
+            finally:
+                self._count("in_flight", -1)
+
+    def metrics(self):
+        """Snapshot of the scheduler's counters plus the current bucket levels."""
+        with self.lock:
+            snapshot = dict(self.counters)
+        snapshot["max_concurrency"] = self.max_concurrency
+        snapshot["request_tokens_available"] = self.request_bucket.tokens
+        snapshot["llm_tokens_available"] = self.token_bucket.tokens
+        return snapshot
+
+
+# Shared by every agent call in the process
+scoring_scheduler = RequestScheduler.from_env()
+
+register_gauge('pipeline_llm_scheduler', 'Request scheduler counters and bucket levels, by metric.',
+               lambda: {(('metric', name),): value for name, value in scoring_scheduler.metrics().items()})
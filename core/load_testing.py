@@ -0,0 +1,285 @@
+# ###################################### ###################################### #
+# Offline Load Testing
+#
+# Sizes a deployment by driving /process/ concurrently without OpenAI or Google spend:
+#
+# I. StubChatCompletionsServer imitates POST /v1/chat/completions: it scores the usernames found in the prompt,
+#    waits a configurable latency, fails a configurable share of calls (429 with Retry-After, or 500) and cuts
+#    answers longer than the token limit (finish_reason "length"), like the real API does.
+# II. stub_pipeline_environment() points the pipeline at the stub (OPENAI_BASE_URL) and turns off the Google lookups
+#    and the presentation pauses, so a run only costs what the deployment itself costs.
+# III. ramp_load() sends requests at increasing concurrency and reports throughput, p50/p95/p99 latency and errors,
+#    either through the background jobs (/process/ + status polling) or the async view (/process/async/).
+#
+# `manage.py stub_llm_server` and `manage.py load_test` wrap II-III for the command line.
+# ###################################### ###################################### #
+
+import ast
+import json
+import random
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin
+
+
+# ###################################### #
+# I. Stub chat-completions server
+# ###################################### #
+
+def prompt_usernames(messages):
+    """Usernames of a scoring prompt, the agents' user prompt embeds them as a Python list literal."""
+    for message in reversed(messages):
+        content = message.get('content') or ''
+        list_literal = re.search(r"\[[^\[\]]*\]", content)
+        if list_literal:
+            try:
+                return [str(usern) for usern in ast.literal_eval(list_literal.group(0))]
+            except (ValueError, SyntaxError):
+                continue
+    return []
+
+
+def stub_score(username):
+    # Stable across runs and processes, so repeated load tests see the same rankings
+    return round(0.01 + (zlib.crc32(username.encode('utf-8')) % 99) / 100, 2)
+
+
+def count_tokens(text):
+    # Same ~4 characters per token rule as the scheduler's estimate
+    return max(1, len(text) // 4)
+
+
+class StubChatCompletionsHandler(BaseHTTPRequestHandler):
+    # Set on the server: latency, jitter, error_rate, truncate_tokens, random
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # One line per call would drown the load test output
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'invalid_request_error'}})
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        server = self.server
+        time.sleep(max(0.0, server.random.gauss(server.latency, server.jitter)))
+        server.count('requests')
+
+        if server.random.random() < server.error_rate:
+            server.count('errors')
+            if server.random.random() < 0.5:
+                self.send_json(429, {'error': {'message': "Rate limit reached (stub).", 'type': 'rate_limit_error'}},
+                               headers={'retry-after-ms': '500'})
+            else:
+                self.send_json(500, {'error': {'message': "Internal error (stub).", 'type': 'server_error'}})
+            return
+
+        messages = request.get('messages', [])
+        content = json.dumps([{usern: stub_score(usern)} for usern in prompt_usernames(messages)])
+        completion_tokens = count_tokens(content)
+
+        finish_reason = 'stop'
+        token_limits = [limit for limit in (request.get('max_tokens'), server.truncate_tokens) if limit]
+        token_limit = min(token_limits) if token_limits else None
+        if token_limit and completion_tokens > token_limit:
+            server.count('truncated')
+            content = content[:token_limit * 4]
+            completion_tokens = token_limit
+            finish_reason = 'length'
+
+        prompt_tokens = sum(count_tokens(message.get('content') or '') for message in messages)
+        self.send_json(200, {
+            'id': f"chatcmpl-stub-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': finish_reason,
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        })
+
+
+class StubChatCompletionsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.5, jitter=0.1, error_rate=0.0, truncate_tokens=None, seed=None):
+        super().__init__(address, StubChatCompletionsHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.truncate_tokens = truncate_tokens
+        self.random = random.Random(seed)
+        self.counters = {'requests': 0, 'errors': 0, 'truncated': 0}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+# ###################################### #
+# II. Pipeline configuration
+# ###################################### #
+
+def stub_pipeline_environment(stub_url):
+    """Environment of the web process under test, with step 4 pointed at the stub at stub_url."""
+    return {
+        'OPENAI_BASE_URL': f"{stub_url.rstrip('/')}/v1",
+        'OPENAI_API_KEY': 'stub',
+        # No Google Custom Search calls, the validation stage finds no results
+        'WEB_SEARCH_ENABLED': '0',
+        # No presentation pauses between pipeline messages
+        'PIPELINE_PACING': '0',
+    }
+
+
+# ###################################### #
+# III. Load driver
+# ###################################### #
+
+def fetch_json(url, timeout):
+    request = urllib.request.Request(url, headers={'Accept': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def run_job_request(base_url, timeout, poll_interval):
+    """One run through /process/: enqueue, then poll the job until it finishes. Returns None or an error."""
+    started_at = time.monotonic()
+    job = fetch_json(urljoin(base_url, '/process/'), timeout)
+    status_url = urljoin(base_url, job['status_url'])
+    offset = 0
+    while time.monotonic() - started_at < timeout:
+        status = fetch_json(f"{status_url}?offset={offset}", timeout)
+        # Only new output is sent back on each poll
+        offset = status['output_total']
+        if status['status'] == 'succeeded':
+            return None
+        if status['status'] == 'failed':
+            return status['error'] or 'job failed'
+        time.sleep(poll_interval)
+    return 'timed out'
+
+
+def run_async_request(base_url, timeout, poll_interval):
+    """One run through /process/async/, the response arrives when the run is over."""
+    fetch_json(urljoin(base_url, '/process/async/'), timeout)
+    return None
+
+
+REQUEST_MODES = {
+    'job': run_job_request,
+    'async': run_async_request,
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load_step(base_url, concurrency, requests_count, mode='job', timeout=600, poll_interval=0.5):
+    """Sends requests_count pipeline runs with concurrency clients at a time and summarises them."""
+    send_request = REQUEST_MODES[mode]
+    remaining = iter(range(requests_count))
+    remaining_lock = threading.Lock()
+    latencies, errors = [], []
+    results_lock = threading.Lock()
+
+    def client():
+        while True:
+            with remaining_lock:
+                if next(remaining, None) is None:
+                    return
+            started_at = time.monotonic()
+            try:
+                error = send_request(base_url, timeout, poll_interval)
+            except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = time.monotonic() - started_at
+            with results_lock:
+                if error is None:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(error)
+
+    started_at = time.monotonic()
+    clients = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    wall_time = time.monotonic() - started_at
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': requests_count,
+        'succeeded': len(latencies),
+        'failed': len(errors),
+        'error_rate': len(errors) / requests_count if requests_count else 0.0,
+        'throughput_per_second': len(latencies) / wall_time if wall_time > 0 else 0.0,
+        'wall_seconds': wall_time,
+        'mean_seconds': statistics.mean(latencies) if latencies else None,
+        'p50_seconds': percentile(latencies, 0.50),
+        'p95_seconds': percentile(latencies, 0.95),
+        'p99_seconds': percentile(latencies, 0.99),
+        # A few distinct errors are enough to see what went wrong
+        'errors': sorted(set(errors))[:5],
+    }
+
+
+def ramp_load(base_url, concurrency_levels, requests_per_client=2, mode='job', timeout=600, poll_interval=0.5,
+              report=print):
+    """Runs run_load_step at each concurrency level in turn, returns the list of step summaries."""
+    steps = []
+    for concurrency in concurrency_levels:
+        step = run_load_step(base_url, concurrency, concurrency * requests_per_client, mode=mode, timeout=timeout,
+                             poll_interval=poll_interval)
+        steps.append(step)
+        report(format_step(step))
+    return steps
+
+
+def format_seconds(seconds):
+    return '-' if seconds is None else f"{seconds:.2f}s"
+
+
+def format_step(step):
+    return (f"concurrency {step['concurrency']:4d}: {step['succeeded']}/{step['requests']} ok, "
+            f"{step['throughput_per_second']:.2f} runs/s, p50 {format_seconds(step['p50_seconds'])}, "
+            f"p95 {format_seconds(step['p95_seconds'])}, p99 {format_seconds(step['p99_seconds'])}, "
+            f"errors {step['error_rate']:.1%}")
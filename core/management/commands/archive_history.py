@@ -0,0 +1,40 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.history_retention import archive_history
+from core.pipeline_events import event_sink
+
+
+class Command(BaseCommand):
+    help = ("Adds the coming months' partitions to the scoring history, archives the months past the retention "
+            "to gzip'd CSV files and drops their partitions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-months', type=int, default=settings.PIPELINE_HISTORY_RETENTION_MONTHS,
+                            help="Months of history kept in the table.")
+        parser.add_argument('--archive-dir', default=str(settings.PIPELINE_HISTORY_ARCHIVE_DIR),
+                            help="Directory of the archive files.")
+        parser.add_argument('--months-ahead', type=int, default=1,
+                            help="Future months to create partitions for.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the partitions that would be archived.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        if options['retention_months'] < 1:
+            raise CommandError("--retention-months must be at least 1.")
+
+        def write(event):
+            if not options['json']:
+                self.stdout.write(event['message'])
+
+        with event_sink(write):
+            report = archive_history(options['archive_dir'], options['retention_months'],
+                                     months_ahead=options['months_ahead'], dry_run=options['dry_run'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        elif not report['added'] and not report['archived']:
+            self.stdout.write("Nothing to do.")
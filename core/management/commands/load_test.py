@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.load_testing import REQUEST_MODES, ramp_load
+
+
+class Command(BaseCommand):
+    help = ("Drives /process/ (background jobs) or /process/async/ at increasing concurrency and reports "
+            "throughput, p50/p95/p99 latency and error rates. Run the server under test against stub_llm_server.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the deployment under test.")
+        parser.add_argument('--mode', choices=sorted(REQUEST_MODES), default='job',
+                            help="job: /process/ plus status polling, async: /process/async/.")
+        parser.add_argument('--ramp', default='1,2,4,8,16',
+                            help="Comma-separated concurrency levels, run one after another.")
+        parser.add_argument('--requests-per-client', type=int, default=2,
+                            help="Pipeline runs per concurrent client at each level.")
+        parser.add_argument('--timeout', type=float, default=600, help="Seconds before a run counts as failed.")
+        parser.add_argument('--poll-interval', type=float, default=0.5, help="Seconds between job status polls.")
+        parser.add_argument('--json', dest='json_path', default=None, help="Also write the step summaries here.")
+
+    def handle(self, *args, **options):
+        try:
+            concurrency_levels = [int(level) for level in options['ramp'].split(',') if level.strip()]
+        except ValueError:
+            raise CommandError(f"--ramp must be comma-separated integers, got {options['ramp']!r}.")
+
+        steps = ramp_load(options['url'], concurrency_levels, requests_per_client=options['requests_per_client'],
+                          mode=options['mode'], timeout=options['timeout'], poll_interval=options['poll_interval'],
+                          report=self.stdout.write)
+
+        for step in steps:
+            for error in step['errors']:
+                self.stderr.write(f"concurrency {step['concurrency']}: {error}")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as report:
+                json.dump({'url': options['url'], 'mode': options['mode'], 'steps': steps}, report, indent=2)
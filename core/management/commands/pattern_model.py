@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+
+from core.learned_patterns import PATTERN_MODEL_HISTORY_ROWS, PatternModel, build_vocabulary, load_history
+from core.models import PipelineRun
+from core.pipeline_runs import SCORE_THRESHOLD
+from core.step3_generate_emails_patterns import load_data
+
+
+class Command(BaseCommand):
+    help = ("Fits the learned generator's pattern model to the scoring history and shows it, with the yield of each "
+            "generator in the run ledger (candidates generated per username above the score threshold).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history-rows', type=int, default=PATTERN_MODEL_HISTORY_ROWS,
+                            help="Most recent history rows to fit to.")
+        parser.add_argument('--threshold', type=float, default=SCORE_THRESHOLD,
+                            help="Score separating the high scorers from the low scorers.")
+        parser.add_argument('--json', action='store_true', help="Print the model and yields as JSON.")
+
+    def handle(self, *args, **options):
+        vocabulary = build_vocabulary(*load_data(print_loading_data=False))
+        model = PatternModel.fit(load_history(options['history_rows']), vocabulary, threshold=options['threshold'])
+        if model is None:
+            raise CommandError("No history username splits into the current vocabulary.")
+
+        yields = []
+        runs = (PipelineRun.objects.filter(status='succeeded').values('generator')
+                .annotate(runs=Count('id'), generated=Sum('candidates_generated'), above=Sum('above_threshold'))
+                .order_by('generator'))
+        for row in runs:
+            row['candidates_per_above_threshold'] = row['generated'] / row['above'] if row['above'] else None
+            yields.append(row)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'model': model.to_dict(), 'yields': yields}, indent=2))
+            return
+
+        self.stdout.write(f"Fitted to {model.high_rows} usernames above and {model.low_rows} below "
+                          f"{options['threshold']}.\n\nElement transitions:")
+        for previous, options_ in model.transitions.items():
+            choices = ', '.join(f"{following} {p:.2f}" for following, p in options_.items())
+            self.stdout.write(f"  {previous:>7s} -> {choices}")
+        self.stdout.write("\nSeparator probabilities:")
+        for pair, p in model.separators.items():
+            self.stdout.write(f"  {pair:>15s} {p:.2f}")
+
+        self.stdout.write("\nYield by generator (succeeded runs):")
+        for row in yields:
+            per_above = row['candidates_per_above_threshold']
+            self.stdout.write(f"  {row['generator'] or 'unrecorded':>10s}: {row['runs']} runs, {row['generated']} "
+                              f"generated, {row['above']} above the threshold, "
+                              f"{'-' if per_above is None else f'{per_above:.1f}'} candidates each")
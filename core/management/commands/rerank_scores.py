@@ -0,0 +1,75 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.agent_scores import (AGGREGATION_RULES, aggregate_score_matrix, export_score_matrix,
+                               load_exported_score_matrix, load_score_matrix, rank_scores)
+from core.scoring_agents import load_scoring_agents
+
+
+def parse_weights(value):
+    """'agent=weight,agent=weight' -> {agent: weight}"""
+    weights = {}
+    for item in filter(None, value.split(',')):
+        agent, separator, weight = item.partition('=')
+        if not separator:
+            raise CommandError(f"Expected agent=weight, got {item!r}.")
+        try:
+            weights[agent.strip()] = float(weight)
+        except ValueError:
+            raise CommandError(f"Weight of {agent.strip()!r} is not a number: {weight!r}.")
+    return weights
+
+
+class Command(BaseCommand):
+    help = ("Re-ranks every username in agent_scores under new agent weights or another aggregation rule, "
+            "from the stored raw scores of each agent, without any LLM call.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weights', default='',
+                            help="agent=weight,... overriding the agent registry's weights. Agents disabled or no "
+                                 "longer in the registry weigh 0 unless given here.")
+        parser.add_argument('--rule', choices=AGGREGATION_RULES, default='mean',
+                            help="How the agents' scores of a username are combined.")
+        parser.add_argument('--top', type=int, default=25, help="Usernames shown.")
+        parser.add_argument('--npz', help="Read the score matrix from an exported .npz file instead of the table.")
+        parser.add_argument('--export', help="Save the score matrix read from the table as a .npz file.")
+        parser.add_argument('--json', action='store_true', help="Print the ranking as JSON.")
+
+    def handle(self, *args, **options):
+        if options['npz']:
+            usernames, agents, scores = load_exported_score_matrix(options['npz'])
+        else:
+            usernames, agents, scores = load_score_matrix()
+        if options['export']:
+            export_score_matrix(options['export'], usernames, agents, scores)
+
+        weights = {agent.name: agent.weight for agent in load_scoring_agents()}
+        overrides = parse_weights(options['weights'])
+        unknown = set(overrides) - set(agents)
+        if unknown:
+            raise CommandError(f"No stored scores of {', '.join(sorted(unknown))} (agents: {', '.join(agents)}).")
+        weights.update(overrides)
+        agent_weights = [weights.get(agent, 0.0) for agent in agents]
+
+        started_at = time.perf_counter()
+        ranking = rank_scores(usernames, aggregate_score_matrix(scores, agent_weights, options['rule']))
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'rule': options['rule'],
+                'weights': dict(zip(agents, agent_weights)),
+                'usernames': len(usernames),
+                'ranked': len(ranking),
+                'milliseconds': elapsed_ms,
+                'top': [{'username': usern, 'score': score} for usern, score in ranking[:options['top']]],
+            }, indent=2))
+            return
+
+        self.stdout.write(f"Re-ranked {len(ranking)} of {len(usernames)} usernames ({options['rule']}, "
+                          f"{', '.join(f'{agent}={weight:g}' for agent, weight in zip(agents, agent_weights))}) "
+                          f"in {elapsed_ms:.1f} ms.")
+        for position, (usern, score) in enumerate(ranking[:options['top']], start=1):
+            self.stdout.write(f"  {position:>4d}. {usern:<32s} {score:.3f}")
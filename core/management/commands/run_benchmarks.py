@@ -0,0 +1,48 @@
+import os
+import platform
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import BENCHMARKS, find_regressions, load_history, run_benchmarks, save_history
+
+
+class Command(BaseCommand):
+    help = ("Runs the offline benchmark suite (generation, aggregation, parsing, score tables), records the results "
+            "in the benchmark history and fails when a benchmark regressed beyond the threshold.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), metavar='NAME',
+                            help="Run only this benchmark (repeatable).")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per benchmark, the median is kept.")
+        parser.add_argument('--history', default=getattr(settings, 'PIPELINE_BENCHMARK_HISTORY',
+                                                         os.path.join(settings.BASE_DIR, 'benchmark_history.json')),
+                            help="JSON file the results are appended to and compared against.")
+        parser.add_argument('--threshold', type=float, default=getattr(settings, 'PIPELINE_BENCHMARK_THRESHOLD', 0.2),
+                            help="Allowed slowdown against the recent runs, 0.2 = 20%%.")
+        parser.add_argument('--no-record', action='store_true', help="Compare only, leave the history file as is.")
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(names=options['only'], repeat=options['repeat'], report=self.stdout.write)
+
+        history = load_history(options['history'])
+        regressions = find_regressions(results, history, options['threshold'])
+
+        if not options['no_record']:
+            history.append({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'machine': platform.node(),
+                'results': results,
+            })
+            save_history(options['history'], history)
+
+        if regressions:
+            for name, seconds, baseline in regressions:
+                self.stderr.write(f"Regression: {name} took {seconds * 1000:.2f} ms, "
+                                  f"baseline {baseline * 1000:.2f} ms (+{(seconds / baseline - 1) * 100:.0f}%)")
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed beyond {options['threshold']:.0%}.")
+
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} benchmark(s) within {options['threshold']:.0%} "
+                                             f"of the recent runs."))
@@ -0,0 +1,130 @@
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import pipeline_events, step5_custom_search_engine_API
+from core.pipeline_events import event_sink
+from core.pipeline_profiling import run_profiled
+from core.pipeline_runs import pipeline_run
+from core.views import main_script, process_user_file_and_insert_data, regenerate_original_data
+
+
+class Command(BaseCommand):
+    help = ("Runs pipeline cycles (generate, score, validate, save) headless, without the presentation pauses, "
+            "and prints their statistics as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cycles', type=int, default=1, help="Cycles to run.")
+        parser.add_argument('--parallel', type=int, default=1, help="Cycles running at the same time.")
+        parser.add_argument('--raw', type=int, default=50, help="Usernames generated and scored per cycle.")
+        parser.add_argument('--sorted', type=int, default=None,
+                            help="Top usernames stored per cycle, a seventh of --raw by default.")
+        parser.add_argument('--review', type=int, default=10, help="Top scoring usernames shown per cycle.")
+        parser.add_argument('--validate', type=int, default=10,
+                            help="Stored usernames searched for on the web per cycle.")
+        parser.add_argument('--top', type=int, default=10, help="Final table rows returned per cycle.")
+        parser.add_argument('--exact-match', action='store_true',
+                            help="Only count exact search engine matches as web presence.")
+        parser.add_argument('--no-web-search', action='store_true',
+                            help="Skip the Google lookups, like WEB_SEARCH_ENABLED=0.")
+        parser.add_argument('--regenerate', action='store_true',
+                            help="Regenerate the original dataset before the first cycle.")
+        parser.add_argument('--upload', action='store_true',
+                            help="Load 'User Upload/Names_and_words.txt' before the first cycle.")
+        parser.add_argument('--overwrite', action='store_true',
+                            help="With --upload, replace the existing words and names instead of adding to them.")
+        parser.add_argument('--pacing', action='store_true',
+                            help="Keep the presentation pauses between pipeline messages.")
+        parser.add_argument('--quiet', action='store_true',
+                            help="Drop the pipeline output instead of writing it to stderr.")
+        parser.add_argument('--results', action='store_true',
+                            help="Include each cycle's validated usernames and final table in the JSON.")
+        parser.add_argument('--profile', action='store_true',
+                            help="Run under cProfile and tracemalloc and save the profile to PIPELINE_PROFILE_DIR.")
+        parser.add_argument('--resume', metavar='RUN_ID',
+                            help="Resume a failed run from its checkpoints instead of starting a new one.")
+
+    def handle(self, *args, **options):
+        if options['cycles'] < 1 or options['parallel'] < 1:
+            raise CommandError("--cycles and --parallel must be at least 1.")
+        if options['resume'] and options['cycles'] != 1:
+            raise CommandError("--resume resumes one run, it cannot be combined with --cycles.")
+
+        # The command's process runs nothing else, the process-wide switches are its own to set
+        pipeline_events.PIPELINE_PACING = options['pacing']
+        if options['no_web_search']:
+            step5_custom_search_engine_API.WEB_SEARCH_ENABLED = False
+
+        # Dataset changes happen once, before any cycle reads the vocabulary
+        with event_sink(self.pipeline_output('setup', options['quiet'])):
+            if options['regenerate']:
+                regenerate_original_data(3, 5)
+            if options['upload']:
+                process_user_file_and_insert_data(overwrite=options['overwrite'])
+
+        if options['profile']:
+            report, profile_name = run_profiled('command', self.run_cycles, options)
+            report['profile'] = profile_name
+        else:
+            report = self.run_cycles(options)
+
+        self.stdout.write(json.dumps(report, indent=2, default=str))
+        if report['failed']:
+            raise CommandError(f"{report['failed']} of {report['cycles']} cycles failed.")
+
+    @staticmethod
+    def pipeline_output(cycle, quiet):
+        """Event sink of one cycle: stdout carries only the JSON report, the pipeline output goes to stderr."""
+        def write(event):
+            if not quiet:
+                sys.stderr.write(f"[{cycle}] {event['message']}\n")
+        return write
+
+    def run_cycle(self, cycle, options):
+        cycle_options = {
+            'no_of_raw_generated_usernames': options['raw'],
+            'no_of_sorted': options['sorted'],
+            'limit_ai_high_scoring_records': options['review'],
+            'no_of_validated_records': options['validate'],
+            'fetch_top_production_records': options['top'],
+            'exact_search_engine_match': options['exact_match'],
+        }
+        result = None
+        with event_sink(self.pipeline_output(cycle, options['quiet'])):
+            try:
+                # main_script's own run scope joins this one, whose statistics are reported
+                with pipeline_run(mode='command', run_id=options['resume']) as run:
+                    result = main_script(**cycle_options)
+            except Exception:
+                # Recorded as failed in the run and its ledger row, the other cycles go on
+                pass
+
+        stats = {'cycle': cycle, **run.as_dict()}
+        if options['results'] and result is not None:
+            stats['result'] = result
+        return stats
+
+    def run_cycles(self, options):
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['parallel']) as executor:
+            runs = list(executor.map(lambda cycle: self.run_cycle(cycle, options), range(1, options['cycles'] + 1)))
+        wall_seconds = time.perf_counter() - started_at
+
+        succeeded = [run for run in runs if run['status'] == 'succeeded']
+        return {
+            'cycles': options['cycles'],
+            'parallel': options['parallel'],
+            'succeeded': len(succeeded),
+            'failed': len(runs) - len(succeeded),
+            'wall_seconds': wall_seconds,
+            'cycles_per_minute': len(succeeded) * 60 / wall_seconds if wall_seconds > 0 else None,
+            'candidates_generated': sum(run['candidates_generated'] for run in runs),
+            'above_threshold': sum(run['above_threshold'] for run in runs),
+            'validated': sum(run['validated'] for run in runs),
+            'llm_requests': sum(run['llm_requests'] for run in runs),
+            'cost_usd': round(sum(run['cost_usd'] for run in runs), 6),
+            'runs': runs,
+        }
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from core.load_testing import StubChatCompletionsServer, stub_pipeline_environment
+
+
+class Command(BaseCommand):
+    help = ("Serves a stub of the OpenAI chat-completions API for offline load tests, "
+            "and prints the environment that points the pipeline at it.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8099)
+        parser.add_argument('--latency', type=float, default=0.5, help="Mean response time in seconds.")
+        parser.add_argument('--jitter', type=float, default=0.1, help="Standard deviation of the response time.")
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help="Share of calls failing with 429 (Retry-After) or 500, 0.05 = 5%%.")
+        parser.add_argument('--truncate-tokens', type=int, default=None,
+                            help="Cut answers beyond this many tokens (finish_reason 'length').")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        server = StubChatCompletionsServer((options['host'], options['port']), latency=options['latency'],
+                                           jitter=options['jitter'], error_rate=options['error_rate'],
+                                           truncate_tokens=options['truncate_tokens'], seed=options['seed'])
+
+        self.stdout.write(f"Stub chat-completions API listening on {server.url}/v1/chat/completions")
+        self.stdout.write("Start the web process under test with:")
+        for name, value in stub_pipeline_environment(server.url).items():
+            self.stdout.write(f"  export {name}={value}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stub served {server.counters['requests']} calls, {server.counters['errors']} failed, "
+                              f"{server.counters['truncated']} truncated.")
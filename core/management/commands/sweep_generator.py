@@ -0,0 +1,96 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.generator_sweep import (PROXY_SOURCES, ProxyScorer, grid_configurations, load_proxy_rows,
+                                  random_configurations, run_sweep)
+from core.learned_patterns import PATTERN_MODEL_HISTORY_ROWS, build_vocabulary
+from core.pipeline_runs import SCORE_THRESHOLD
+from core.step3_generate_emails_patterns import DEFAULT_GENERATOR_PARAMS, load_data
+
+
+def parse_grid(specs):
+    """['name=v1,v2', 'weights=0.4:0.35:0.25,0.5:0.3:0.2'] -> {name: [v1, v2], weights: [[...], [...]]}"""
+    grid = {}
+    for spec in specs:
+        name, separator, values = spec.partition('=')
+        if not separator or name not in DEFAULT_GENERATOR_PARAMS:
+            raise CommandError(f"Expected parameter=value,value with one of {', '.join(DEFAULT_GENERATOR_PARAMS)}, "
+                               f"got {spec!r}.")
+        try:
+            if isinstance(DEFAULT_GENERATOR_PARAMS[name], list):
+                grid[name] = [[float(weight) for weight in value.split(':')] for value in values.split(',')]
+            else:
+                grid[name] = [float(value) for value in values.split(',')]
+        except ValueError:
+            raise CommandError(f"Values of {name} are not numbers: {values!r}.")
+    return grid
+
+
+class Command(BaseCommand):
+    help = ("Sweeps the fixed generator's probabilities (grid or random search) in a process pool, scores each "
+            "configuration's usernames with an offline proxy fitted to the stored scores and ranks the "
+            "configurations by expected yield above the score threshold, without any LLM call.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grid', action='append', default=[], metavar='PARAM=V1,V2',
+                            help="Values of one parameter, weight lists separated by ':' (repeatable).")
+        parser.add_argument('--random', type=int, default=None,
+                            help="Random configurations to try, 20 when no --grid is given.")
+        parser.add_argument('--samples', type=int, default=5000, help="Usernames generated per configuration.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random search and the generation.")
+        parser.add_argument('--source', choices=PROXY_SOURCES, default='agent-scores',
+                            help="Scores the proxy is fitted to.")
+        parser.add_argument('--history-rows', type=int, default=PATTERN_MODEL_HISTORY_ROWS,
+                            help="Most recent history rows read with --source history.")
+        parser.add_argument('--threshold', type=float, default=SCORE_THRESHOLD,
+                            help="Score counted as a high score.")
+        parser.add_argument('--top', type=int, default=10, help="Configurations shown.")
+        parser.add_argument('--save-best', metavar='PATH',
+                            help="Write the best configuration's parameters to PATH, for EMAIL_GENERATOR_PARAMS.")
+        parser.add_argument('--json', action='store_true', help="Print every result as JSON.")
+
+    def handle(self, *args, **options):
+        if options['samples'] < 1 or options['workers'] < 1:
+            raise CommandError("--samples and --workers must be at least 1.")
+        try:
+            configurations = grid_configurations(parse_grid(options['grid'])) if options['grid'] else []
+        except ValueError as e:
+            raise CommandError(str(e))
+        random_count = options['random'] if options['random'] is not None else (0 if options['grid'] else 20)
+        configurations += random_configurations(random_count, options['seed'])
+
+        vocabulary_data = load_data(print_loading_data=False)
+        vocabulary = build_vocabulary(*vocabulary_data)
+        rows = load_proxy_rows(options['source'], options['history_rows'])
+        proxy = ProxyScorer.fit(rows, vocabulary, threshold=options['threshold'])
+        if not proxy.known:
+            raise CommandError(f"No scored usernames in {options['source']} to fit the proxy to.")
+
+        started_at = time.perf_counter()
+        results = run_sweep(configurations, vocabulary_data, proxy, samples=options['samples'],
+                            workers=options['workers'], seed=options['seed'])
+        wall_seconds = time.perf_counter() - started_at
+
+        if options['save_best']:
+            with open(options['save_best'], 'w', encoding='utf-8') as file:
+                json.dump(results[0]['params'], file, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'proxy_rows': len(proxy.known), 'base_rate': proxy.base_rate,
+                                          'wall_seconds': wall_seconds, 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f"{len(results)} configurations x {options['samples']} usernames in {wall_seconds:.1f}s, "
+                          f"proxy fitted to {len(proxy.known)} scored usernames "
+                          f"({proxy.base_rate:.1%} above {options['threshold']}).\n")
+        self.stdout.write(f"{'rank':>4s}  {'effective':>9s}  {'expected':>8s}  {'unique':>6s}  {'novel':>6s}  changes")
+        for rank, result in enumerate(results[:options['top']], start=1):
+            changes = 'defaults' if result.get('baseline') else json.dumps(result['changed'])
+            self.stdout.write(f"{rank:>4d}  {result['effective_yield']:>9.4f}  {result['expected_yield']:>8.4f}  "
+                              f"{result['unique_fraction']:>6.1%}  {result['novel_fraction']:>6.1%}  {changes}")
+        baseline_rank = next(rank for rank, result in enumerate(results, start=1) if result.get('baseline'))
+        self.stdout.write(f"\nThe current defaults rank {baseline_rank} of {len(results)}.")
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(max_length=32, unique=True)),
+                ('mode', models.CharField(max_length=16)),
+                ('status', models.CharField(max_length=16)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('wall_seconds', models.FloatField(blank=True, null=True)),
+                ('candidates_generated', models.IntegerField(default=0)),
+                ('candidates_scored', models.IntegerField(default=0)),
+                ('cache_hits', models.IntegerField(default=0)),
+                ('llm_requests', models.IntegerField(default=0)),
+                ('llm_failures', models.IntegerField(default=0)),
+                ('prompt_tokens', models.BigIntegerField(default=0)),
+                ('completion_tokens', models.BigIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('accepted', models.IntegerField(default=0)),
+                ('above_threshold', models.IntegerField(default=0)),
+                ('score_threshold', models.DecimalField(decimal_places=2, max_digits=4)),
+                ('validated', models.IntegerField(default=0)),
+                ('agent_stats', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'pipeline_runs',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_pipelinerun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipelinerun',
+            name='generator',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-19 12:00
+
+from datetime import date
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+HISTORY_TABLE = 'high_rated_unames_history'
+
+
+def partition_history(apps, schema_editor):
+    # MariaDB only: the partitioning key has to be part of the primary key
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    # The current and the next month, then the catch-all partition; archive_history adds the months after them
+    today = date.today()
+    months = [date(today.year + (today.month + n - 1) // 12, (today.month + n - 1) % 12 + 1, 1) for n in range(3)]
+    definitions = [f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{next_month:%Y-%m-%d}')"
+                   for month, next_month in zip(months, months[1:])]
+    definitions.append("PARTITION pfuture VALUES LESS THAN (MAXVALUE)")
+    schema_editor.execute(f"ALTER TABLE `{HISTORY_TABLE}` DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)")
+    schema_editor.execute(f"ALTER TABLE `{HISTORY_TABLE}` PARTITION BY RANGE COLUMNS (created_at) "
+                          f"({', '.join(definitions)})")
+
+
+def unpartition_history(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute(f"ALTER TABLE `{HISTORY_TABLE}` REMOVE PARTITIONING")
+    schema_editor.execute(f"ALTER TABLE `{HISTORY_TABLE}` DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_pipelinerun_generator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='highratedunameshistory',
+            name='created_at',
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now()),
+        ),
+        migrations.AddIndex(
+            model_name='highratedunameshistory',
+            index=models.Index(fields=['username'], name='history_username'),
+        ),
+        migrations.AddIndex(
+            model_name='highratedunameshistory',
+            index=models.Index(fields=['created_at'], name='history_created_at'),
+        ),
+        migrations.RunPython(partition_history, unpartition_history),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2026-10-19 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def merge_duplicate_usernames(apps, schema_editor):
+    # One row per username before the unique key: the first row keeps the best score and counts every copy
+    HighRatedUnames = apps.get_model('core', 'HighRatedUnames')
+    duplicates = (HighRatedUnames.objects.values('username')
+                  .annotate(copies=Count('id'), best_score=Max('score')).filter(copies__gt=1))
+    for duplicate in duplicates.iterator():
+        rows = HighRatedUnames.objects.filter(username=duplicate['username']).order_by('id')
+        kept = rows.first()
+        rows.exclude(id=kept.id).delete()
+        rows.filter(id=kept.id).update(score=duplicate['best_score'], hit_count=duplicate['copies'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_history_created_at_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='highratedunames',
+            name='hit_count',
+            field=models.IntegerField(db_default=1),
+        ),
+        migrations.RunPython(merge_duplicate_usernames, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='highratedunames',
+            name='username',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_highratedunames_unique_username'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='highratedunameshistory',
+            index=models.Index(fields=['score', 'id', 'created_at'], name='history_score'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Now
 
 
 # Model for 'common_numbers' table
@@ -29,8 +30,10 @@ class HighProbabilityRealUsernames(models.Model):
 
 # Model for 'high_rated_unames' table
 class HighRatedUnames(models.Model):
-    username = models.CharField(max_length=255)
+    username = models.CharField(max_length=255, unique=True)
+    # Best score over the cycles that ranked the username, and how many did
     score = models.DecimalField(max_digits=5, decimal_places=2)
+    hit_count = models.IntegerField(db_default=1)
 
     class Meta:
         db_table = 'high_rated_unames'
@@ -40,9 +43,17 @@ class HighRatedUnames(models.Model):
 class HighRatedUnamesHistory(models.Model):
     username = models.CharField(max_length=255)
     score = models.DecimalField(max_digits=5, decimal_places=2)
+    # Filled by the database, the history is partitioned by month of created_at (see migration 0004)
+    created_at = models.DateTimeField(db_default=Now())
 
     class Meta:
         db_table = 'high_rated_unames_history'
+        indexes = [
+            models.Index(fields=['username'], name='history_username'),
+            models.Index(fields=['created_at'], name='history_created_at'),
+            # Keyset pages of the results API (core/results_api.py)
+            models.Index(fields=['score', 'id', 'created_at'], name='history_score'),
+        ]
 
 
 # Model for 'names' table
@@ -61,3 +72,48 @@ class Words(models.Model):
 
     class Meta:
         db_table = 'words'
+
+
+# Model for 'pipeline_runs' table, one row per pipeline run (core/pipeline_runs.py)
+class PipelineRun(models.Model):
+    run_id = models.CharField(max_length=32, unique=True)
+    mode = models.CharField(max_length=16)
+    status = models.CharField(max_length=16)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    wall_seconds = models.FloatField(null=True, blank=True)
+    candidates_generated = models.IntegerField(default=0)
+    candidates_scored = models.IntegerField(default=0)
+    cache_hits = models.IntegerField(default=0)
+    llm_requests = models.IntegerField(default=0)
+    llm_failures = models.IntegerField(default=0)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    accepted = models.IntegerField(default=0)
+    above_threshold = models.IntegerField(default=0)
+    score_threshold = models.DecimalField(max_digits=4, decimal_places=2)
+    validated = models.IntegerField(default=0)
+    agent_stats = models.JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    generator = models.CharField(max_length=16, null=True, blank=True)
+
+    class Meta:
+        db_table = 'pipeline_runs'
+        ordering = ['-started_at']
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost_per_accepted(self):
+        return self.cost_usd / self.accepted if self.accepted else None
+
+    @property
+    def accepted_per_second(self):
+        return self.accepted / self.wall_seconds if self.wall_seconds else None
+
+    @property
+    def candidates_per_above_threshold(self):
+        return self.candidates_generated / self.above_threshold if self.above_threshold else None
@@ -0,0 +1,129 @@
+# ###################################### ###################################### #
+# Pipeline Checkpoints
+#
+# Intermediate results of a run are persisted under its run id in pipeline_checkpoints, so a run that failed
+# or was killed can be resumed (main_script(run_id=...), manage.py run_pipeline --resume RUN_ID) and only
+# redoes the unfinished work:
+# - 'generated': the usernames generated for the cycle
+# - 'agent_batch': one agent's parsed scores for one batch, keyed by agent and a hash of the batch's usernames;
+#   batches are cut before the score cache is looked at, so every process cuts the same ones
+# - 'aggregated': the ranked top-K usernames about to be stored
+# - 'stored': marker written once the top-K usernames are in high_rated_unames
+#
+# Checkpoints of a run that succeeded are deleted with it finishing (see pipeline_runs.pipeline_run).
+# ###################################### ###################################### #
+
+import hashlib
+import json
+
+from .pipeline_events import emit
+from .step2_MariaDB_database_engine import async_ensure_table, connect_to_database, ensure_table
+
+CREATE_CHECKPOINTS_QUERY = '''
+CREATE TABLE IF NOT EXISTS pipeline_checkpoints (
+    run_id VARCHAR(32) NOT NULL,
+    stage VARCHAR(32) NOT NULL,
+    checkpoint_key VARCHAR(128) NOT NULL DEFAULT '',
+    payload LONGTEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, stage, checkpoint_key)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
+'''
+
+SAVE_CHECKPOINT_QUERY = '''
+INSERT INTO pipeline_checkpoints (run_id, stage, checkpoint_key, payload) VALUES (%s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE payload = VALUES(payload), created_at = CURRENT_TIMESTAMP
+'''
+
+LOAD_CHECKPOINT_QUERY = '''
+SELECT payload FROM pipeline_checkpoints WHERE run_id = %s AND stage = %s AND checkpoint_key = %s
+'''
+
+CLEAR_CHECKPOINTS_QUERY = '''
+DELETE FROM pipeline_checkpoints WHERE run_id = %s
+'''
+
+
+def batch_checkpoint_key(agent, batch):
+    """Key of one agent batch: the same agent (name, model, prompts) scoring the same usernames."""
+    digest = hashlib.sha1()
+    for part in (agent.name, agent.model, agent.system_prompt, agent.user_prompt.template, *batch):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return f"{agent.name[:64]}:{digest.hexdigest()}"
+
+
+def execute_checkpoint_query(query, params, fetch=False):
+    conn = connect_to_database()
+    cursor = conn.cursor()
+    try:
+        ensure_table(cursor, 'pipeline_checkpoints', CREATE_CHECKPOINTS_QUERY)
+        cursor.execute(query, params)
+        row = cursor.fetchone() if fetch else None
+        conn.commit()
+        return row
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def save_checkpoint(run_id, stage, payload, key=''):
+    # A checkpoint that cannot be written only costs the work on a resume, it must not fail the run
+    try:
+        execute_checkpoint_query(SAVE_CHECKPOINT_QUERY, (run_id, stage, key, json.dumps(payload)))
+    except Exception as e:
+        emit(f"Could not save the {stage} checkpoint: {e}")
+
+
+def load_checkpoint(run_id, stage, key=''):
+    """The checkpoint's payload, None when there is none (or it cannot be read)."""
+    try:
+        row = execute_checkpoint_query(LOAD_CHECKPOINT_QUERY, (run_id, stage, key), fetch=True)
+    except Exception as e:
+        emit(f"Could not load the {stage} checkpoint: {e}")
+        return None
+    return json.loads(row[0]) if row else None
+
+
+def clear_checkpoints(run_id):
+    try:
+        execute_checkpoint_query(CLEAR_CHECKPOINTS_QUERY, (run_id,))
+    except Exception as e:
+        emit(f"Could not clear the checkpoints of run {run_id}: {e}")
+
+
+# ###################################### #
+# asyncio counterparts, on the async pipeline's aiomysql pool
+# ###################################### #
+
+async def async_execute_checkpoint_query(pool, query, params, fetch=False):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await async_ensure_table(cursor, 'pipeline_checkpoints', CREATE_CHECKPOINTS_QUERY)
+            await cursor.execute(query, params)
+            row = await cursor.fetchone() if fetch else None
+        await conn.commit()
+    return row
+
+
+async def async_save_checkpoint(pool, run_id, stage, payload, key=''):
+    try:
+        await async_execute_checkpoint_query(pool, SAVE_CHECKPOINT_QUERY, (run_id, stage, key, json.dumps(payload)))
+    except Exception as e:
+        emit(f"Could not save the {stage} checkpoint: {e}")
+
+
+async def async_load_checkpoint(pool, run_id, stage, key=''):
+    try:
+        row = await async_execute_checkpoint_query(pool, LOAD_CHECKPOINT_QUERY, (run_id, stage, key), fetch=True)
+    except Exception as e:
+        emit(f"Could not load the {stage} checkpoint: {e}")
+        return None
+    return json.loads(row[0]) if row else None
+
+
+async def async_clear_checkpoints(pool, run_id):
+    try:
+        await async_execute_checkpoint_query(pool, CLEAR_CHECKPOINTS_QUERY, (run_id,))
+    except Exception as e:
+        emit(f"Could not clear the checkpoints of run {run_id}: {e}")
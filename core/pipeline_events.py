@@ -0,0 +1,81 @@
+# ###################################### ###################################### #
+# Pipeline Events
+#
+# The step modules report what they are doing through emit() instead of print().
+# Where the events go is scoped per pipeline run with contextvars: a web request or background job
+# installs its own sink with event_sink(), so concurrent runs sharing one worker process (threads or
+# event-loop tasks) never see each other's output. Without a sink, events are printed to stdout
+# as before, which keeps the console scripts unchanged.
+#
+# The pauses between console messages go through pace() / async_pace(), so their share of a run is measured,
+# and PIPELINE_PACING=0 turns them off for headless runs.
+# ###################################### ###################################### #
+
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from .pipeline_metrics import count
+
+# Presentation pauses between pipeline messages, off for headless and load-test runs
+PIPELINE_PACING = os.getenv('PIPELINE_PACING', '1') != '0'
+
+current_event_sink = contextvars.ContextVar('pipeline_event_sink', default=None)
+
+
+def emit(*values, sep=' ', **fields):
+    """
+    Reports one pipeline event. Called like print(); extra keyword fields (stage, counts, ...)
+    travel with the event to the sink.
+    """
+    message = sep.join(str(value) for value in values)
+    sink = current_event_sink.get()
+    if sink is None:
+        print(message)
+        return
+
+    event = {'message': message, 'time': time.time()}
+    event.update(fields)
+    sink(event)
+
+
+@contextmanager
+def event_sink(sink):
+    """Routes the events emitted inside the block (in this context only) to sink(event)."""
+    token = current_event_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        current_event_sink.reset(token)
+
+
+def bind_context(function):
+    """
+    Wraps function to run in a copy of the caller's context, so work handed to a thread pool
+    still reports to the caller's sink (executor threads do not inherit contextvars on their own).
+    """
+    context = contextvars.copy_context()
+
+    def run_in_context(*args, **kwargs):
+        # A context can only be entered by one thread at a time, every call gets its own copy
+        return context.copy().run(function, *args, **kwargs)
+
+    return run_in_context
+
+
+def pace(seconds):
+    """Presentation pause between pipeline messages, counted in pipeline_pacing_seconds_total."""
+    if not PIPELINE_PACING:
+        return
+    count('pipeline_pacing_seconds_total', seconds)
+    time.sleep(seconds)
+
+
+async def async_pace(seconds):
+    """asyncio counterpart of pace()."""
+    if not PIPELINE_PACING:
+        return
+    count('pipeline_pacing_seconds_total', seconds)
+    await asyncio.sleep(seconds)
@@ -0,0 +1,213 @@
+# ###################################### ###################################### #
+# Background Pipeline Jobs
+#
+# /process/ no longer runs the pipeline inside the request thread. It enqueues a job on a bounded,
+# in-process worker pool and returns its id right away; the status endpoint reports the job's
+# stage, progress, output and results while it runs, and the events endpoint pushes the same
+# as server-sent events the moment they happen.
+#
+# Jobs live in the memory of the process that accepted them, so status polling must reach the same
+# process (single process with threads, or sticky routing in front of several processes).
+# ###################################### ###################################### #
+
+import json
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .pipeline_events import event_sink
+from .pipeline_metrics import count, register_gauge
+
+# Pipeline runs executed at the same time, each one reports to its own event sink
+PIPELINE_JOB_WORKERS = getattr(settings, 'PIPELINE_JOB_WORKERS', 4)
+# Finished jobs kept for status polling, the oldest ones are forgotten first
+PIPELINE_JOB_HISTORY = getattr(settings, 'PIPELINE_JOB_HISTORY', 100)
+# Output lines kept per job, streaming clients read them as they come so older lines can be dropped
+PIPELINE_JOB_OUTPUT_LINES = getattr(settings, 'PIPELINE_JOB_OUTPUT_LINES', 1000)
+
+
+class PipelineJob:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.progress = 0.0
+        # Only the latest lines are kept, output_total counts every line ever printed
+        self.output = deque(maxlen=PIPELINE_JOB_OUTPUT_LINES)
+        self.output_total = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+        # Notified on every change, so streaming clients wake up instead of polling
+        self.changed = threading.Condition(self.lock)
+
+    @property
+    def finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def set_stage(self, stage, progress):
+        """Progress callback handed to the pipeline, progress goes from 0.0 to 1.0."""
+        with self.changed:
+            self.stage = stage
+            self.progress = progress
+            self.changed.notify_all()
+
+    def append_output(self, line):
+        with self.changed:
+            self.output.append(line)
+            self.output_total += 1
+            self.changed.notify_all()
+
+    def record_event(self, event):
+        """Event sink of the job's pipeline run, multi-line messages become several output lines."""
+        for line in event['message'].split('\n'):
+            self.append_output(line)
+
+    def _output_since(self, output_offset):
+        # Lines already dropped from the buffer are skipped
+        first_kept = self.output_total - len(self.output)
+        return list(self.output)[max(0, output_offset - first_kept):]
+
+    def wait_for_update(self, output_offset, state, timeout):
+        """
+        Blocks until there is output past output_offset, the (stage, progress, status) state differs from
+        the given one, or the timeout expires. Returns (new lines, new offset, current state).
+        """
+        with self.changed:
+            self.changed.wait_for(
+                lambda: self.output_total > output_offset or (self.stage, self.progress, self.status) != state,
+                timeout=timeout
+            )
+            return (self._output_since(output_offset), self.output_total,
+                    (self.stage, self.progress, self.status))
+
+    def to_dict(self, output_offset=0):
+        """Job status for the status endpoint, output lines before output_offset are left out."""
+        with self.lock:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'stage': self.stage,
+                'progress': round(self.progress, 3),
+                'output': self._output_since(output_offset),
+                'output_offset': output_offset,
+                'output_total': self.output_total,
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+jobs = OrderedDict()
+jobs_lock = threading.Lock()
+executor = ThreadPoolExecutor(max_workers=PIPELINE_JOB_WORKERS, thread_name_prefix='pipeline-job')
+
+
+def run_job(job, function, args, kwargs):
+    with job.changed:
+        job.status = 'running'
+        job.stage = 'starting'
+        job.started_at = time.time()
+        job.changed.notify_all()
+
+    try:
+        with event_sink(job.record_event):
+            result = function(*args, progress=job.set_stage, **kwargs)
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        count('pipeline_runs_total', status='failed', mode='job')
+        with job.changed:
+            job.finished_at = time.time()
+            job.status = 'failed'
+            job.error = f"{type(e).__name__}: {e}"
+            job.changed.notify_all()
+    else:
+        count('pipeline_runs_total', status='succeeded', mode='job')
+        with job.changed:
+            job.finished_at = time.time()
+            job.status = 'succeeded'
+            job.stage = 'done'
+            job.progress = 1.0
+            job.result = result
+            job.changed.notify_all()
+
+
+def submit_job(function, *args, **kwargs):
+    """Queues function(*args, progress=callback, **kwargs) on the worker pool and returns its PipelineJob."""
+    job = PipelineJob()
+    with jobs_lock:
+        jobs[job.id] = job
+        # Forget the oldest finished jobs beyond the history limit
+        finished = [job_id for job_id, old_job in jobs.items() if old_job.finished_at is not None]
+        for job_id in finished[:max(0, len(jobs) - PIPELINE_JOB_HISTORY)]:
+            del jobs[job_id]
+
+    executor.submit(run_job, job, function, args, kwargs)
+    return job
+
+
+def job_status_counts():
+    with jobs_lock:
+        statuses = [job.status for job in jobs.values()]
+    return {(('status', status),): statuses.count(status) for status in ('queued', 'running', 'succeeded', 'failed')}
+
+
+register_gauge('pipeline_jobs', 'Pipeline jobs known to this process, by status.', job_status_counts)
+
+
+def get_job(job_id):
+    with jobs_lock:
+        return jobs.get(job_id)
+
+
+def server_sent_event(event, data, event_id=None):
+    id_field = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{id_field}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def output_events(lines, output_offset):
+    """'output' events of the lines read up to output_offset, each one's id is the offset right after it."""
+    first_offset = output_offset - len(lines)
+    for number, line in enumerate(lines, start=1):
+        yield server_sent_event('output', line, first_offset + number)
+
+
+def job_event_stream(job, heartbeat=15, output_offset=0):
+    """
+    Server-sent events for one job: 'stage' on every stage/progress change, 'output' for every printed line,
+    and a final 'done' (or 'failed') carrying the results. Comments are sent as keep-alives while nothing happens.
+    Output events carry their offset as id, a reconnecting EventSource sends it back as Last-Event-ID and
+    the stream resumes at output_offset instead of replaying the whole output.
+    """
+    state = None
+    while True:
+        lines, output_offset, new_state = job.wait_for_update(output_offset, state, timeout=heartbeat)
+
+        state_changed = new_state != state
+        if state_changed:
+            state = new_state
+            yield server_sent_event('stage', {'stage': state[0], 'progress': round(state[1], 3), 'status': state[2]})
+        yield from output_events(lines, output_offset)
+        if not lines and not state_changed:
+            yield ": keep-alive\n\n"
+
+        if job.finished:
+            # Output printed right before finishing is read before closing the stream
+            lines, output_offset, state = job.wait_for_update(output_offset, state, timeout=0)
+            yield from output_events(lines, output_offset)
+            if job.status == 'failed':
+                yield server_sent_event('failed', {'error': job.error})
+            else:
+                yield server_sent_event('done', job.result)
+            return
@@ -0,0 +1,168 @@
+# ###################################### ###################################### #
+# Pipeline Metrics
+#
+# Lightweight, dependency-free counters and latency histograms for every stage of the pipeline,
+# exported in the Prometheus text format by the /metrics endpoint.
+#
+# - span(stage) times a block into pipeline_stage_duration_seconds{stage=...}
+# - count(name, amount, **labels) bumps one of the counters declared below
+# - observe(name, seconds, **labels) records a latency into one of the histograms declared below
+# - timed_view(view) records a Django view's wall time (sync or async views)
+#
+# Values live in the memory of the process that recorded them, each web or worker process exports its own.
+# ###################################### ###################################### #
+
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label_value(value)}"' for key, value in labels) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{format_labels(key)} {series[-1]}")
+        return lines
+
+
+COUNTERS = {counter.name: counter for counter in [
+    Counter('pipeline_candidates_generated_total', 'Usernames generated by the pattern generator.'),
+    Counter('pipeline_candidates_blocked_total', 'Generated usernames dropped by the blocklist before scoring.'),
+    Counter('pipeline_candidates_scored_total', 'Usernames sent to a scoring agent, by agent.'),
+    Counter('pipeline_llm_tokens_total', 'Tokens reported by the LLM usage fields, by agent and kind.'),
+    Counter('pipeline_score_cache_hits_total', 'Agent scores served from the score cache, by agent.'),
+    Counter('pipeline_score_cache_misses_total', 'Agent scores not found in the score cache, by agent.'),
+    Counter('pipeline_db_rows_written_total', 'Rows written to the database, by table.'),
+    Counter('pipeline_pacing_seconds_total', 'Seconds spent in presentation pacing sleeps.'),
+    Counter('pipeline_runs_total', 'Pipeline runs, by outcome.'),
+    Counter('pipeline_vocabulary_reloads_total', 'Vocabulary tables reloaded after a version change, by table.'),
+    Counter('pipeline_language_checks_total', 'Corpus words run through LangDetect by a vocabulary build.'),
+    Counter('pipeline_results_cache_total', 'Results API pages served from the cache or the database, by result.'),
+]}
+
+HISTOGRAMS = {histogram.name: histogram for histogram in [
+    Histogram('pipeline_stage_duration_seconds', 'Wall time of each pipeline stage.'),
+    Histogram('pipeline_llm_request_duration_seconds', 'Latency of single LLM requests (retries included), by agent.'),
+    Histogram('pipeline_view_duration_seconds', 'Wall time of the Django views, by view.'),
+]}
+
+# Gauges read at export time: name -> (documentation, function returning {labels tuple: value})
+GAUGE_COLLECTORS = {}
+
+
+def count(name, amount=1, **labels):
+    COUNTERS[name].inc(amount, **labels)
+
+
+def observe(name, seconds, **labels):
+    HISTOGRAMS[name].observe(seconds, **labels)
+
+
+@contextmanager
+def span(stage, **labels):
+    """Times the block into pipeline_stage_duration_seconds, exceptions included."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('pipeline_stage_duration_seconds', time.perf_counter() - start_time, stage=stage, **labels)
+
+
+def timed_view(view):
+    """Records the view's wall time into pipeline_view_duration_seconds{view=...}."""
+    name = view.__name__
+
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def timed_async_view(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                observe('pipeline_view_duration_seconds', time.perf_counter() - start_time, view=name)
+        return timed_async_view
+
+    @functools.wraps(view)
+    def timed_sync_view(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            observe('pipeline_view_duration_seconds', time.perf_counter() - start_time, view=name)
+    return timed_sync_view
+
+
+def register_gauge(name, documentation, collect):
+    """collect() returns {labels tuple: value}, called every time the metrics are exported."""
+    GAUGE_COLLECTORS[name] = (documentation, collect)
+
+
+def render_prometheus():
+    lines = []
+    for counter in COUNTERS.values():
+        lines.extend(counter.render())
+    for histogram in HISTOGRAMS.values():
+        lines.extend(histogram.render())
+    for name, (documentation, collect) in GAUGE_COLLECTORS.items():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in sorted(collect().items()):
+            lines.append(f"{name}{format_labels(key)} {value}")
+    return '\n'.join(lines) + '\n'
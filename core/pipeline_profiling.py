@@ -0,0 +1,141 @@
+# ###################################### ###################################### #
+# On-Demand Pipeline Profiling
+#
+# A slow cycle can be profiled without touching the code: staff add ?profile=1 (or the X-Pipeline-Profile: 1
+# header) to /process/, or run `manage.py run_pipeline --profile`. The run is then wrapped in cProfile and
+# tracemalloc, and two files land in PIPELINE_PROFILE_DIR:
+# - <profile>.prof, the raw cProfile stats (pstats, snakeviz, ...)
+# - <profile>.txt, the top functions by cumulative time followed by the top allocation sites
+# Staff download them from /profiles/ afterwards.
+#
+# Unprofiled runs never enter this module, so profiling costs nothing while it is off.
+# cProfile only sees the thread that runs the pipeline (agent batches run on the batch executor's threads
+# and show up as time waiting on them), tracemalloc sees every thread of the process.
+# ###################################### ###################################### #
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+
+from .pipeline_events import emit
+
+# Where profiles are written and served from
+PIPELINE_PROFILE_DIR = getattr(settings, 'PIPELINE_PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+# Functions and allocation sites listed in the text report
+PIPELINE_PROFILE_TOP_ENTRIES = getattr(settings, 'PIPELINE_PROFILE_TOP_ENTRIES', 40)
+
+PROFILE_FLAG_VALUES = {'1', 'true', 'yes', 'on'}
+PROFILE_FILE_PATTERN = re.compile(r'^[\w.-]+\.(prof|txt)$')
+# Time stamp of a name written by write_profile, after the label
+PROFILE_TIMESTAMP_PATTERN = re.compile(r'-(\d{8}-\d{6})-[0-9a-f]{8}\.(?:prof|txt)$')
+
+# The interpreter allows one active profiler at a time, concurrent profiling requests run unprofiled
+profiler_lock = threading.Lock()
+
+
+def profile_requested(request):
+    """True when a staff user asked for a profiled run through ?profile=1 or the X-Pipeline-Profile header."""
+    flag = request.GET.get('profile') or request.headers.get('X-Pipeline-Profile') or ''
+    if flag.lower() not in PROFILE_FLAG_VALUES:
+        return False
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+def allocation_report(snapshot, limit):
+    lines = [f"Top {limit} allocation sites (tracemalloc):"]
+    for stat in snapshot.statistics('lineno')[:limit]:
+        lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {stat.traceback}")
+    return '\n'.join(lines)
+
+
+def write_profile(label, profiler, snapshot, peak_memory, elapsed):
+    """Saves the .prof stats and the .txt report, returns the profile's base name."""
+    os.makedirs(PIPELINE_PROFILE_DIR, exist_ok=True)
+    name = f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    profiler.dump_stats(os.path.join(PIPELINE_PROFILE_DIR, f"{name}.prof"))
+
+    stats_text = io.StringIO()
+    pstats.Stats(profiler, stream=stats_text).sort_stats('cumulative').print_stats(PIPELINE_PROFILE_TOP_ENTRIES)
+    with open(os.path.join(PIPELINE_PROFILE_DIR, f"{name}.txt"), 'w') as report:
+        report.write(f"Profile {name}: {elapsed:.2f}s wall time, {peak_memory / 1024 / 1024:.1f} MiB traced peak\n\n")
+        report.write(stats_text.getvalue())
+        report.write('\n')
+        report.write(allocation_report(snapshot, PIPELINE_PROFILE_TOP_ENTRIES))
+        report.write('\n')
+    return name
+
+
+def run_profiled(label, function, *args, **kwargs):
+    """
+    Runs function(*args, **kwargs) under cProfile and tracemalloc and writes its profile.
+    Returns (result, profile name), the name is None when another profiled run was already active.
+    """
+    if not profiler_lock.acquire(blocking=False):
+        emit("Profiling skipped: another profiled run is in progress.")
+        return function(*args, **kwargs), None
+
+    try:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        start_time = time.perf_counter()
+        try:
+            result = profiler.runcall(function, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            snapshot = tracemalloc.take_snapshot()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            name = write_profile(label, profiler, snapshot, peak_memory, elapsed)
+            emit(f"Profile saved as {name} ({elapsed:.2f}s).")
+        return result, name
+    finally:
+        profiler_lock.release()
+
+
+def profiled(label, function):
+    """
+    Wraps a pipeline function (called with progress=...) so it runs profiled;
+    a dict result gets the profile's name under 'profile'.
+    """
+    def run(*args, **kwargs):
+        result, name = run_profiled(label, function, *args, **kwargs)
+        if isinstance(result, dict):
+            result = dict(result, profile=name)
+        return result
+
+    return run
+
+
+def profile_sort_key(file_name):
+    """(time stamp, name) of a profile file, whatever its label; files not named by write_profile sort last."""
+    match = PROFILE_TIMESTAMP_PATTERN.search(file_name)
+    return match.group(1) if match else '', file_name
+
+
+def list_profiles():
+    """Names of the saved profile files, newest first."""
+    if not os.path.isdir(PIPELINE_PROFILE_DIR):
+        return []
+    return sorted((file_name for file_name in os.listdir(PIPELINE_PROFILE_DIR)
+                   if PROFILE_FILE_PATTERN.match(file_name)), key=profile_sort_key, reverse=True)
+
+
+def profile_path(file_name):
+    """Path of a saved profile file, None for anything that is not one (no paths, no other files)."""
+    if not PROFILE_FILE_PATTERN.match(file_name):
+        return None
+    path = os.path.join(PIPELINE_PROFILE_DIR, file_name)
+    return path if os.path.isfile(path) else None
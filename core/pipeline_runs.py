@@ -0,0 +1,377 @@
+# ###################################### ###################################### #
+# Pipeline Run Ledger
+#
+# Every pipeline run leaves one row in pipeline_runs (core.models.PipelineRun, shown in the admin):
+# candidates generated and scored, cache hits, LLM calls and failures, prompt/completion tokens and their cost
+# (from the OpenAI usage fields), per-agent latency, how many usernames were stored and how many reached
+# the score threshold, how many passed the web validation, and the wall time.
+#
+# The statistics of the run in progress travel in a contextvar, like the event sink (pipeline_events), so
+# concurrent runs in one process (threads, executor batches through bind_context, asyncio tasks) each fill their own.
+# Steps call the record_* functions, which do nothing outside of a run.
+#
+# A run that failed can be resumed under its run id: its checkpoints (pipeline_checkpoints) let the steps
+# skip what the failed attempt already finished, and they are cleared once the run succeeds.
+# ###################################### ###################################### #
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from .agent_scores import async_store_agent_scores, store_agent_scores
+from .pipeline_checkpoints import (async_clear_checkpoints, async_load_checkpoint, async_save_checkpoint,
+                                   clear_checkpoints, load_checkpoint, save_checkpoint)
+from .pipeline_events import emit
+from .step2_MariaDB_database_engine import async_ensure_table, connect_to_database, ensure_table
+
+# USD per million (prompt, completion) tokens, OPENAI_MODEL_PRICES='{"model": [prompt, completion]}' overrides them
+MODEL_PRICES_PER_MILLION = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4.1': (2.00, 8.00),
+}
+MODEL_PRICES_PER_MILLION.update({model: tuple(prices) for model, prices in
+                                 json.loads(os.getenv('OPENAI_MODEL_PRICES', '{}')).items()})
+
+# Average score a username needs to count as above the threshold in the ledger
+SCORE_THRESHOLD = float(os.getenv('PIPELINE_SCORE_THRESHOLD', 0.7))
+
+CREATE_PIPELINE_RUNS_QUERY = '''
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    run_id VARCHAR(32) NOT NULL UNIQUE,
+    mode VARCHAR(16) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    started_at DATETIME(6) NOT NULL,
+    finished_at DATETIME(6) NULL,
+    wall_seconds DOUBLE NULL,
+    candidates_generated INT NOT NULL DEFAULT 0,
+    candidates_scored INT NOT NULL DEFAULT 0,
+    cache_hits INT NOT NULL DEFAULT 0,
+    llm_requests INT NOT NULL DEFAULT 0,
+    llm_failures INT NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    cost_usd DECIMAL(12,6) NOT NULL DEFAULT 0,
+    accepted INT NOT NULL DEFAULT 0,
+    above_threshold INT NOT NULL DEFAULT 0,
+    score_threshold DECIMAL(4,2) NOT NULL,
+    validated INT NOT NULL DEFAULT 0,
+    agent_stats JSON NULL,
+    error LONGTEXT NULL,
+    generator VARCHAR(16) NULL
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
+'''
+
+# A resumed run keeps its row (and first start time)
+INSERT_PIPELINE_RUN_QUERY = '''
+INSERT INTO pipeline_runs (run_id, mode, status, started_at, score_threshold) VALUES (%s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE status = VALUES(status), error = NULL
+'''
+
+UPDATE_PIPELINE_RUN_QUERY = '''
+UPDATE pipeline_runs SET status = %s, finished_at = %s, wall_seconds = %s, candidates_generated = %s,
+    candidates_scored = %s, cache_hits = %s, llm_requests = %s, llm_failures = %s, prompt_tokens = %s,
+    completion_tokens = %s, cost_usd = %s, accepted = %s, above_threshold = %s, validated = %s, agent_stats = %s,
+    error = %s, generator = %s
+WHERE run_id = %s
+'''
+
+
+def utc_now():
+    # Stored naive in UTC, as Django does with USE_TZ on MySQL/MariaDB
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def token_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES_PER_MILLION.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class PipelineRunStats:
+    """Counters of one pipeline run, safe to update from the run's executor threads."""
+
+    def __init__(self, mode, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex
+        # Only a resumed run has checkpoints to read
+        self.resumed = run_id is not None
+        self.mode = mode
+        self.status = 'running'
+        self.started_at = utc_now()
+        self.start_time = time.perf_counter()
+        self.finished_at = None
+        self.wall_seconds = None
+        self.candidates_generated = 0
+        self.accepted = 0
+        self.above_threshold = 0
+        self.validated = 0
+        self.generator = None
+        self.error = None
+        # agent name -> requests, failures, latency, tokens, cost, scored, cache hits
+        self.agents = {}
+        self.lock = threading.Lock()
+
+    def _agent(self, agent_name):
+        return self.agents.setdefault(agent_name, {
+            'requests': 0, 'failures': 0, 'latency_seconds': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0,
+            'cost_usd': 0.0, 'scored': 0, 'cache_hits': 0,
+        })
+
+    def add(self, agent_name=None, **amounts):
+        """Adds the amounts to the run's counters, or to the agent's when agent_name is given."""
+        with self.lock:
+            if agent_name is None:
+                for key, amount in amounts.items():
+                    setattr(self, key, getattr(self, key) + amount)
+            else:
+                agent_stats = self._agent(agent_name)
+                for key, amount in amounts.items():
+                    agent_stats[key] += amount
+
+    def total(self, key):
+        with self.lock:
+            return sum(agent_stats[key] for agent_stats in self.agents.values())
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = utc_now()
+        self.wall_seconds = time.perf_counter() - self.start_time
+
+    def agent_stats(self):
+        with self.lock:
+            stats = {name: dict(agent_stats) for name, agent_stats in self.agents.items()}
+        for agent_stats in stats.values():
+            agent_stats['mean_latency_seconds'] = (agent_stats['latency_seconds'] / agent_stats['requests']
+                                                   if agent_stats['requests'] else None)
+        return stats
+
+    def insert_params(self):
+        return self.run_id, self.mode, self.status, self.started_at, SCORE_THRESHOLD
+
+    def update_params(self):
+        return (self.status, self.finished_at, self.wall_seconds, self.candidates_generated, self.total('scored'),
+                self.total('cache_hits'), self.total('requests'), self.total('failures'), self.total('prompt_tokens'),
+                self.total('completion_tokens'), Decimal(f"{self.total('cost_usd'):.6f}"), self.accepted,
+                self.above_threshold, self.validated, json.dumps(self.agent_stats()), self.error, self.generator,
+                self.run_id)
+
+    def candidates_per_above_threshold(self):
+        """Candidates generated (and scored) per username reaching the score threshold, the generator's yield."""
+        return self.candidates_generated / self.above_threshold if self.above_threshold else None
+
+    def as_dict(self):
+        """The run's statistics, as reported by manage.py run_pipeline."""
+        return {
+            'run_id': self.run_id,
+            'mode': self.mode,
+            'status': self.status,
+            'generator': self.generator,
+            'wall_seconds': self.wall_seconds,
+            'candidates_generated': self.candidates_generated,
+            'candidates_scored': self.total('scored'),
+            'cache_hits': self.total('cache_hits'),
+            'llm_requests': self.total('requests'),
+            'llm_failures': self.total('failures'),
+            'prompt_tokens': self.total('prompt_tokens'),
+            'completion_tokens': self.total('completion_tokens'),
+            'cost_usd': round(self.total('cost_usd'), 6),
+            'accepted': self.accepted,
+            'above_threshold': self.above_threshold,
+            'candidates_per_above_threshold': self.candidates_per_above_threshold(),
+            'validated': self.validated,
+            'error': self.error,
+        }
+
+    def summary(self):
+        cost = self.total('cost_usd')
+        per_accepted = f"${cost / self.accepted:.6f} per stored username" if self.accepted else "no stored usernames"
+        per_above = self.candidates_per_above_threshold()
+        yield_text = f" ({per_above:.1f} candidates each)" if per_above is not None else ""
+        return (f"Run {self.run_id}: {self.candidates_generated} generated, {self.total('scored')} scored, "
+                f"{self.above_threshold} above {SCORE_THRESHOLD}{yield_text}, {self.total('requests')} LLM calls, "
+                f"{self.total('prompt_tokens') + self.total('completion_tokens')} tokens, "
+                f"${cost:.6f} ({per_accepted}).")
+
+
+current_run = contextvars.ContextVar('pipeline_run', default=None)
+
+
+# ###################################### #
+# Recording, no-ops outside of a run
+# ###################################### #
+
+def record_generated(count, generator=None):
+    run = current_run.get()
+    if run is not None:
+        run.add(candidates_generated=count)
+        if generator is not None:
+            run.generator = generator
+
+
+def record_scoring_plan(agent, to_score, cache_hits):
+    run = current_run.get()
+    if run is not None:
+        run.add(agent.name, scored=to_score, cache_hits=cache_hits)
+
+
+def record_llm_call(agent, seconds, usage):
+    run = current_run.get()
+    if run is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_tokens', None) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', None) or 0
+    run.add(agent.name, requests=1, latency_seconds=seconds, prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens, cost_usd=token_cost(agent.model, prompt_tokens, completion_tokens))
+
+
+def record_llm_failure(agent):
+    run = current_run.get()
+    if run is not None:
+        run.add(agent.name, failures=1)
+
+
+def record_ranking(sorted_usernames, stored_count):
+    """Called with the run's ranked (username, score) list and the number of usernames stored from it."""
+    run = current_run.get()
+    if run is not None:
+        run.add(accepted=stored_count,
+                above_threshold=sum(1 for _, score in sorted_usernames if score >= SCORE_THRESHOLD))
+
+
+def record_validated(count):
+    run = current_run.get()
+    if run is not None:
+        run.add(validated=count)
+
+
+# ###################################### #
+# Checkpoints of the current run, no-ops outside of a run
+# ###################################### #
+
+def load_run_checkpoint(stage, key=''):
+    run = current_run.get()
+    return load_checkpoint(run.run_id, stage, key) if run is not None and run.resumed else None
+
+
+def save_run_checkpoint(stage, payload, key=''):
+    run = current_run.get()
+    if run is not None:
+        save_checkpoint(run.run_id, stage, payload, key)
+
+
+def save_run_agent_scores(agent, results):
+    """Keeps one agent's raw scores in agent_scores, under the current run's id when there is one."""
+    run = current_run.get()
+    store_agent_scores(agent, results, run.run_id if run is not None else None)
+
+
+async def async_load_run_checkpoint(pool, stage, key=''):
+    run = current_run.get()
+    return await async_load_checkpoint(pool, run.run_id, stage, key) if run is not None and run.resumed else None
+
+
+async def async_save_run_checkpoint(pool, stage, payload, key=''):
+    run = current_run.get()
+    if run is not None:
+        await async_save_checkpoint(pool, run.run_id, stage, payload, key)
+
+
+async def async_save_run_agent_scores(pool, agent, results):
+    run = current_run.get()
+    await async_store_agent_scores(pool, agent, results, run.run_id if run is not None else None)
+
+
+# ###################################### #
+# Run scopes
+# ###################################### #
+
+def save_run(query, params):
+    # The ledger must never fail the run it describes
+    try:
+        conn = connect_to_database()
+        cursor = conn.cursor()
+        ensure_table(cursor, 'pipeline_runs', CREATE_PIPELINE_RUNS_QUERY)
+        cursor.execute(query, params)
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        emit(f"Could not write the pipeline run ledger: {e}")
+
+
+@contextmanager
+def pipeline_run(mode='sync', run_id=None):
+    """
+    Records the block as one pipeline run and yields its PipelineRunStats.
+    Inside a run already in progress it yields that run, so nested stages add to the outer run.
+    """
+    run = current_run.get()
+    if run is not None:
+        yield run
+        return
+
+    run = PipelineRunStats(mode, run_id)
+    if run_id:
+        emit(f"Resuming run {run_id} from its checkpoints...")
+    token = current_run.set(run)
+    save_run(INSERT_PIPELINE_RUN_QUERY, run.insert_params())
+    try:
+        yield run
+    except BaseException as e:
+        run.finish('failed', error=f"{type(e).__name__}: {e}")
+        emit(f"Run {run.run_id} failed, resume it with run_id={run.run_id!r}.")
+        raise
+    else:
+        run.finish('succeeded')
+        emit(run.summary())
+        clear_checkpoints(run.run_id)
+    finally:
+        current_run.reset(token)
+        save_run(UPDATE_PIPELINE_RUN_QUERY, run.update_params())
+
+
+async def async_save_run(pool, query, params):
+    try:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await async_ensure_table(cursor, 'pipeline_runs', CREATE_PIPELINE_RUNS_QUERY)
+                await cursor.execute(query, params)
+            await conn.commit()
+    except Exception as e:
+        emit(f"Could not write the pipeline run ledger: {e}")
+
+
+@asynccontextmanager
+async def async_pipeline_run(pool, mode='async', run_id=None):
+    """asyncio counterpart of pipeline_run(), writing through the given aiomysql pool."""
+    run = current_run.get()
+    if run is not None:
+        yield run
+        return
+
+    run = PipelineRunStats(mode, run_id)
+    if run_id:
+        emit(f"Resuming run {run_id} from its checkpoints...")
+    token = current_run.set(run)
+    await async_save_run(pool, INSERT_PIPELINE_RUN_QUERY, run.insert_params())
+    try:
+        yield run
+    except BaseException as e:
+        run.finish('failed', error=f"{type(e).__name__}: {e}")
+        emit(f"Run {run.run_id} failed, resume it with run_id={run.run_id!r}.")
+        raise
+    else:
+        run.finish('succeeded')
+        emit(run.summary())
+        await async_clear_checkpoints(pool, run.run_id)
+    finally:
+        current_run.reset(token)
+        await async_save_run(pool, UPDATE_PIPELINE_RUN_QUERY, run.update_params())
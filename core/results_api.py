@@ -0,0 +1,135 @@
+# ###################################### ###################################### #
+# Results API
+#
+# GET /results/ serves high_rated_unames_history as JSON, best scores first, one page at a time:
+# I. Keyset pagination: a page ends with an opaque cursor holding its last row's (score, ID, created_at), and
+#    the next page starts strictly after that row on the history_score index. Any page costs the same index range
+#    read, where an OFFSET would scan and throw away every row of the pages before it.
+# II. Every page is kept in Django's cache (PIPELINE_RESULTS_CACHE alias) under the cache's current generation.
+#    Writes to the history (the history sync of a cycle, a retention run, a dropped table) move the generation
+#    on, so the next request reads fresh rows and the stale pages expire on their own. A dashboard polling
+#    between two cycles costs two cache reads and no query.
+#
+# Django settings are read on first use: the step modules invalidating the cache also run without Django.
+# ###################################### ###################################### #
+
+import base64
+import binascii
+import json
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from .pipeline_events import emit
+from .pipeline_metrics import count
+
+RESULTS_TABLE = 'high_rated_unames_history'
+RESULTS_GENERATION_KEY = 'results:generation'
+
+# Best scores first, ties by ID then created_at (the history's key, a recreated scoring table reuses IDs)
+RESULTS_PAGE_QUERY = f'''
+SELECT ID, username, score, created_at FROM `{RESULTS_TABLE}`
+{{where}}ORDER BY score DESC, ID DESC, created_at DESC LIMIT %s
+'''
+
+RESULTS_AFTER_CONDITION = '''WHERE score < %s OR (score = %s AND (ID < %s OR (ID = %s AND created_at < %s)))
+'''
+
+
+def results_setting(name, default):
+    from django.conf import settings
+
+    return getattr(settings, name, default)
+
+
+def results_cache():
+    from django.core.cache import caches
+
+    return caches[results_setting('PIPELINE_RESULTS_CACHE', 'default')]
+
+
+def invalidate_results_cache():
+    """Moves the cached pages to a new generation, called by every writer of the history table."""
+    from django.conf import settings
+
+    if not settings.configured:
+        return
+    # A stale page until the cache timeout is better than a failed history sync
+    try:
+        results_cache().set(RESULTS_GENERATION_KEY, time.time_ns(), None)
+    except Exception as e:
+        emit(f"Could not invalidate the cached results: {e}")
+
+
+# ###################################### #
+# I. Keyset pagination
+# ###################################### #
+
+def encode_cursor(row):
+    """Opaque cursor of the (score, ID, created_at) of a page's last row."""
+    score, row_id, created_at = row
+    data = json.dumps([str(score), row_id, created_at.isoformat()], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(score, ID, created_at) of a cursor, ValueError when it is not one of ours."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        score, row_id, created_at = json.loads(data)
+        return Decimal(score), int(row_id), datetime.fromisoformat(created_at)
+    except (binascii.Error, UnicodeDecodeError, InvalidOperation, TypeError, ValueError):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+
+def results_page_query(after=None):
+    """(query, parameters) of the page after the (score, ID, created_at) key, the first page without one."""
+    if after is None:
+        return RESULTS_PAGE_QUERY.format(where=''), []
+    score, row_id, created_at = after
+    return RESULTS_PAGE_QUERY.format(where=RESULTS_AFTER_CONDITION), [score, score, row_id, row_id, created_at]
+
+
+def load_results_page(limit, after=None):
+    """{'results': [{id, username, score, created_at}, ...], 'next_cursor': ...} read from the history table."""
+    from .step2_MariaDB_database_engine import connect_to_database
+
+    query, parameters = results_page_query(after)
+    conn = connect_to_database()
+    cursor = conn.cursor()
+    try:
+        # One row past the page tells whether there is a next page
+        cursor.execute(query, parameters + [limit + 1])
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    page = rows[:limit]
+    return {
+        'results': [{'id': row_id, 'username': usern, 'score': float(score), 'created_at': created_at.isoformat()}
+                    for row_id, usern, score, created_at in page],
+        'next_cursor': encode_cursor((page[-1][2], page[-1][0], page[-1][3])) if len(rows) > limit else None,
+    }
+
+
+# ###################################### #
+# II. Cached pages
+# ###################################### #
+
+def cached_results_page(limit, cursor=None):
+    """(page, cached) of the page after cursor, from the cache while the history is unchanged."""
+    after = decode_cursor(cursor) if cursor else None
+    cache = results_cache()
+    generation = cache.get_or_set(RESULTS_GENERATION_KEY, time.time_ns, None)
+    key = f"results:{generation}:{limit}:{cursor or ''}"
+
+    page = cache.get(key)
+    if page is not None:
+        count('pipeline_results_cache_total', result='hit')
+        return page, True
+
+    count('pipeline_results_cache_total', result='miss')
+    page = load_results_page(limit, after)
+    cache.set(key, page, results_setting('PIPELINE_RESULTS_CACHE_SECONDS', 300))
+    return page, False
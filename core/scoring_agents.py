@@ -0,0 +1,98 @@
+# ###################################### ###################################### #
+# Scoring Agent Registry
+#
+# The Step 4 agents are defined as data in scoring_agents.json (or the file named by SCORING_AGENTS_CONFIG):
+# prompt templates, model, temperature, weight in the ensemble, batch size and whether they are enabled.
+# Adding, disabling or re-weighting an agent is a config change - no code changes needed.
+#
+# All agents share one OpenAI client (and with it one pooled HTTP connection pool) and one score cache,
+# so client setup is paid once per process rather than on every call.
+# ###################################### ###################################### #
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from string import Template
+
+DEFAULT_AGENTS_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scoring_agents.json')
+
+
+class ScoringAgent:
+    def __init__(self, name, system_prompt, user_prompt, model="gpt-4o-mini", temperature=0.8, weight=1.0,
+                 batch_size=50, max_tokens=3333, enabled=True):
+        self.name = name
+        self.system_prompt = system_prompt
+        # string.Template, $usernames is replaced by the batch of usernames to score
+        self.user_prompt = Template(user_prompt)
+        self.model = model
+        self.temperature = temperature
+        self.weight = weight
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.enabled = enabled
+
+    def build_messages(self, generated_usernames):
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": self.user_prompt.substitute(usernames=generated_usernames)},
+        ]
+
+    def cache_key(self, username):
+        # Any change to the prompt or model invalidates the agent's cached scores
+        return self.name, self.model, self.temperature, self.system_prompt, self.user_prompt.template, username
+
+    def __repr__(self):
+        return f"ScoringAgent({self.name!r}, model={self.model!r}, weight={self.weight})"
+
+
+def load_scoring_agents(config_path=None, include_disabled=False):
+    """Loads the agents in call order from the JSON config."""
+    config_path = config_path or os.getenv('SCORING_AGENTS_CONFIG', DEFAULT_AGENTS_CONFIG)
+    with open(config_path, 'r', encoding='utf-8') as file:
+        config = json.load(file)
+
+    agents = [ScoringAgent(**agent_config) for agent_config in config["agents"]]
+    if include_disabled:
+        return agents
+    return [agent for agent in agents if agent.enabled]
+
+
+@lru_cache(maxsize=1)
+def get_openai_client():
+    """One client per process, retries are left to the request scheduler."""
+    # The SDK (pydantic, httpx) is imported with the first scoring call instead of with the views
+    from openai import OpenAI
+
+    return OpenAI(max_retries=0)
+
+
+class ScoreCache:
+    """Thread-safe LRU of agent scores, so a username an agent has already scored is not paid for twice."""
+
+    def __init__(self, max_size=50000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, score):
+        with self.lock:
+            self.entries[key] = score
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+score_cache = ScoreCache(max_size=int(os.getenv('SCORING_CACHE_SIZE', 50000)))
@@ -13,17 +13,28 @@
 #
 # This step ensures that we begin the email generation process with a clean, linguistically accurate
 # dataset that is free from inappropriate content, forming the foundation for later stages.
+#
+# NLTK, LangDetect and the connector are imported on first use: the web workers import this module
+# with the views but only a regeneration needs them.
+#
+# A regeneration is incremental (see vocabulary_builds.py): unchanged inputs finish at once, and only the words
+# whose outcome can have changed go through LangDetect and into (or out of) the 'words' table.
 # ###################################### ###################################### #
 # ###################################### ###################################### #
 
 import time
-import mysql.connector
-from langdetect import detect, LangDetectException
-from nltk.corpus import words as nltk_words
+from .pipeline_events import emit
+from .pipeline_metrics import count as count_metric, span
+from .username_blocklist import load_blocklist_terms
+from .vocabulary_builds import (LANGDETECT_SEED, build_inputs, load_build_inputs, load_build_words,
+                                load_language_checks, save_build_inputs, save_language_checks)
+from .vocabulary_versions import bump_vocabulary_versions
 
 
 def connect_to_database():
     """Connect to the MariaDB database."""
+    import mysql.connector
+
     conn = mysql.connector.connect(
         host="localhost",
         user="root",
@@ -53,6 +64,11 @@ def create_table(cur, table_name, clean=False):
 
 def is_english(text):
     """Check if the text is detected as English using langdetect."""
+    from langdetect import DetectorFactory, detect, LangDetectException
+
+    # Seeded, the same word gets the same verdict on every run
+    DetectorFactory.seed = LANGDETECT_SEED
+
     try:
         if detect(text) == 'en':
             return True
@@ -61,60 +77,84 @@ def is_english(text):
     return False
 
 
-def filter_and_store_english_words(cur, valid_words, table_name, word_len):
-    """Filter words of length 3 from nltk, check if langdetect recognizes them as English, and store them."""
-    count = 0
-    offensive_words = load_offensive_words()
-    for word in valid_words:
-        if len(word) == word_len and is_english(word) and word.lower() not in offensive_words:
-            count += 1
-            print(f"Valid Word found! {word} at count {count}")
-
-            # Insert the valid word and count into the database
-            cur.execute(f"INSERT IGNORE INTO {table_name} (word, NoOfLetters) VALUES (%s, %s)", (word, word_len))
-
-
 def load_offensive_words():
-    """Load a list of offensive or inappropriate words."""
-    return {
-        'ass', 'bum', 'gay', 'pig', 'suck'
-        'cunt', 'dick', 'fuck', 'slut', 'whore',
-        'bitch', 'cocky', 'dicks', 'nigger', 'shit'
-    }
-
+    """Load a list of offensive or inappropriate words (USERNAME_BLOCKLIST, offensive_words.txt by default)."""
+    return load_blocklist_terms()
+
+
+def check_languages(words, language_checks):
+    """Runs LangDetect over the words it has not checked yet, adds and returns their verdicts."""
+    new_checks = {}
+    for word in words:
+        if word not in language_checks:
+            new_checks[word] = is_english(word)
+    language_checks.update(new_checks)
+    return new_checks
+
+
+def apply_vocabulary_delta(cur, added, removed):
+    """Inserts the words the build gained into 'words' and deletes the ones it lost from 'words' and 'names'."""
+    if added:
+        for word in sorted(added):
+            emit(f"Valid Word found! {word}")
+        rows = [(word, len(word)) for word in sorted(added)]
+        cur.executemany("INSERT IGNORE INTO words (word, NoOfLetters) VALUES (%s, %s)", rows)
+        count_metric('pipeline_db_rows_written_total', max(cur.rowcount, 0), table='words')
+        cur.executemany("INSERT INTO vocabulary_build_words (word, NoOfLetters) VALUES (%s, %s)", rows)
+
+    if removed:
+        for table in ('words', 'names'):
+            # The vocabulary tables compare case-insensitively, "Bill" must not take "bill" with it
+            cur.executemany(f"DELETE FROM `{table}` WHERE word = %s AND BINARY word = %s",
+                            [(word, word) for word in sorted(removed)])
+        cur.executemany("DELETE FROM vocabulary_build_words WHERE word = %s", [(word,) for word in sorted(removed)])
+
+
+def regenerate_data(min_letters, max_letters, full=False):
+    """
+    Brings the 'words' table up to date with the NLTK corpus, keeping the English, non-offensive words of
+    min_letters to max_letters letters. full=True forgets the kept LangDetect verdicts and checks every word again.
+    """
+    from nltk.corpus import words as nltk_words
 
-def generate_X_letters_words(number_of_letters):
-    # Load valid English words from nltk
-    valid_words = set(nltk_words.words())
-
-    # Connect to the database
+    start_time = time.time()
     conn = connect_to_database()
     cur = conn.cursor()
-    # Create Table if not exists, Possibility to dynamically create new tables on parameters
-    # create_table(cur, f'{number_of_letters}letters_words')
-    if number_of_letters == 3:
-        create_table(cur, 'words')
-    conn.commit()
-
-    # Filter words of length 3 and check if they're English
-    filter_and_store_english_words(cur, valid_words, 'words', number_of_letters)
-
-    # Commit all the changes and close the connection
-    conn.commit()
-    cur.close()
-    conn.close()
-
-
-def regenerate_data(min_letters, max_letters):
-    """Main function to execute the script."""
-    start_time = time.time()
-
-    # Define Loop for generating words of X numbers of letters
-    for no_of_letters in range(min_letters, (max_letters+1)):
-        print(f"DEBUG: Generating words with no of letters: {no_of_letters}")
-        generate_X_letters_words(no_of_letters)
-
+    try:
+        with span('vocabulary_regeneration'):
+            offensive_words = load_offensive_words()
+            inputs = build_inputs(nltk_words.raw(), min_letters, max_letters, offensive_words)
+            previous_inputs = load_build_inputs(cur)
+            if inputs == previous_inputs and not full:
+                emit("Vocabulary inputs unchanged since the last build, nothing to regenerate.")
+                return
+
+            # Same layout as the one separate_names() gives 'names', words are moved there after the build
+            create_table(cur, 'words')
+            create_table(cur, 'names')
+            detector_changed = previous_inputs is None or previous_inputs['detector'] != inputs['detector']
+            language_checks = load_language_checks(cur, clear=full or detector_changed)
+
+            candidates = {word for word in nltk_words.words() if min_letters <= len(word) <= max_letters}
+            new_checks = check_languages(sorted(candidates), language_checks)
+            count_metric('pipeline_language_checks_total', len(new_checks))
+            save_language_checks(cur, new_checks)
+            # The verdicts are the expensive part, they are kept even if the rest of the build fails
+            conn.commit()
+
+            accepted = {word for word in candidates
+                        if language_checks[word] and word.lower() not in offensive_words}
+            built = load_build_words(cur).keys()
+            added, removed = accepted - built, built - accepted
+            apply_vocabulary_delta(cur, added, removed)
+            save_build_inputs(cur, inputs)
+            if added or removed:
+                bump_vocabulary_versions(cur, 'words', 'names')
+            conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+    emit(f"Vocabulary build: {len(added)} words added, {len(removed)} removed.")
     end_time = time.time() - start_time
-    print(f"Compute Time: {end_time} seconds")
-
-
+    emit(f"Compute Time: {end_time} seconds")
@@ -19,14 +19,31 @@
 # dataset, enhancing the relevance and structure of the email generation process.
 # ###################################### ###################################### #
 # ###################################### ###################################### #
-import time
+from datetime import date
 from decimal import Decimal
 
-import mysql.connector
+from .pipeline_events import emit, pace
+from .pipeline_metrics import count, span
+from .results_api import RESULTS_TABLE, invalidate_results_cache
+from .vocabulary_versions import bump_vocabulary_versions, history_version_queries
+
+# Rows read per round trip by the streaming readers (interrogate_table, DatabaseLoader, learned_patterns)
+STREAM_BATCH_SIZE = 5000
+
+# The history table is partitioned by month of created_at (pYYYYMM, plus HISTORY_FUTURE_PARTITION for rows past the
+# last month created). `manage.py archive_history` adds the coming months and archives the months past the retention
+HISTORY_FUTURE_PARTITION = 'pfuture'
+
+# Tables this process already created, so the frequent writers (checkpoints, agent scores, the run ledger) run
+# their CREATE TABLE IF NOT EXISTS once per process instead of before every write
+created_tables = set()
 
 
 def connect_to_database():
     """Connect to the MariaDB database."""
+    # Imported on first use, like the other heavy dependencies, so importing the views stays cheap
+    import mysql.connector
+
     db_conn = mysql.connector.connect(
         host="localhost",
         user="root",
@@ -38,6 +55,19 @@ def connect_to_database():
     return db_conn
 
 
+def ensure_table(cursor, table_name, create_query):
+    if table_name not in created_tables:
+        cursor.execute(create_query)
+        created_tables.add(table_name)
+
+
+async def async_ensure_table(cursor, table_name, create_query):
+    """ensure_table() on an aiomysql cursor."""
+    if table_name not in created_tables:
+        await cursor.execute(create_query)
+        created_tables.add(table_name)
+
+
 def insert_into_table(table_name, word):
     """Inserts the word into the specified table."""
     # Connect to the database
@@ -49,13 +79,15 @@ def insert_into_table(table_name, word):
         INSERT IGNORE INTO `{table_name}` (word, NoOfLetters) 
         VALUES (%s, %s)
     ''', (word, len(word)))
+    count('pipeline_db_rows_written_total', cur.rowcount, table=table_name)
+    bump_vocabulary_versions(cur, table_name)
 
     # Commit changes and close the connection
     conn.commit()
     cur.close()
     conn.close()
 
-    print(f"Inserted '{word}' into {table_name}.")
+    emit(f"Inserted '{word}' into {table_name}.")
 
 
 def delete_table(table_name):
@@ -65,6 +97,7 @@ def delete_table(table_name):
     cur = conn.cursor()
     # Drop the table if it exists
     cur.execute(f'DELETE FROM `{table_name}`')
+    bump_vocabulary_versions(cur, table_name)
 
     # Commit the changes
     conn.commit()
@@ -80,38 +113,108 @@ def drop_table(table_name):
     cur = conn.cursor()
     # Drop the table if it exists
     cur.execute(f'DROP TABLE IF EXISTS `{table_name}`')
+    created_tables.discard(table_name)
+    bump_vocabulary_versions(cur, table_name)
 
     # Commit the changes
     conn.commit()
+    if table_name == RESULTS_TABLE:
+        invalidate_results_cache()
     # Close the cursor and connection
     cur.close()
     conn.close()
 
 
+def add_months(month, months):
+    """First day of the month months after the month of the given date."""
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def history_partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def history_partition_definition(month):
+    return f"PARTITION {history_partition_name(month)} VALUES LESS THAN ('{add_months(month, 1):%Y-%m-%d}')"
+
+
+def history_partitions_clause(months_ahead=1, today=None):
+    """Partitions from the current month to months_ahead months later, then the catch-all one."""
+    current_month = add_months(today or date.today(), 0)
+    definitions = [history_partition_definition(add_months(current_month, months))
+                   for months in range(months_ahead + 1)]
+    definitions.append(f"PARTITION {HISTORY_FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+    return 'PARTITION BY RANGE COLUMNS (created_at) (\n    ' + ',\n    '.join(definitions) + '\n)'
+
+
+def history_sync_queries(table='high_rated_unames', history_table='high_rated_unames_history'):
+    """Statements that create the history table if needed and copy the new scoring records into it."""
+    return [
+        # Create History Table as we will later disregard records from the main one as we parse it.
+        # The partitioning key has to be part of the primary key, ID alone is no longer unique
+        f'''
+        CREATE TABLE IF NOT EXISTS `{history_table}` (
+            ID INT NOT NULL,
+            username VARCHAR(255) NOT NULL,
+            score DECIMAL(5,2) NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (ID, created_at),
+            KEY history_username (username),
+            KEY history_created_at (created_at),
+            KEY history_score (score, ID, created_at)
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci
+        {history_partitions_clause()};
+        ''',
+        # Insert new records into the history table excluding the usernames already recorded. (ID, created_at) no
+        # longer tells a copied row apart, the username lookup on history_username does
+        f'''
+        INSERT IGNORE INTO `{history_table}` (ID, username, score) (SELECT t.ID, t.username, t.score FROM `{table}` t
+        WHERE NOT EXISTS (SELECT 1 FROM `{history_table}` h WHERE h.username = t.username));
+        ''',
+    ]
+
+
+def top_scores_query(table='high_rated_unames', limit_records=25):
+    return f'''
+    SELECT * FROM `{table}` ORDER BY score DESC LIMIT {int(limit_records)};
+    '''
+
+
+def scoring_row_to_dict(column_names, row):
+    row_dict = dict(zip(column_names, row))
+
+    # Convert Decimal to float for 'score' key
+    if isinstance(row_dict.get('score'), Decimal):
+        row_dict['score'] = float(row_dict['score'])
+    return row_dict
+
+
 def interrogate_scoring_table(table='high_rated_unames', history_table='high_rated_unames_history', limit_records=25):
     # Connect to the database
     conn = connect_to_database()
     cur = conn.cursor()
 
-    # Create History Table as we will later disregard records from the main one as we parse it
-    # Ensure the history table exists
-    cur.execute(f'''
-    CREATE TABLE IF NOT EXISTS `{history_table}` LIKE `{table}`;
-    ''')
-
-    # Insert new records into the history table excluding duplicates
-    cur.execute(f'''
-    INSERT IGNORE INTO `{history_table}` (SELECT * FROM `{table}`
-    WHERE username NOT IN (SELECT username FROM `{history_table}`));
-    ''')
-
-    # Commit the changes
-    conn.commit()
+    # Ensure the history table exists and holds every record of the scoring table
+    with span('history_sync'):
+        rows_written = 0
+        for query in history_sync_queries(table, history_table):
+            cur.execute(query)
+            rows_written += max(cur.rowcount, 0)
+            count('pipeline_db_rows_written_total', max(cur.rowcount, 0), table=history_table)
+        # Learned-mode workers refit their pattern model once enough rows were added
+        if rows_written:
+            for query, params in history_version_queries(rows_written):
+                cur.execute(query, params)
+
+        # Commit the changes
+        conn.commit()
+    # New scores in the history, the cached result pages are stale
+    if rows_written:
+        invalidate_results_cache()
 
     # Fetch the table data using the dynamic table name and limit the number of records
-    cur.execute(f'''
-    SELECT * FROM `{table}` ORDER BY score DESC LIMIT {limit_records};
-    ''')
+    cur.execute(top_scores_query(table, limit_records))
 
     # Fetch and print the column headers
     column_names = [i[0] for i in cur.description]
@@ -120,26 +223,34 @@ def interrogate_scoring_table(table='high_rated_unames', history_table='high_rat
     rows = cur.fetchall()
 
     for row in rows:
-        row_dict = dict(zip(column_names, row))
+        emit(scoring_row_to_dict(column_names, row))
+        pace(0.25)
 
-        # Convert Decimal to float for 'score' key
-        if isinstance(row_dict.get('score'), Decimal):
-            row_dict['score'] = float(row_dict['score'])
-
-        print(row_dict)
-        time.sleep(0.25)
-
-    time.sleep(0.33)
+    pace(0.33)
 
     # Close the cursor and connection
     cur.close()
     conn.close()
 
 
-def interrogate_table(table):
+def iter_row_batches(cur, batch_size=STREAM_BATCH_SIZE):
+    """
+    Yields the rows of the executed query in lists of at most batch_size. On an unbuffered cursor
+    (conn.cursor(buffered=False)) the rows stay on the server until read, so memory holds one batch at a time.
+    The connection cannot run another query before the last batch is read.
+    """
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def interrogate_table(table, batch_size=STREAM_BATCH_SIZE):
     # Connect to the database
     conn = connect_to_database()
-    cur = conn.cursor()
+    # Unbuffered: rows are streamed from the server as they are printed, whatever the size of the table
+    cur = conn.cursor(buffered=False)
 
     # Fetch the table data using the dynamic table name
     cur.execute(f'''
@@ -150,58 +261,74 @@ def interrogate_table(table):
     column_names = [i[0] for i in cur.description]
 
     # Fetch and print the rows
-    rows = cur.fetchall()
-
-    print(f"\nTable Data from `{table}`:")
-    for row in rows:
-        print(dict(zip(column_names, row)))  # Use zip to pair column names with their respective values
+    emit(f"\nTable Data from `{table}`:")
+    for rows in iter_row_batches(cur, batch_size):
+        for row in rows:
+            emit(dict(zip(column_names, row)))  # Use zip to pair column names with their respective values
 
     # Close the cursor and connection
     cur.close()
     conn.close()
 
 
-def interrogate_final_table(fetch_top_production_records):
-    # Connect to the database
-    conn = connect_to_database()
-    cur = conn.cursor()
+# Columns of the Main Production Final Table view
+FINAL_TABLE_COLUMNS = ['username', 'score', 'search_result_title', 'url']
 
-    print("Current Main Production Final Table: ")
-    # Fetch the table data using the dynamic table name
-    cur.execute(f'''
+
+def final_table_query(fetch_top_production_records):
+    return f'''
         SELECT u1.username, u2.score, u1.search_result_title, u1.url 
         FROM high_probability_real_usernames u1
         INNER JOIN high_rated_unames_history u2 
         ON u1.username = u2.username
         ORDER BY u2.score desc
-        LIMIT {fetch_top_production_records};
-    ''')
+        LIMIT {int(fetch_top_production_records)};
+    '''
+
 
-    # Fetch and print the column headers (removing ID)
-    column_names = ['username', 'score', 'search_result_title', 'url']
+def final_row_to_dict(row):
+    # Convert the row into a dictionary
+    row_dict = dict(zip(FINAL_TABLE_COLUMNS, row))
+
+    # Convert score to a float if it's a Decimal or string representation of a number
+    try:
+        row_dict['score'] = float(row_dict['score'])
+    except (ValueError, TypeError):
+        row_dict['score'] = 0.0  # Fallback in case of an error
+    return row_dict
+
+
+def format_final_row(row_dict):
+    # Print in the required order
+    return (f"username: {row_dict['username']}, score: {row_dict['score']:.2f}, "
+            f"search_result_title: {row_dict['search_result_title']}, URL: {row_dict['url']}")
+
+
+def interrogate_final_table(fetch_top_production_records):
+    # Connect to the database
+    conn = connect_to_database()
+    cur = conn.cursor()
+
+    emit("Current Main Production Final Table: ")
+    # Fetch the table data using the dynamic table name
+    cur.execute(final_table_query(fetch_top_production_records))
 
     # Fetch and print the rows
     rows = cur.fetchall()
 
+    final_rows = []
     for row in rows:
-        # Convert the row into a dictionary
-        row_dict = dict(zip(column_names, row))
-
-        # Convert score to a float if it's a Decimal or string representation of a number
-        try:
-            row_dict['score'] = float(row_dict['score'])
-        except (ValueError, TypeError):
-            row_dict['score'] = 0.0  # Fallback in case of an error
-
-        # Print in the required order
-        print(f"username: {row_dict['username']}, score: {row_dict['score']:.2f}, "
-              f"search_result_title: {row_dict['search_result_title']}, URL: {row_dict['url']}")
-        time.sleep(0.25)
+        row_dict = final_row_to_dict(row)
+        emit(format_final_row(row_dict))
+        final_rows.append(row_dict)
+        pace(0.25)
 
     # Close the cursor and connection
     cur.close()
     conn.close()
 
+    return final_rows
+
 
 def separate_names():
     # Connect to the database
@@ -225,11 +352,12 @@ def separate_names():
     WHERE BINARY LEFT(word, 1) = UPPER(LEFT(word, 1))
     ORDER BY NoOfLetters, word;
     ''')
+    moved = max(cur.rowcount, 0)
 
     # Commit the transaction
     conn.commit()
 
-    print("Records inserted into 'names' table where the first letter of the word is uppercase.")
+    emit("Records inserted into 'names' table where the first letter of the word is uppercase.")
 
     # Clean Original Table 'words' of extracted names
     cur.execute('''
@@ -238,6 +366,9 @@ def separate_names():
     INNER JOIN names n 
     ON w.word = n.word;
     ''')
+    # Nothing moved and nothing deleted, the workers have no reason to reload
+    if moved or cur.rowcount > 0:
+        bump_vocabulary_versions(cur, 'names', 'words')
 
     conn.commit()
 
@@ -258,14 +389,14 @@ def create_and_populate_numeric_tables():
         word VARCHAR(10) NOT NULL UNIQUE
     );
     ''')
-    print("Table `common_years` created.")
+    emit("Table `common_years` created.")
 
     # Insert the years from 1972 to 2030 as strings
-    for year in range(1972, 2031):
-        cur.execute('''
-        INSERT IGNORE INTO common_years (word) VALUES (%s)
-        ''', (str(year),))
-    print("Table `common_years` populated.")
+    cur.executemany('''
+    INSERT IGNORE INTO common_years (word) VALUES (%s)
+    ''', [(str(year),) for year in range(1972, 2031)])
+    years_added = max(cur.rowcount, 0)
+    emit("Table `common_years` populated.")
 
     # 2. Create the `common_numbers` table
     cur.execute('''
@@ -274,13 +405,10 @@ def create_and_populate_numeric_tables():
         word VARCHAR(10) NOT NULL UNIQUE
     );
     ''')
-    print("Table `common_numbers` created.")
+    emit("Table `common_numbers` created.")
 
     # Insert numbers from 1 to 30 as strings
-    for number in range(1, 31):
-        cur.execute('''
-        INSERT IGNORE INTO common_numbers (word) VALUES (%s)
-        ''', (str(number),))
+    numbers = list(range(1, 31))
 
     # Insert numbers of the format: XXX, XXXX, X00, X000 as strings
     special_numbers = [
@@ -291,12 +419,15 @@ def create_and_populate_numeric_tables():
         1111, 2222, 3333, 4444, 5555, 6666, 7777, 8888, 9999  # XXXX format
     ]
 
-    for num in special_numbers:
-        cur.execute('''
-        INSERT IGNORE INTO common_numbers (word) VALUES (%s)
-        ''', (str(num),))
+    cur.executemany('''
+    INSERT IGNORE INTO common_numbers (word) VALUES (%s)
+    ''', [(str(num),) for num in numbers + special_numbers])
+    numbers_added = max(cur.rowcount, 0)
 
-    print("Table `common_numbers` populated.")
+    emit("Table `common_numbers` populated.")
+    # Only the tables that gained rows, a regeneration over complete tables leaves the workers' copies valid
+    changed = [table for table, added in (('common_years', years_added), ('common_numbers', numbers_added)) if added]
+    bump_vocabulary_versions(cur, *changed)
 
     # Commit the changes
     conn.commit()
@@ -319,9 +450,9 @@ def get_all_table_definitions():
         # Get the CREATE TABLE statement for each table
         cursor.execute(f"SHOW CREATE TABLE {table_name}")
         result = cursor.fetchone()
-        print(f"Table: {table_name}\n")
-        print(result[1])  # The CREATE TABLE statement
-        print("\n" + "-" * 60 + "\n")
+        emit(f"Table: {table_name}\n")
+        emit(result[1])  # The CREATE TABLE statement
+        emit("\n" + "-" * 60 + "\n")
 
     cursor.close()
     conn.close()
@@ -14,42 +14,91 @@
 # EDIT: Reached bottleneck of being unable to mx records check per email due to security policies.
 # Still, we adapt.
 # For at the end of the day, it is but a tool - and it is left to One's imagination the many ways of achieving a task.
+#
+# EMAIL_GENERATOR_MODE=learned swaps the fixed weights of layers 1-2 and the separator logic for a pattern model
+# fitted to the scoring history (learned_patterns), falling back to the fixed weights while the history is too small.
+#
+# The generator is loaded once per process and kept current through vocabulary_versions: tables written since
+# it was loaded are reloaded in place, checked at most every VOCABULARY_CHECK_INTERVAL seconds.
 ##########################################
 
-from .step2_MariaDB_database_engine import connect_to_database, separate_names, create_and_populate_numeric_tables
+from .step2_MariaDB_database_engine import (connect_to_database, separate_names, create_and_populate_numeric_tables,
+                                            iter_row_batches)
+from .learned_patterns import PATTERN_MODEL_REFIT_ROWS, build_vocabulary, load_pattern_model
+from .pipeline_events import emit
+from .pipeline_metrics import count as count_metric, span
+from .pipeline_runs import record_generated
+from .username_blocklist import get_username_blocklist
+from .vocabulary_versions import (HISTORY_VERSION, VOCABULARY_CHECK_INTERVAL, VOCABULARY_TABLES, changed_tables,
+                                  fetch_vocabulary_versions)
+import json
+import os
 import random
+import threading
+import time
 from itertools import combinations
 
+# 'fixed' (hand-set weights) or 'learned' (fitted to the scoring history)
+EMAIL_GENERATOR_MODE = os.getenv('EMAIL_GENERATOR_MODE', 'fixed')
+# Probabilities of the fixed generator (layers 1-2 and the separators), tuned offline with `manage.py sweep_generator`.
+# EMAIL_GENERATOR_PARAMS names a JSON file overriding any of them, e.g. the params of the sweep's best configuration
+DEFAULT_GENERATOR_PARAMS = {
+    # 2, 3 or 4 elements
+    'element_count_weights': [0.4, 0.35, 0.25],
+    # name, word, year, number after the first element
+    'element_type_weights': [0.33, 0.29, 0.16, 0.22],
+    # name, word as the first element
+    'first_element_weights': [0.63, 0.47],
+    # name, word replacing a second year or number
+    'string_fallback_weights': [0.57, 0.43],
+    # Chance of the first "_" between two elements, and of every one after it
+    'first_separator_probability': 0.65,
+    'next_separator_probability': 0.11,
+}
+EMAIL_GENERATOR_PARAMS = os.getenv('EMAIL_GENERATOR_PARAMS')
+# Redraws allowed per requested username, a vocabulary the blocklist blocks almost entirely returns fewer usernames
+MAX_BLOCKED_PER_USERNAME = 10
+
 
 # Load Database Values
 class DatabaseLoader:
     def __init__(self):
         self.connection = connect_to_database()
-        self.cursor = self.connection.cursor()
+        # Unbuffered: rows are streamed in batches, only the converted dicts are kept
+        self.cursor = self.connection.cursor(buffered=False)
+
+    def iter_rows(self, query):
+        self.cursor.execute(query)
+        for rows in iter_row_batches(self.cursor):
+            yield from rows
 
     def load_words(self):
         query = "SELECT * FROM words order by NoOfLetters, Word"
-        self.cursor.execute(query)
-        words = self.cursor.fetchall()
-        return [{"word": row[1], "NoOfLetters": row[2]} for row in words]
+        return [{"word": row[1], "NoOfLetters": row[2]} for row in self.iter_rows(query)]
 
     def load_names(self):
         query = "SELECT * FROM names order by NoOfLetters, Word"
-        self.cursor.execute(query)
-        names = self.cursor.fetchall()
-        return [{"word": row[1], "NoOfLetters": row[2]} for row in names]
+        return [{"word": row[1], "NoOfLetters": row[2]} for row in self.iter_rows(query)]
 
     def load_common_years(self):
         query = "SELECT * FROM common_years"
-        self.cursor.execute(query)
-        common_years = self.cursor.fetchall()
-        return [{"ID": row[0], "word": row[1]} for row in common_years]
+        return [{"ID": row[0], "word": row[1]} for row in self.iter_rows(query)]
 
     def load_common_numbers(self):
         query = "SELECT * FROM common_numbers"
-        self.cursor.execute(query)
-        common_numbers = self.cursor.fetchall()
-        return [{"ID": row[0], "word": row[1]} for row in common_numbers]
+        return [{"ID": row[0], "word": row[1]} for row in self.iter_rows(query)]
+
+    def load_table(self, table):
+        """Rows of one vocabulary table (see vocabulary_versions.VOCABULARY_TABLES)."""
+        return {
+            'words': self.load_words,
+            'names': self.load_names,
+            'common_years': self.load_common_years,
+            'common_numbers': self.load_common_numbers,
+        }[table]()
+
+    def load_versions(self):
+        return fetch_vocabulary_versions(self.cursor)
 
     def close_connection(self):
         self.cursor.close()
@@ -57,18 +106,29 @@ class DatabaseLoader:
 
 
 class EmailGenerator:
-    def __init__(self, words_data, names_data, years_data, numbers_data):
+    # Recorded with each run in the ledger (pipeline_runs)
+    mode = 'fixed'
+
+    def __init__(self, words_data, names_data, years_data, numbers_data, params=None):
         self.words_data = words_data
         self.names_data = names_data
         self.years_data = years_data
         self.numbers_data = numbers_data
+        self.params = {**DEFAULT_GENERATOR_PARAMS, **(params or {})}
+        # vocabulary_versions the data was loaded at, {} for a generator not loaded from the database
+        self.versions = {}
+        # Rows added to the scoring history when the generator was loaded (or its pattern model fitted)
+        self.history_version = 0
 
-    @staticmethod
-    def layer_1_select_number_of_elements():
+    def update_vocabulary(self, element_type, data):
+        """Replaces the data of one element type (name, word, year, number), generations in flight keep the old list."""
+        setattr(self, f"{element_type}s_data", data)
+
+    def layer_1_select_number_of_elements(self):
         """Selects the number of elements to be used in the email based on probabilities."""
         elements_count = random.choices(
             population=[2, 3, 4],
-            weights=[0.4, 0.35, 0.25],
+            weights=self.params['element_count_weights'],
             k=1
         )[0]
         return elements_count
@@ -82,8 +142,8 @@ class EmailGenerator:
             ("year", self.years_data),
             ("number", self.numbers_data)
         ]
-        weights = [0.33, 0.29, 0.16, 0.22]
-        normalized_weights_first_element = [0.63, 0.47]
+        weights = self.params['element_type_weights']
+        normalized_weights_first_element = self.params['first_element_weights']
 
         element_type_count = {"name": 0, "word": 0, "year": 0, "number": 0}
 
@@ -108,7 +168,7 @@ class EmailGenerator:
                 if element_type in ["year", "number"] and any(el[0] in ["year", "number"] for el in elements):
                     element_type = random.choices(
                         population=["name", "word"],
-                        weights=[0.57, 0.43],
+                        weights=self.params['string_fallback_weights'],
                         k=1
                     )[0]
 
@@ -131,6 +191,16 @@ class EmailGenerator:
 
     def generate_email(self):
         """Generates an email address based on the selection from Layer 1 and 2."""
+        # Join elements to form the username
+        email_username = "".join(self.generate_username_parts())
+
+        # Append @gmail.com
+        email_address = f"{email_username}@gmail.com"
+
+        return email_username, email_address
+
+    def generate_username_parts(self):
+        """The elements and "_" separators of one username, in order."""
         elements_count = self.layer_1_select_number_of_elements()
         elements = self.layer_2_select_elements(elements_count)
 
@@ -143,94 +213,262 @@ class EmailGenerator:
             # Apply separator logic
             if i < len(elements) - 1:  # Don't add a separator after the last element
                 if not separator_added:
-                    # First separator has a 65% chance of being added
-                    add_separator = random.random() < 0.65
+                    # First separator has a 65% chance of being added (by default)
+                    add_separator = random.random() < self.params['first_separator_probability']
                     if add_separator:
                         email_username_parts.append("_")
                         separator_added = True
                 else:
-                    # Subsequent separators have an 11% chance
-                    add_separator = random.random() < 0.11
+                    # Subsequent separators have an 11% chance (by default)
+                    add_separator = random.random() < self.params['next_separator_probability']
                     if add_separator:
                         email_username_parts.append("_")
 
-        # Join elements to form the username
-        email_username = "".join(email_username_parts)
+        return email_username_parts
 
-        # Append @gmail.com
-        email_address = f"{email_username}@gmail.com"
 
-        return email_username, email_address
+class LearnedEmailGenerator(EmailGenerator):
+    """Draws the element types and separators from a learned_patterns.PatternModel instead of the fixed weights."""
+    mode = 'learned'
+
+    def __init__(self, words_data, names_data, years_data, numbers_data, pattern_model):
+        super().__init__(words_data, names_data, years_data, numbers_data)
+        self.pattern_model = pattern_model
+        self.data_by_type = {"name": names_data, "word": words_data, "year": years_data, "number": numbers_data}
+
+    def update_vocabulary(self, element_type, data):
+        super().update_vocabulary(element_type, data)
+        self.data_by_type[element_type] = data
+
+    def generate_username_parts(self):
+        email_username_parts = []
+        for element_type, separator in self.pattern_model.sample_shape():
+            if separator:
+                email_username_parts.append("_")
+            email_username_parts.append(random.choice(self.data_by_type[element_type])["word"])
+        return email_username_parts
 
 
 def load_data(print_loading_data):
-    db_loader = DatabaseLoader()
+    with span('vocabulary_load'):
+        db_loader = DatabaseLoader()
 
-    words = db_loader.load_words()
-    names = db_loader.load_names()
-    common_years = db_loader.load_common_years()
-    common_numbers = db_loader.load_common_numbers()
+        words = db_loader.load_words()
+        names = db_loader.load_names()
+        common_years = db_loader.load_common_years()
+        common_numbers = db_loader.load_common_numbers()
 
-    db_loader.close_connection()
+        db_loader.close_connection()
 
     if print_loading_data:
-        print(f" Extracted cleaned Database Data: \n Words: {words}")
-        print(f" Names: {names}")
-        print(f" Years: {common_years}")
-        print(f" Numbers: {common_numbers} \n")
+        emit(f" Extracted cleaned Database Data: \n Words: {words}")
+        emit(f" Names: {names}")
+        emit(f" Years: {common_years}")
+        emit(f" Numbers: {common_numbers} \n")
 
     return words, names, common_years, common_numbers
 
 
-def generate_usernames(count):
+def generate_usernames(count, generator=None, blocklist=None):
+    """
+    Generates count usernames with the given EmailGenerator, the one loaded from the database by default.
+    Usernames the blocklist (USERNAME_BLOCKLIST by default) blocks are drawn again, before anything scores them.
+    """
+    if generator is None:
+        generator = get_email_generator()
+    if blocklist is None:
+        blocklist = get_username_blocklist()
     usernames = []
-
-    for _ in range(count):
-        record_username, record_full_email = email_generator.generate_email()
-        usernames.append(record_username)
+    blocked = 0
+
+    with span('generation'):
+        while len(usernames) < count and blocked <= count * MAX_BLOCKED_PER_USERNAME:
+            parts = generator.generate_username_parts()
+            if blocklist.blocks([part for part in parts if part != "_"]):
+                blocked += 1
+                continue
+            usernames.append("".join(parts))
+    if blocked:
+        count_metric('pipeline_candidates_blocked_total', blocked)
+        emit(f"Blocklist: {blocked} generated usernames dropped and drawn again.")
+    count_metric('pipeline_candidates_generated_total', len(usernames))
+    record_generated(len(usernames), generator.mode)
     return {"usernames": usernames}
 
 
-########################
-## Main Script Starts ##
-## Load Database Data ##
-## Use print_loading_data = True to see all processing steps ##
-########################
-
-# Initializing Class Variable & Load Data
-max_retries = 3
-retries = 0
-words_data, names_data, common_years_data, common_numbers_data = None, None, None, None
-
-while retries < max_retries:
+def validate_generator_params(params):
+    """Raises ValueError for an unknown parameter, a weight list of the wrong length or a probability off [0, 1]."""
+    for name, value in params.items():
+        default = DEFAULT_GENERATOR_PARAMS.get(name)
+        if default is None:
+            raise ValueError(f"Unknown generator parameter {name!r}")
+        if isinstance(default, list):
+            if (not isinstance(value, list) or len(value) != len(default) or any(weight < 0 for weight in value)
+                    or sum(value) <= 0):
+                raise ValueError(f"{name} takes {len(default)} non-negative weights, got {value!r}")
+        elif not 0 <= value <= 1:
+            raise ValueError(f"{name} is a probability, got {value!r}")
+    return params
+
+
+def load_generator_params(path=None):
+    """Overrides of DEFAULT_GENERATOR_PARAMS from the EMAIL_GENERATOR_PARAMS file, {} without one."""
+    path = path or EMAIL_GENERATOR_PARAMS
+    if not path:
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return validate_generator_params(json.load(file))
+
+
+def load_email_generator(max_retries=3):
+    """Builds the EmailGenerator from the database, creating the numeric tables if they are missing."""
+    # A broken params file is not a missing table, it fails before the retries
+    params = load_generator_params()
+    retries = 0
+    while retries < max_retries:
+        try:
+            # Read the versions first, a write during the load is picked up by the next refresh
+            versions = load_vocabulary_versions()
+            # Try loading the data
+            words_data, names_data, common_years_data, common_numbers_data = load_data(print_loading_data=False)
+            emit("Data loaded successfully.")
+            if EMAIL_GENERATOR_MODE == 'learned':
+                generator = load_learned_email_generator(words_data, names_data, common_years_data,
+                                                         common_numbers_data, params)
+            else:
+                generator = EmailGenerator(words_data, names_data, common_years_data, common_numbers_data,
+                                           params=params)
+            generator.versions = versions
+            generator.history_version = versions.get(HISTORY_VERSION, 0)
+            return generator
+        except Exception as e:
+            # Handle the error and retry
+            emit(f"Error loading data: {e}")
+            emit("Attempting to create and populate numeric tables...")
+
+            # Execute the function to create and populate the tables
+            create_and_populate_numeric_tables()
+
+            # Increment the retry counter
+            retries += 1
+
+            # If the maximum retries have been reached, stop trying
+            if retries == max_retries:
+                emit("Max retries reached. Could not load data.")
+                raise  # Re-raise the exception to halt execution or handle as needed
+
+
+def fit_pattern_model(words_data, names_data, years_data, numbers_data):
+    """PatternModel fitted to the scoring history over the vocabulary, None while it cannot be fitted."""
+    vocabulary = build_vocabulary(words_data, names_data, years_data, numbers_data)
     try:
-        # Try loading the data
-        words_data, names_data, common_years_data, common_numbers_data = load_data(print_loading_data=False)
-        print("Data loaded successfully.")
-        break  # Exit the loop if loading is successful
+        with span('pattern_model_fit'):
+            return load_pattern_model(vocabulary)
     except Exception as e:
-        # Handle the error and retry
-        print(f"Error loading data: {e}")
-        print("Attempting to create and populate numeric tables...")
+        emit(f"Could not read the scoring history for the learned generator: {e}")
+        return None
 
-        # Execute the function to create and populate the tables
-        create_and_populate_numeric_tables()
 
-        # Increment the retry counter
-        retries += 1
+def load_learned_email_generator(words_data, names_data, years_data, numbers_data, params=None):
+    """LearnedEmailGenerator fitted to the scoring history, the fixed EmailGenerator while it cannot be fitted."""
+    pattern_model = fit_pattern_model(words_data, names_data, years_data, numbers_data)
+    if pattern_model is None:
+        emit("Not enough scoring history for the learned generator yet, using the fixed weights.")
+        return EmailGenerator(words_data, names_data, years_data, numbers_data, params)
+    emit(f"Learned generator fitted to {pattern_model.high_rows} usernames above and "
+         f"{pattern_model.low_rows} below the score threshold.")
+    return LearnedEmailGenerator(words_data, names_data, years_data, numbers_data, pattern_model)
 
-        # If the maximum retries have been reached, stop trying
-        if retries == max_retries:
-            print("Max retries reached. Could not load data.")
-            raise  # Re-raise the exception to halt execution or handle as needed
 
-email_generator = EmailGenerator(words_data, names_data, common_years_data, common_numbers_data)
+def load_vocabulary_versions():
+    db_loader = DatabaseLoader()
+    try:
+        return db_loader.load_versions()
+    finally:
+        db_loader.close_connection()
+
+
+def refit_email_generator(generator, history_version):
+    """
+    The learned generator fitted again to the grown history, over the generator's current vocabulary. A generator
+    still on the fixed weights switches to the learned one once there is enough history, a failed fit keeps it.
+    """
+    emit(f"Scoring history grew by {history_version - generator.history_version} rows, refitting the learned "
+         f"generator...")
+    generator.history_version = history_version
+    pattern_model = fit_pattern_model(generator.words_data, generator.names_data, generator.years_data,
+                                      generator.numbers_data)
+    if pattern_model is None:
+        return generator
+
+    refitted = LearnedEmailGenerator(generator.words_data, generator.names_data, generator.years_data,
+                                     generator.numbers_data, pattern_model)
+    refitted.versions = generator.versions
+    refitted.history_version = history_version
+    emit(f"Learned generator refitted to {pattern_model.high_rows} usernames above and "
+         f"{pattern_model.low_rows} below the score threshold.")
+    return refitted
+
+
+def refresh_email_generator(generator):
+    """
+    Reloads, in place, the vocabulary tables written since the generator loaded them. In the learned mode the
+    generator is returned refitted once PATTERN_MODEL_REFIT_ROWS rows were added to the history since its fit.
+    """
+    db_loader = DatabaseLoader()
+    try:
+        versions = db_loader.load_versions()
+        tables = changed_tables(generator.versions, versions)
+        if tables:
+            with span('vocabulary_reload'):
+                for table in tables:
+                    generator.update_vocabulary(VOCABULARY_TABLES[table], db_loader.load_table(table))
+                    count_metric('pipeline_vocabulary_reloads_total', table=table)
+    finally:
+        db_loader.close_connection()
+
+    generator.versions = versions
+    if tables:
+        emit(f"Vocabulary reloaded: {', '.join(tables)}.")
+
+    history_version = versions.get(HISTORY_VERSION, 0)
+    if EMAIL_GENERATOR_MODE == 'learned' and history_version - generator.history_version >= PATTERN_MODEL_REFIT_ROWS:
+        return refit_email_generator(generator, history_version)
+    return generator
+
+
+# Loaded on first use, so importing this module does not need the database
+email_generator = None
+email_generator_checked_at = 0.0
+email_generator_lock = threading.Lock()
+
+
+def get_email_generator():
+    global email_generator, email_generator_checked_at
+    with email_generator_lock:
+        if email_generator is None:
+            email_generator = load_email_generator()
+            email_generator_checked_at = time.monotonic()
+        elif time.monotonic() - email_generator_checked_at >= VOCABULARY_CHECK_INTERVAL:
+            email_generator_checked_at = time.monotonic()
+            try:
+                email_generator = refresh_email_generator(email_generator)
+            except Exception as e:
+                # Still generates from the vocabulary it has, the next check tries again
+                emit(f"Could not refresh the vocabulary: {e}")
+        return email_generator
+
+
+########################
+## Main Script Starts ##
+## Use print_loading_data = True in load_data to see all processing steps ##
+########################
 
 if __name__ == "__main__":
 
     # Generate 10 emails as an example
-    print("Starting Main Script... \n")
+    emit("Starting Main Script... \n")
     generated_usernames = generate_usernames(10)
 
-    print(generated_usernames)
+    emit(generated_usernames)
 
@@ -8,11 +8,16 @@
 #
 # AI-Driven Evaluation Workflow
 # I. Generate a batch of usernames using controlled random patterns from previously defined datasets.
-# II. Utilize three different AI agents to independently score each username.
+# II. Utilize the AI agents of the agent registry (scoring_agents.json) to independently score each username.
 # III. Aggregate(Sum and Average) the scores from all agents and calculate an average score for each username.
+#    Agents are called one after another - a username already settled above or below the top-N cutoff
+#    skips the remaining agents, which saves their calls without changing the top-N usernames.
 # IV. Sort usernames based on their average score, selecting the top-performing ones.
 # V. Store the top N usernames in a MariaDB database for future use.
 #
+# Each stage leaves a checkpoint (pipeline_checkpoints): a run resumed under its run id reuses the generated
+# usernames, the agent batches already scored and the ranking instead of generating and paying for them again.
+#
 # This allows us to create a controlled environment for generating and evaluating usernames with the help of AI.
 # The scoring process is further enhanced by integrating a database to save well-rated usernames, nullyfing API cost.
 #
@@ -24,129 +29,158 @@
 import json
 import re
 import time
-from openai import OpenAI
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from .agent_scores import aggregate_score_matrix, build_score_matrix, rank_scores
+from .llm_request_scheduler import scoring_scheduler, RequestFailedError
+from .pipeline_events import emit, bind_context, pace
+from .pipeline_checkpoints import batch_checkpoint_key
+from .pipeline_metrics import count, observe, span
+from .pipeline_runs import (load_run_checkpoint, pipeline_run, record_llm_call, record_llm_failure, record_ranking,
+                            record_scoring_plan, save_run_agent_scores, save_run_checkpoint)
+from .scoring_agents import load_scoring_agents, get_openai_client, score_cache
 from .step3_generate_emails_patterns import generate_usernames, load_data
 from .step1_words_generator_and_store_in_MariaDB import connect_to_database
 from .step2_MariaDB_database_engine import interrogate_table, interrogate_scoring_table
 
 
-def emails_scoring_agent_1(list_of_emails, model="gpt-4o-mini", temperature=0.8):
-    client = OpenAI()
-    messages = [
-        {
-            "role": "system",
-            "content": "You are an assistant specializing in evaluating the plausibility of usernames. "
-                       "For each username, you will assign a score from 0.01 (highly unlikely to be real) to "
-                       "0.99 (highly likely to be real) based on patterns, typing flow, sentiment analysis, "
-                       "and other linguistic factors."
-        },
-        {
-            "role": "user",
-            "content": f"""
-Please analyze the following list of usernames and emails. For each username, provide a score between 0.01 and 0.99 
-indicating its likelihood of being real. Return the results in JSON format.
-
-List:
-{list_of_emails}
-
-Example format:
-[
-    {{"username1": score1}},
-    {{"username2": score2}},
-    ...
-]
-"""
-        }
-    ]
-
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=3333
+def estimate_tokens(agent, messages):
+    # Rough estimate (~4 characters per token) until the response reports the real usage
+    return sum(len(message["content"]) for message in messages) // 4 + agent.max_tokens
+
+
+def record_completion_metrics(agent, response, started_at):
+    """Latency and token usage of one agent call (retries and throttling included), for the metrics and run ledger."""
+    elapsed = time.perf_counter() - started_at
+    observe('pipeline_llm_request_duration_seconds', elapsed, agent=agent.name)
+    usage = getattr(response, "usage", None)
+    record_llm_call(agent, elapsed, usage)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens is not None:
+            count('pipeline_llm_tokens_total', tokens, agent=agent.name, kind=kind.split("_")[0])
+
+
+def request_scoring_completion(agent, messages):
+    """Sends one chat completion through the shared client and scheduler (rate limits, retries and timeout)."""
+    client = get_openai_client()
+
+    started_at = time.perf_counter()
+    response = scoring_scheduler.submit(
+        lambda timeout: client.chat.completions.create(
+            model=agent.model,
+            messages=messages,
+            temperature=agent.temperature,
+            max_tokens=agent.max_tokens,
+            timeout=timeout
+        ),
+        estimated_tokens=estimate_tokens(agent, messages)
     )
+    record_completion_metrics(agent, response, started_at)
+    return response.choices[0].message.content
 
-    response_text = response.choices[0].message.content
-    return response_text
-
-
-def emails_scoring_agent_2(list_of_emails, model="gpt-4o-mini", temperature=0.8):
-    client = OpenAI()
-    messages = [
-        {
-            "role": "system",
-            "content": "As an expert in linguistic patterns and user behavior, you evaluate the authenticity "
-                       "of usernames. Score each username from 0.01 "
-                       "(very unlikely to be real) to 0.99 (very likely to be real), "
-                       "considering factors like repetition, typing flow, and sentiment."
-        },
-        {
-            "role": "user",
-            "content": f"""
-Evaluate the following usernames and emails. Assign a score to each username based on 
-its likelihood of being genuine. Provide the results in JSON format.
-
-Usernames and Emails:
-{list_of_emails}
-
-Example format:
-[
-    {{"username1": score1}},
-    {{"username2": score2}},
-    ...
-]
-"""
-        }
-    ]
-
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=3333
-    )
 
-    response_text = response.choices[0].message.content
-    return response_text
-
-
-def emails_scoring_agent_3(list_of_emails, model="gpt-4o-mini", temperature=0.8):
-    client = OpenAI()
-    messages = [
-        {
-            "role": "system",
-            "content": "You are a critical analyzer of usernames, assessing their probability of being real. "
-                       "For each username, provide a score from 0.01 (highly improbable) to 0.99 (highly probable), "
-                       "using insights from patterns, typing flow, and word sentiment."
-        },
-        {
-            "role": "user",
-            "content": f"""
-Analyze the following usernames and emails. 
-For each, assign a probability score and return the results in JSON format.
-
-Data:
-{list_of_emails}
-
-Example format:
-[
-    {{"username1": score1}},
-    {{"username2": score2}},
-    ...
-]
-"""
-        }
-    ]
-
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=3333
-    )
+def score_batch(agent, batch, cached=(), to_score=None):
+    """
+    Scores one batch of usernames with one agent, a call that failed for good scores nothing. cached holds the
+    batch's scores found in the score cache, to_score the usernames still to send (the whole batch by default);
+    the checkpoint keeps the scores of the whole batch, a resume in a process with an empty cache needs them all.
+    """
+    checkpoint_key = batch_checkpoint_key(agent, batch)
+    batch_result = load_run_checkpoint('agent_batch', checkpoint_key)
+    if batch_result is not None:
+        return batch_result
+
+    to_score = batch if to_score is None else to_score
+    batch_result = list(cached)
+    if to_score:
+        messages = agent.build_messages({"usernames": to_score})
+        try:
+            response_text = request_scoring_completion(agent, messages)
+        except RequestFailedError as e:
+            emit(f"{agent.name} failed on a batch of {len(to_score)}, continuing without its scores: {e}")
+            record_llm_failure(agent)
+            return batch_result
+        batch_result.extend(extract_json_from_response(response_text))
+    # A failed batch is not checkpointed, a resumed run asks again
+    save_run_checkpoint('agent_batch', batch_result, checkpoint_key)
+    return batch_result
+
+
+def plan_agent_batches(agent, generated_usernames):
+    """
+    Cuts the usernames into the agent's batches, then looks each batch up in the score cache.
+    The batches (and their checkpoint keys) do not depend on the cache, so a fresh process resuming a run cuts
+    the same ones as the worker that started it. Returns [(batch, cached results, usernames to score), ...].
+    """
+    usernames = list(dict.fromkeys(generated_usernames["usernames"]))
+
+    plan = []
+    cache_hits = to_score_count = 0
+    for i in range(0, len(usernames), agent.batch_size):
+        batch = usernames[i:i + agent.batch_size]
+        cached, to_score = [], []
+        for usern in batch:
+            cached_score = score_cache.get(agent.cache_key(usern))
+            if cached_score is None:
+                to_score.append(usern)
+            else:
+                cached.append({usern: cached_score})
+        plan.append((batch, cached, to_score))
+        cache_hits += len(cached)
+        to_score_count += len(to_score)
+
+    count('pipeline_score_cache_hits_total', cache_hits, agent=agent.name)
+    count('pipeline_score_cache_misses_total', to_score_count, agent=agent.name)
+    count('pipeline_candidates_scored_total', to_score_count, agent=agent.name)
+    record_scoring_plan(agent, to_score_count, cache_hits)
+    if cache_hits:
+        emit(f"{agent.name}: {cache_hits} scores reused from cache.")
+    return plan
+
+
+def collect_batch_scores(agent, batch, batch_result, results):
+    """Adds the scores of one batch to results (and the cache), anything the agent made up is ignored."""
+    batch_set = set(batch)
+    for usern, score in iter_agent_scores(batch_result):
+        if usern in batch_set:
+            score_cache.set(agent.cache_key(usern), score)
+            results.append({usern: score})
+
+
+def score_with_agent(agent, generated_usernames):
+    """
+    Scores the usernames with one registry agent, returns the parsed [{username: score}, ...] list and the number
+    of usernames sent to the agent. Cached scores are reused, the rest is split into the agent's batch size and
+    sent concurrently.
+    """
+    results = []
+    with span('agent_scoring', agent=agent.name):
+        plan = plan_agent_batches(agent, generated_usernames)
+
+        # Batches run on the executor's threads but still report to this run's event sink
+        score_in_context = bind_context(lambda planned: score_batch(agent, *planned))
+        for (batch, _, _), batch_result in zip(plan, batch_executor.map(score_in_context, plan)):
+            collect_batch_scores(agent, batch, batch_result, results)
+
+    save_run_agent_scores(agent, results)
+    return results, sum(len(to_score) for _, _, to_score in plan)
 
-    response_text = response.choices[0].message.content
-    return response_text
+
+def run_scoring_agent(agent, generated_usernames):
+    """Scores the usernames with one registry agent and returns the parsed [{username: score}, ...] list."""
+    return score_with_agent(agent, generated_usernames)[0]
+
+
+# Scale the agents are prompted to score on
+SCORE_MIN = 0.01
+SCORE_MAX = 0.99
+
+# Ensemble members in call order, as configured in the agent registry (scoring_agents.json)
+SCORING_AGENTS = load_scoring_agents()
+
+# Batches of one agent are sent concurrently, the scheduler still caps the calls actually in flight
+batch_executor = ThreadPoolExecutor(max_workers=scoring_scheduler.max_concurrency)
 
 
 def extract_json_from_response(response_text):
@@ -162,110 +196,324 @@ def extract_json_from_response(response_text):
             # Convert it into a valid Python object
             return json.loads(json_string)
         except json.JSONDecodeError:
-            print("Error: Failed to parse JSON from the extracted string.")
-            print(f"Extracted string: {json_string}")
+            emit("Error: Failed to parse JSON from the extracted string.")
+            emit(f"Extracted string: {json_string}")
             return []
     else:
-        print("Error: Failed to find JSON-like part in the response.")
+        emit("Error: Failed to find JSON-like part in the response.")
         return []
 
 
-def calculate_average_scores(agent_results):
-    average_scores = {}
+def iter_agent_scores(agent_result):
+    """
+    Yields (username, score) pairs from one agent's parsed result.
+    Malformed entries are skipped and scores are clamped to the prompt's 0.01 - 0.99 scale.
+    """
+    for entry in agent_result:
+        if not isinstance(entry, dict):
+            continue
+        for usern, score in entry.items():
+            try:
+                score = float(score)
+            except (TypeError, ValueError):
+                continue
+            yield usern, min(max(score, SCORE_MIN), SCORE_MAX)
 
-    for agent_result in agent_results:
-        # Each agent_result is a list of dictionaries
-        for entry in agent_result:
-            # Each entry is a dictionary with one key-value pair
-            for usern, score in entry.items():
-                if usern not in average_scores:
-                    average_scores[usern] = 0
-                average_scores[usern] += score
 
-    # Divide each total score by the number of agents to get the average
-    num_agents = len(agent_results)
-    for usern in average_scores:
-        average_scores[usern] /= num_agents
+def accumulate_agent_scores(agent_result, weight, totals, weight_sums):
+    """Adds one agent's weighted scores into the per-username running totals."""
+    for usern, score in iter_agent_scores(agent_result):
+        totals[usern] = totals.get(usern, 0) + weight * score
+        weight_sums[usern] = weight_sums.get(usern, 0) + weight
 
-    # Sort usernames by score, from high to low
-    sorted_usern = sorted(average_scores.items(), key=lambda x: x[1], reverse=True)
 
-    return sorted_usern
+def calculate_average_scores(agent_results, weights=None):
+    """
+    Weighted average of the agents' scores, sorted from high to low.
+    Each username is divided by the weight of the agents that actually scored it,
+    so a username one agent left out is not pulled down by a missing score.
+    """
+    if weights is None:
+        weights = [1.0] * len(agent_results)
 
+    # Same vectorized aggregation as the re-ranking of the stored history (manage.py rerank_scores)
+    usernames, scores = build_score_matrix([iter_agent_scores(agent_result) for agent_result in agent_results])
+    return rank_scores(usernames, aggregate_score_matrix(scores, weights))
 
-def generate_usernames_with_AI_Scoring_agents(no_of_raw, no_of_sorted):
-    # Generate usernames
-    print("Phase I: Generating usernames...")
+
+def score_bounds(total, weight_sum, remaining_weight, early_exit_margin=None):
+    """
+    Lowest and highest final average a username can still reach once the remaining agents have scored it.
+    Without a margin the remaining agents may score anywhere on the scale (exact bound), with a margin
+    they are assumed to land within +/- early_exit_margin of the current interim score.
+    """
+    if weight_sum == 0:
+        return SCORE_MIN, SCORE_MAX
+    interim = total / weight_sum
+    if remaining_weight == 0:
+        return interim, interim
+
+    low_score, high_score = SCORE_MIN, SCORE_MAX
+    if early_exit_margin is not None:
+        low_score = max(SCORE_MIN, interim - early_exit_margin)
+        high_score = min(SCORE_MAX, interim + early_exit_margin)
+
+    # An agent omitting the username leaves the interim as is, which lies between both bounds
+    low = min(interim, (total + remaining_weight * low_score) / (weight_sum + remaining_weight))
+    high = max(interim, (total + remaining_weight * high_score) / (weight_sum + remaining_weight))
+    return low, high
+
+
+def split_decided_usernames(bounds, top_k):
+    """
+    Splits usernames into (accepted, rejected, undecided) against the top-K cutoff.
+    A username is accepted when fewer than top_k others could still tie or beat its lowest reachable score,
+    and rejected when at least top_k others are already certain to beat its highest reachable score.
+    """
+    lows = sorted(low for low, _ in bounds.values())
+    highs = sorted(high for _, high in bounds.values())
+    n = len(bounds)
+
+    accepted, rejected, undecided = [], [], []
+    for usern, (low, high) in bounds.items():
+        # Others whose highest score reaches our lowest one (ourselves excluded, high >= low always holds)
+        could_beat = n - bisect_left(highs, low) - 1
+        # Others whose lowest score is strictly above our highest one
+        sure_to_beat = n - bisect_right(lows, high)
+
+        if could_beat < top_k:
+            accepted.append(usern)
+        elif sure_to_beat >= top_k:
+            rejected.append(usern)
+        else:
+            undecided.append(usern)
+
+    return accepted, rejected, undecided
+
+
+# Storage of each cycle's top usernames, one row per username: a username ranked again in a later cycle keeps
+# its best score and counts one more hit instead of taking another row (and another top-N slot)
+CREATE_HIGH_RATED_UNAMES_QUERY = '''
+CREATE TABLE IF NOT EXISTS high_rated_unames (
+    ID INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(255) NOT NULL UNIQUE,
+    score DECIMAL(5,2) NOT NULL,
+    hit_count INT NOT NULL DEFAULT 1
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
+'''
+
+INSERT_HIGH_RATED_UNAMES_QUERY = '''
+INSERT INTO high_rated_unames (username, score) VALUES (%s, %s)
+ON DUPLICATE KEY UPDATE score = GREATEST(score, VALUES(score)), hit_count = hit_count + 1
+'''
+
+
+class ProgressiveEnsemble:
+    """
+    State of a progressive ensemble run: the agents are called one after another, and after each agent
+    every username whose place relative to the top-K cutoff is already settled is dropped, so the remaining
+    agents only score the undecided ones. The caller sends `undecided` to `next_agent` and hands the
+    result to record(), which keeps the calling itself (blocking or asyncio) outside of this class.
+    """
+
+    def __init__(self, generated_usernames, top_k, agents, early_exit_margin=None):
+        self.candidates = list(dict.fromkeys(generated_usernames["usernames"]))
+        self.top_k = top_k
+        self.agents = agents
+        self.early_exit_margin = early_exit_margin
+        self.totals = {usern: 0.0 for usern in self.candidates}
+        self.weight_sums = {usern: 0.0 for usern in self.candidates}
+        # Bounds of usernames decided in an earlier round, so later rounds compare against every reachable outcome
+        self.frozen_bounds = {}
+        self.accepted, self.rejected = [], []
+        self.undecided = self.candidates
+        self.agent_index = 0
+        self.agent_calls = 0
+
+    @property
+    def next_agent(self):
+        """The agent to call next, None once every agent has had its turn."""
+        return self.agents[self.agent_index] if self.agent_index < len(self.agents) else None
+
+    def skip_agent(self):
+        emit(f"Skipping {self.next_agent.name}: every username is already decided.")
+        self.agent_index += 1
+
+    def record(self, result, scored=None):
+        """
+        Adds the next agent's scores for the undecided usernames and settles whatever can be settled.
+        scored is the number of usernames the agent was actually asked for (its cache misses), all of them if None.
+        """
+        agent = self.next_agent
+        self.agent_index += 1
+        self.agent_calls += len(self.undecided) if scored is None else scored
+        accumulate_agent_scores(result, agent.weight, self.totals, self.weight_sums)
+
+        remaining_weight = sum(next_agent.weight for next_agent in self.agents[self.agent_index:])
+        bounds = dict(self.frozen_bounds)
+        for usern in self.undecided:
+            bounds[usern] = score_bounds(self.totals[usern], self.weight_sums[usern], remaining_weight,
+                                         self.early_exit_margin)
+
+        round_accepted, round_rejected, undecided = split_decided_usernames(bounds, self.top_k)
+        round_accepted = [usern for usern in round_accepted if usern not in self.frozen_bounds]
+        round_rejected = [usern for usern in round_rejected if usern not in self.frozen_bounds]
+        self.undecided = [usern for usern in undecided if usern not in self.frozen_bounds]
+        for usern in round_accepted + round_rejected:
+            self.frozen_bounds[usern] = bounds[usern]
+        self.accepted.extend(round_accepted)
+        self.rejected.extend(round_rejected)
+
+        if remaining_weight and (round_accepted or round_rejected):
+            emit(f"Early exit after {agent.name}: {len(round_accepted)} accepted, "
+                 f"{len(round_rejected)} rejected, {len(self.undecided)} left for the next agents.")
+
+    def _ranked(self, usernames):
+        scored = [(usern, self.totals[usern] / self.weight_sums[usern])
+                  for usern in usernames if self.weight_sums[usern] > 0]
+        return sorted(scored, key=lambda x: x[1], reverse=True)
+
+    def ranked_usernames(self):
+        """
+        The ranked (username, score) list in the same shape as calculate_average_scores.
+        Accepted usernames come first, then undecided, then rejected ones (each by score),
+        so taking the first top_k entries yields the same usernames as scoring everything with every agent.
+        """
+        ranked_usernames = self._ranked(self.accepted) + self._ranked(self.undecided) + self._ranked(self.rejected)
+        accepted_count = max(1, min(self.top_k, len(ranked_usernames)))
+        emit(f"Progressive ensemble used {self.agent_calls} username scorings "
+             f"({self.agent_calls / accepted_count:.2f} per accepted username, "
+             f"{len(self.agents) * len(self.candidates)} with the full ensemble).")
+        return ranked_usernames
+
+
+def progressive_ensemble_scoring(generated_usernames, top_k, agents=None, early_exit_margin=None):
+    """Runs a ProgressiveEnsemble with blocking agent calls and returns its ranked usernames."""
+    ensemble = ProgressiveEnsemble(generated_usernames, top_k, agents or SCORING_AGENTS, early_exit_margin)
+
+    while ensemble.next_agent is not None:
+        agent = ensemble.next_agent
+        if not ensemble.undecided:
+            ensemble.skip_agent()
+            continue
+
+        emit(f"Calling {agent.name} for scoring ({len(ensemble.undecided)} undecided usernames)...")
+        result, scored = score_with_agent(agent, {"usernames": ensemble.undecided})
+        emit(f"{agent.name} Results: {json.dumps(result, separators=(',', ':'), ensure_ascii=False)}\n")
+        with span('aggregation'):
+            ensemble.record(result, scored)
+
+    return ensemble.ranked_usernames()
+
+
+def generate_usernames_with_AI_Scoring_agents(no_of_raw, no_of_sorted, progressive=True, early_exit_margin=None,
+                                              run_id=None):
+    # Recorded in the run ledger (pipeline_runs), as a run of its own when called outside of main_script.
+    # A run_id of a failed run resumes it from its checkpoints.
+    with pipeline_run(run_id=run_id):
+        generate_score_and_store_usernames(no_of_raw, no_of_sorted, progressive, early_exit_margin)
+
+
+def load_generated_usernames(no_of_raw):
+    """The cycle's usernames, from the run's checkpoint when resuming."""
+    generated_usernames = load_run_checkpoint('generated')
+    if generated_usernames is not None:
+        emit("Phase I: Reusing the usernames generated before the run was interrupted...")
+        return generated_usernames
+
+    emit("Phase I: Generating usernames...")
     generated_usernames = generate_usernames(no_of_raw)
-    print(f"Generated Usernames: {generated_usernames}\n")
-
-    # Call all three agents
-    print("Calling Agent 1 for scoring...")
-    result_1_raw = emails_scoring_agent_1(generated_usernames)
-    result_1 = extract_json_from_response(result_1_raw)
-    print(f"Agent 1 Results: {json.dumps(result_1, separators=(',', ':'), ensure_ascii=False)}\n")
-
-    print("Calling Agent 2 for scoring...")
-    result_2_raw = emails_scoring_agent_2(generated_usernames)
-    result_2 = extract_json_from_response(result_2_raw)
-    print(f"Agent 2 Results: {json.dumps(result_2, separators=(',', ':'), ensure_ascii=False)}\n")
-
-    print("Calling Agent 3 for scoring...")
-    result_3_raw = emails_scoring_agent_3(generated_usernames)
-    result_3 = extract_json_from_response(result_3_raw)
-    print(f"Agent 3 Results: {json.dumps(result_3, separators=(',', ':'), ensure_ascii=False)}\n")
-    time.sleep(0.55)
-
-    # Collect results from all agents
-    print("Aggregating results from all agents...")
-    time.sleep(1.5)
-    all_agent_results = [result_1, result_2, result_3]
-
-    # Calculate the average scores and sort the usernames
-    print("\nCalculating average scores and sorting usernames...")
-    time.sleep(1.33)
-    sorted_usernames = calculate_average_scores(all_agent_results)
-
-    # Pretty print the results and collect top usernames
-    # print("\nAll processed Usernames ranked by average score (from high to low):")
-    time.sleep(0.55)
-    top_usernames = []
-    for idx, (username, avg_score) in enumerate(sorted_usernames):
-        # print(f"Username: {username}, Average Score: {avg_score:.2f}")
-        if idx < no_of_sorted:
-            top_usernames.append((username, avg_score))
-
-    time.sleep(1)
-    print(f"Calculated High-Performing usernames from this cycle: {top_usernames}")
-    time.sleep(1.33)
+    save_run_checkpoint('generated', generated_usernames)
+    return generated_usernames
+
+
+def ranked_usernames_from_checkpoint(sorted_usernames):
+    """The (username, score) ranking of an 'aggregated' checkpoint, None when there is none."""
+    if sorted_usernames is None:
+        return None
+    emit("Reusing the scores aggregated before the run was interrupted...")
+    return [(username, score) for username, score in sorted_usernames]
+
+
+def load_ranked_usernames():
+    """The (username, score) ranking of the run's checkpoint, None when it has not been ranked yet."""
+    return ranked_usernames_from_checkpoint(load_run_checkpoint('aggregated'))
+
+
+def generate_score_and_store_usernames(no_of_raw, no_of_sorted, progressive=True, early_exit_margin=None):
+    if load_run_checkpoint('stored') is not None:
+        emit("The usernames of this cycle were stored before the run was interrupted, skipping to the next step.")
+        return
+
+    # Generate usernames
+    generated_usernames = load_generated_usernames(no_of_raw)
+    emit(f"Generated Usernames: {generated_usernames}\n")
+
+    sorted_usernames = load_ranked_usernames()
+    if sorted_usernames is not None:
+        pace(0.55)
+    elif progressive:
+        # Call the agents one by one, skipping usernames already settled above or below the top-K cutoff
+        sorted_usernames = progressive_ensemble_scoring(generated_usernames, no_of_sorted,
+                                                        early_exit_margin=early_exit_margin)
+        pace(0.55)
+    else:
+        # Call all agents
+        all_agent_results = []
+        for agent in SCORING_AGENTS:
+            emit(f"Calling {agent.name} for scoring...")
+            result = run_scoring_agent(agent, generated_usernames)
+            emit(f"{agent.name} Results: {json.dumps(result, separators=(',', ':'), ensure_ascii=False)}\n")
+            all_agent_results.append(result)
+        pace(0.55)
+
+        # Collect results from all agents
+        emit("Aggregating results from all agents...")
+        pace(1.5)
+
+        # Calculate the average scores and sort the usernames
+        emit("\nCalculating average scores and sorting usernames...")
+        pace(1.33)
+        with span('aggregation'):
+            sorted_usernames = calculate_average_scores(all_agent_results,
+                                                        weights=[agent.weight for agent in SCORING_AGENTS])
+
+    save_run_checkpoint('aggregated', sorted_usernames)
+
+    # Collect the top usernames
+    pace(0.55)
+    top_usernames = sorted_usernames[:no_of_sorted]
+    record_ranking(sorted_usernames, len(top_usernames))
+
+    scheduler_metrics = scoring_scheduler.metrics()
+    emit(f"Scheduler: {scheduler_metrics['requests']} requests, {scheduler_metrics['retries']} retries, "
+         f"{scheduler_metrics['throttled']} throttled ({scheduler_metrics['throttled_seconds']:.2f}s), "
+         f"{scheduler_metrics['failed']} failed, {scheduler_metrics['queued']} queued.")
+
+    pace(1)
+    emit(f"Calculated High-Performing usernames from this cycle: {top_usernames}")
+    pace(1.33)
     ###########################
     # Connect to the database
     # Store top no_of_sorted usernames
     #####################################
 
-    conn = connect_to_database()
-    cursor = conn.cursor()
-
-    # Create the table if it doesn't exist
-    create_table_query = '''
-    CREATE TABLE IF NOT EXISTS high_rated_unames (
-        ID INT AUTO_INCREMENT PRIMARY KEY,
-        username VARCHAR(255) NOT NULL,
-        score DECIMAL(5,2) NOT NULL
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
-    '''
-    cursor.execute(create_table_query)
-    conn.commit()
-
-    # Insert the top usernames into the table
-    insert_query = '''
-    INSERT INTO high_rated_unames (username, score) VALUES (%s, %s)
-    '''
-    cursor.executemany(insert_query, top_usernames)
-    conn.commit()
-
-    print(f"\nInserted top {no_of_sorted} high scoring usernames into the database (high_rated_unames).")
-    time.sleep(1.33)
+    with span('store_top_usernames'):
+        conn = connect_to_database()
+        cursor = conn.cursor()
+
+        # Create the table if it doesn't exist
+        cursor.execute(CREATE_HIGH_RATED_UNAMES_QUERY)
+        conn.commit()
+
+        # Insert the top usernames into the table
+        cursor.executemany(INSERT_HIGH_RATED_UNAMES_QUERY, top_usernames)
+        conn.commit()
+    count('pipeline_db_rows_written_total', len(top_usernames), table='high_rated_unames')
+    save_run_checkpoint('stored', len(top_usernames))
+
+    emit(f"\nInserted top {no_of_sorted} high scoring usernames into the database (high_rated_unames).")
+    pace(1.33)
 
     # Close the database connection
     cursor.close()
@@ -23,8 +23,8 @@
 # ###################################### ###################################### #
 
 import time
-import requests
-from .step3_generate_emails_patterns import email_generator
+from .pipeline_events import emit, pace
+from .pipeline_metrics import count, span
 from .step2_MariaDB_database_engine import connect_to_database, interrogate_table, \
     interrogate_final_table
 import os
@@ -36,19 +36,48 @@ load_dotenv()
 # Access the environment variables
 API_KEY = os.getenv('API_KEY')
 SEARCH_ENGINE_ID = os.getenv('SEARCH_ENGINE_ID')
+# WEB_SEARCH_ENABLED=0 skips the Google lookups (offline and load testing), every username then has no results
+WEB_SEARCH_ENABLED = os.getenv('WEB_SEARCH_ENABLED', '1') != '0'
+
+
+def scoring_usernames_query(table='high_rated_unames', limit=10):
+    return f'''
+    SELECT ID, username, score FROM `{table}` order by score desc LIMIT {int(limit)};
+    '''
+
+
+def delete_checked_query(table, no_of_ids):
+    placeholders = ', '.join(['%s'] * no_of_ids)
+    return f'''
+    DELETE FROM `{table}` WHERE ID IN ({placeholders});
+    '''
+
+
+# Final Production Table
+CREATE_FINAL_TABLE_QUERY = '''
+CREATE TABLE IF NOT EXISTS high_probability_real_usernames (
+    ID INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(255) NOT NULL UNIQUE,
+    search_result_title VARCHAR(255) NOT NULL,
+    url VARCHAR(255) NOT NULL
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
+'''
+
+INSERT_FINAL_TABLE_QUERY = '''
+INSERT IGNORE INTO high_probability_real_usernames (username, search_result_title, url) 
+VALUES (%s, %s, %s)
+'''
 
 
 def interrogate_scoring_table(limit=10, table='high_rated_unames', remove_checked=False):
     # Connect to the database
     conn = connect_to_database()
     cur = conn.cursor()
-    print(f"\nLoading Data from All time AI High scoring usernames (Production Table) "
-          f"\n(First Top {limit} Records as selected by User, to be processed in Search Engine)..")
-    time.sleep(0.44)
+    emit(f"\nLoading Data from All time AI High scoring usernames (Production Table) "
+         f"\n(First Top {limit} Records as selected by User, to be processed in Search Engine)..")
+    pace(0.44)
     # Fetch the table data using the dynamic table name and limit
-    cur.execute(f'''
-    SELECT ID, username, score FROM `{table}` order by score desc LIMIT {limit};
-    ''')
+    cur.execute(scoring_usernames_query(table, limit))
 
     # Fetch the rows
     rows = cur.fetchall()
@@ -64,11 +93,10 @@ def interrogate_scoring_table(limit=10, table='high_rated_unames', remove_checke
     # If the flag is set, remove these records from the table
     if remove_checked:
         # Collect IDs to delete
-        ids_to_remove = tuple([row[0] for row in rows])  # IDs from the fetched rows
-        cur.execute(f'''
-        DELETE FROM `{table}` WHERE ID IN {ids_to_remove};
-        ''')
-        conn.commit()  # Commit the changes to the database
+        ids_to_remove = [row[0] for row in rows]  # IDs from the fetched rows
+        if ids_to_remove:
+            cur.execute(delete_checked_query(table, len(ids_to_remove)), ids_to_remove)
+            conn.commit()  # Commit the changes to the database
 
     # Close the cursor and connection
     cur.close()
@@ -79,6 +107,9 @@ def interrogate_scoring_table(limit=10, table='high_rated_unames', remove_checke
 
 
 def google_search(query):
+    if not WEB_SEARCH_ENABLED:
+        return []
+
     url = "https://www.googleapis.com/customsearch/v1"
     params = {
         'key': API_KEY,
@@ -86,75 +117,87 @@ def google_search(query):
         'q': query
     }
 
+    # requests is only needed once a search is made, not to import the views
+    import requests
+
     response = requests.get(url, params=params)
 
     if response.status_code == 200:
         search_result = response.json()
         return search_result.get('items', [])  # Returns the list of search results
     else:
-        print("Error:", response.status_code, response.text)
+        emit("Error:", response.status_code, response.text)
         return []
 
 
+def match_search_results(record_username, search_results, exact_search_engine_match=False):
+    """Returns the first search result backing the username (as a Final Production Table entry), or None."""
+    # If no results found, ignore
+    if not search_results:
+        emit(f"No search results found for {record_username}. Disregarding username..")
+        return None
+
+    for result in search_results:
+        snippet = result['snippet']
+
+        # Check for an exact match of the username within the snippet
+        if record_username in snippet.split() or not exact_search_engine_match:
+            # Print that the username is being saved, only the first valid result is kept
+            if exact_search_engine_match:
+                emit(f"Exact match found! Saving *{record_username}* into high_probability_real_usernames...")
+            else:
+                emit(f"Close match found! Saving *{record_username}* into high_probability_real_usernames...")
+            return {
+                'username': record_username,
+                'title': result['title'],
+                'snippet': snippet,
+                'url': result['link']
+            }
+    return None
+
+
 def scrape_google_for_validity(no_of_records, remove_record_after=False, exact_search_engine_match=False):
     # With Remove_checked=True, usernames are disregarded from database
     AI_high_scoring_usernames = interrogate_scoring_table(limit=no_of_records, remove_checked=remove_record_after)
-    print(AI_high_scoring_usernames)
+    emit(AI_high_scoring_usernames)
 
     if remove_record_after:
-        print("Notice! Remove Option ticked, usernames will be removed from Database.high_rated_unames "
-              "after being processed in current cycle."
-              "The ones which qualify will be saved in Final Production table.")
+        emit("Notice! Remove Option ticked, usernames will be removed from Database.high_rated_unames "
+             "after being processed in current cycle."
+             "The ones which qualify will be saved in Final Production table.")
     # Initialize a list to store high-probability real usernames with their search results
     high_probability_real_usernames = []
 
     # Step 2: Loop through the usernames and perform Google search
     for record_username in AI_high_scoring_usernames:
         # Step 3: Search for the username on Google
-        search_results = google_search(record_username)
-        print(f"\nSearching for *{record_username}*...")
+        with span('web_search'):
+            search_results = google_search(record_username)
+        emit(f"\nSearching for *{record_username}*...")
         # Step 4: Check all search results to find an exact match in the snippet
-        exact_result_found = False
-        if search_results:
-            for result in search_results:
-                snippet = result['snippet']
-
-                # Check for an exact match of the username within the snippet
-                if record_username in snippet.split() or not exact_search_engine_match:
-                    high_probability_real_usernames.append({
-                        'username': record_username,
-                        'title': result['title'],
-                        'snippet': snippet,
-                        'url': result['link']
-                    })
-
-                    # Print that the username is being saved and break after saving the first valid result
-                    if exact_search_engine_match:
-                        print(f"Exact match found! Saving *{record_username}* into high_probability_real_usernames...")
-                        exact_result_found = True
-                        break  # Stop checking after the first valid result is found
-                    else:
-                        print(f"Close match found! Saving *{record_username}* into high_probability_real_usernames...")
-                        break
-
-        # If no results found, ignore
-        else:
-            print(f"No search results found for {record_username}. Disregarding username..")
-
-        # Step 5: Introduce a delay before the next iteration
-        time.sleep(1.3)
+        match = match_search_results(record_username, search_results, exact_search_engine_match)
+        if match:
+            high_probability_real_usernames.append(match)
+
+        # Step 5: Introduce a delay before the next iteration (search API pacing)
+        if WEB_SEARCH_ENABLED:
+            time.sleep(1.3)
 
     # Optional: Print out the saved usernames for review
-    print(f"\nTotal usernames saved to Final Production Table: {len(high_probability_real_usernames)}")
+    emit(f"\nTotal usernames saved to Final Production Table: {len(high_probability_real_usernames)}")
     for entry in high_probability_real_usernames:
-        print(f"Username: {entry['username']}, Search Result Title: {entry['title']}, URL: {entry['url']}")
-        time.sleep(0.15)
+        emit(f"Username: {entry['username']}, Search Result Title: {entry['title']}, URL: {entry['url']}")
+        pace(0.15)
 
-    time.sleep(1)
+    pace(1)
 
     return high_probability_real_usernames
 
 
+def final_table_rows(usernames_list):
+    return [(entry['username'], entry['title'], entry['url']) for entry in usernames_list]
+
+
 def save_final_high_prob_users(usernames_list):
     # Connect to the database
 
@@ -162,29 +205,16 @@ def save_final_high_prob_users(usernames_list):
     cursor = conn.cursor()
 
     # Create the table if it doesn't exist
-    create_table_query = '''
-    CREATE TABLE IF NOT EXISTS high_probability_real_usernames (
-        ID INT AUTO_INCREMENT PRIMARY KEY,
-        username VARCHAR(255) NOT NULL UNIQUE,
-        search_result_title VARCHAR(255) NOT NULL,
-        url VARCHAR(255) NOT NULL
-    ) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
-    '''
-    cursor.execute(create_table_query)
+    cursor.execute(CREATE_FINAL_TABLE_QUERY)
     conn.commit()
 
-    # Insert the results into the database
-    insert_query = '''
-    INSERT IGNORE INTO high_probability_real_usernames (username, search_result_title, url) 
-    VALUES (%s, %s, %s)
-    '''
-
     # Prepare the data to insert
-    data_to_insert = [(entry['username'], entry['title'], entry['url']) for entry in usernames_list]
+    data_to_insert = final_table_rows(usernames_list)
 
     # Insert the data into the table
-    cursor.executemany(insert_query, data_to_insert)
+    cursor.executemany(INSERT_FINAL_TABLE_QUERY, data_to_insert)
     conn.commit()
+    count('pipeline_db_rows_written_total', len(data_to_insert), table='high_probability_real_usernames')
 
     # Close the database connection
     cursor.close()
@@ -22,7 +22,7 @@
 # ###################################### ###################################### #
 
 
-import time
+from .pipeline_events import pace
 from .step2_MariaDB_database_engine import (connect_to_database, interrogate_table, \
                                            interrogate_final_table, insert_into_table, delete_table, separate_names,
                                            create_and_populate_numeric_tables,
@@ -92,19 +92,6 @@ fetch_top_production_records = 10
 remove_record_after = False
 
 
-# Regenerate Original Dataset using Pre-Defined Model: Provide Min and Max Letters blueprints
-if regenerate_original_datasets:
-    regenerate_original_data(3, 5)
-
-if upload_your_own_data:
-    process_user_file_and_insert_data(overwrite=overwrite_existing_data)
-
-
-# Words & Names Data Base Model has been generated at this point, whether
-# 1. We're using our own Database of words&names
-# 2. Using strictly user provided base model
-# or 3. An integration of both
-
 ########################
 ########################
 ## Main Script Starts ##
@@ -115,7 +102,7 @@ def main_script():
     # Generate usernames based on chosen Dataset and Email Patterns Neural Network
     generate_usernames_with_AI_Scoring_agents(no_of_raw=no_of_raw_generated_usernames,
                                               no_of_sorted=int(no_of_raw_generated_usernames / 7))
-    time.sleep(1.5)
+    pace(1.5)
 
     limit_ai_high_scoring_records = 5
     # Review Current High Scoring usernames
@@ -142,4 +129,21 @@ def main_script():
     interrogate_final_table(fetch_top_production_records)
 
 
-main_script()
+
+# Runs only as a script (python -m core.step6_UI), importing the module has no side effects.
+# Headless and batch runs: python manage.py run_pipeline
+if __name__ == "__main__":
+
+    # Regenerate Original Dataset using Pre-Defined Model: Provide Min and Max Letters blueprints
+    if regenerate_original_datasets:
+        regenerate_original_data(3, 5)
+
+    if upload_your_own_data:
+        process_user_file_and_insert_data(overwrite=overwrite_existing_data)
+
+    # Words & Names Data Base Model has been generated at this point, whether
+    # 1. We're using our own Database of words&names
+    # 2. Using strictly user provided base model
+    # or 3. An integration of both
+
+    main_script()
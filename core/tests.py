@@ -1,3 +1,829 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase
+
+from . import agent_scores, async_pipeline, generator_sweep, pipeline_checkpoints, pipeline_runs, views
+from . import step1_words_generator_and_store_in_MariaDB as step1
+from . import step2_MariaDB_database_engine as step2
+from . import step3_generate_emails_patterns as step3
+from . import step4_scoring_potential_records_wLLM as step4
+from .agent_scores import aggregate_score_matrix, rank_scores
+from .benchmarks import sqlite_query
+from .generator_sweep import ProxyScorer, evaluate_configuration, init_sweep_worker
+from .history_retention import ensure_history_partitions, expired_partitions
+from .learned_patterns import (END, FIRST_ELEMENT_TYPES, MAX_ELEMENTS, MIN_ELEMENTS, NUMERIC_TYPES,
+                               PATTERN_MODEL_REFIT_ROWS, START, PatternModel)
+from .llm_request_scheduler import RequestFailedError, RequestScheduler
+from .pipeline_events import event_sink
+from .pipeline_jobs import PipelineJob, job_event_stream
+from .pipeline_profiling import list_profiles
+from .pipeline_runs import pipeline_run, record_generated, record_ranking
+from .results_api import decode_cursor, encode_cursor, results_page_query
+from .scoring_agents import ScoreCache
+from .step3_generate_emails_patterns import EmailGenerator, LearnedEmailGenerator, refresh_email_generator
+from .step4_scoring_potential_records_wLLM import (ProgressiveEnsemble, calculate_average_scores, run_scoring_agent,
+                                                  score_batch)
+from .username_blocklist import BlocklistAutomaton, load_blocklist_terms
+from .vocabulary_builds import build_inputs, load_build_inputs, save_build_inputs
+from .vocabulary_versions import HISTORY_VERSION, changed_tables
+
+
+def quiet():
+    """Event sink dropping the pipeline's output, so the tests do not print it."""
+    return event_sink(lambda event: None)
+
+
+class SQLiteCursor:
+    """MariaDB cursor stand-in running the step modules' statements on SQLite, translated as in the benchmarks."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=()):
+        self.cursor.execute(sqlite_query(query), [str(param) if isinstance(param, Decimal) else param
+                                                  for param in params])
+
+    def executemany(self, query, rows):
+        self.cursor.executemany(sqlite_query(query), rows)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, *args, **kwargs):
+        return SQLiteCursor(self.database.cursor())
+
+    def commit(self):
+        self.database.commit()
+
+    def close(self):
+        pass
+
+
+class AsyncSQLiteCursor(SQLiteCursor):
+    """aiomysql cursor stand-in, every statement it ran is kept in queries."""
+
+    def __init__(self, cursor, queries):
+        super().__init__(cursor)
+        self.queries = queries
+
+    async def execute(self, query, params=()):
+        self.queries.append(query)
+        super().execute(query, params)
+
+    async def executemany(self, query, rows):
+        self.queries.append(query)
+        super().executemany(query, rows)
+
+    async def fetchone(self):
+        return super().fetchone()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class AsyncSQLitePool:
+    """aiomysql pool stand-in on the same SQLite database."""
+
+    def __init__(self, database):
+        self.database = database
+        self.queries = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    def cursor(self):
+        return AsyncSQLiteCursor(self.database.cursor(), self.queries)
+
+    async def commit(self):
+        self.database.commit()
+
+
+@contextmanager
+def sqlite_database(*modules):
+    """One in-memory SQLite database behind connect_to_database() of every given module."""
+    database = sqlite3.connect(':memory:', check_same_thread=False)
+    with ExitStack() as stack:
+        # A new database has none of the tables the process created so far
+        stack.enter_context(mock.patch.object(step2, 'created_tables', set()))
+        for module in modules:
+            stack.enter_context(mock.patch.object(module, 'connect_to_database',
+                                                  lambda: SQLiteConnection(database)))
+        yield database
+    database.close()
+
+
+class ProgressiveEnsembleTests(SimpleTestCase):
+    def setUp(self):
+        rnd = random.Random(7)
+        self.usernames = [f"user{i}" for i in range(60)]
+        self.agents = [SimpleNamespace(name=f"agent{i}", weight=weight) for i, weight in enumerate([2.0, 1.0, 0.5])]
+        self.scores = [{usern: rnd.uniform(0.01, 0.99) for usern in self.usernames} for _ in self.agents]
+
+    def run_ensemble(self, top_k, early_exit_margin=None):
+        ensemble = ProgressiveEnsemble({'usernames': self.usernames}, top_k, self.agents, early_exit_margin)
+        with quiet():
+            while ensemble.next_agent is not None:
+                if not ensemble.undecided:
+                    ensemble.skip_agent()
+                    continue
+                scores = self.scores[ensemble.agent_index]
+                ensemble.record([{usern: scores[usern]} for usern in ensemble.undecided])
+            return ensemble, ensemble.ranked_usernames()
+
+    def full_ensemble_top(self, top_k):
+        results = [[{usern: score} for usern, score in scores.items()] for scores in self.scores]
+        ranked = calculate_average_scores(results, weights=[agent.weight for agent in self.agents])
+        return [usern for usern, _ in ranked[:top_k]]
+
+    def test_same_top_k_as_the_full_ensemble(self):
+        for top_k in (1, 5, 10, 30):
+            ensemble, ranked = self.run_ensemble(top_k)
+            self.assertEqual({usern for usern, _ in ranked[:top_k]}, set(self.full_ensemble_top(top_k)))
+
+    def test_early_exit_saves_scorings(self):
+        ensemble, _ = self.run_ensemble(5)
+        self.assertLess(ensemble.agent_calls, len(self.agents) * len(self.usernames))
+
+    def test_cached_scores_are_not_counted_as_scorings(self):
+        ensemble = ProgressiveEnsemble({'usernames': self.usernames}, 5, self.agents)
+        with quiet():
+            # The first agent had every score cached, the second was asked for 10 usernames
+            ensemble.record([{usern: score} for usern, score in self.scores[0].items()], scored=0)
+            ensemble.record([{usern: self.scores[1][usern]} for usern in ensemble.undecided], scored=10)
+        self.assertEqual(ensemble.agent_calls, 10)
+
+    def test_every_username_is_ranked_once(self):
+        _, ranked = self.run_ensemble(10)
+        self.assertCountEqual([usern for usern, _ in ranked], self.usernames)
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class RequestSchedulerTests(SimpleTestCase):
+    def scheduler(self, **kwargs):
+        return RequestScheduler(**{'requests_per_minute': 6000, 'tokens_per_minute': 1000, 'max_retries': 2,
+                                   'base_backoff': 0.0, **kwargs})
+
+    def flaky_request(self, failures, response=None):
+        calls = []
+
+        def request(timeout):
+            calls.append(timeout)
+            if len(calls) <= len(failures):
+                raise failures[len(calls) - 1]
+            return response or SimpleNamespace(usage=None)
+        return request, calls
+
+    def test_transient_failures_are_retried(self):
+        scheduler = self.scheduler()
+        request, calls = self.flaky_request([ProviderError(429), ProviderError(503)])
+        with quiet():
+            scheduler.submit(request)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(scheduler.counters['retries'], 2)
+        self.assertEqual(scheduler.counters['succeeded'], 1)
+
+    def test_client_errors_are_not_retried(self):
+        scheduler = self.scheduler()
+        request, calls = self.flaky_request([ProviderError(400)])
+        with self.assertRaises(RequestFailedError):
+            scheduler.submit(request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(scheduler.counters['failed'], 1)
+
+    def test_gives_up_after_max_retries(self):
+        scheduler = self.scheduler()
+        request, calls = self.flaky_request([ProviderError(500)] * 5)
+        with quiet(), self.assertRaises(RequestFailedError):
+            scheduler.submit(request)
+        self.assertEqual(len(calls), 3)
+
+    def test_unused_estimate_is_refunded(self):
+        scheduler = self.scheduler()
+        response = SimpleNamespace(usage=SimpleNamespace(total_tokens=100))
+        request, _ = self.flaky_request([], response)
+        scheduler.submit(request, estimated_tokens=300)
+        self.assertAlmostEqual(scheduler.token_bucket.tokens, 900, delta=1)
+        self.assertEqual(scheduler.counters['tokens_used'], 100)
+
+    def test_usage_above_the_estimate_is_charged(self):
+        scheduler = self.scheduler()
+        response = SimpleNamespace(usage=SimpleNamespace(total_tokens=400))
+        request, _ = self.flaky_request([], response)
+        scheduler.submit(request, estimated_tokens=100)
+        self.assertAlmostEqual(scheduler.token_bucket.tokens, 600, delta=1)
+
+
+class JobEventStreamTests(SimpleTestCase):
+    def finished_job(self, lines):
+        job = PipelineJob()
+        for line in lines:
+            job.append_output(line)
+        job.status, job.result = 'succeeded', {'stored': 1}
+        return job
+
+    def test_output_events_carry_their_offset(self):
+        events = list(job_event_stream(self.finished_job(['a', 'b', 'c']), heartbeat=0))
+        self.assertEqual([event.split('\n')[0] for event in events if 'event: output' in event],
+                         ['id: 1', 'id: 2', 'id: 3'])
+        self.assertIn('event: done', events[-1])
+
+    def test_stream_resumes_after_the_last_event_id(self):
+        events = list(job_event_stream(self.finished_job(['a', 'b', 'c']), heartbeat=0, output_offset=2))
+        outputs = [event for event in events if 'event: output' in event]
+        self.assertEqual(outputs, ['id: 3\nevent: output\ndata: "c"\n\n'])
+
+
+class PipelineRunTests(SimpleTestCase):
+    def test_run_is_recorded_in_the_ledger(self):
+        with sqlite_database(pipeline_runs, pipeline_checkpoints) as database, quiet():
+            with pipeline_run() as run:
+                record_generated(10, generator='fixed')
+                record_ranking([('alice', 0.9), ('bob', 0.4)], 2)
+            row = database.execute('SELECT status, candidates_generated, accepted, above_threshold, generator '
+                                   'FROM pipeline_runs WHERE run_id = ?', (run.run_id,)).fetchone()
+        self.assertEqual(row, ('succeeded', 10, 2, 1, 'fixed'))
+
+    def test_failed_run_is_recorded_with_its_error(self):
+        with sqlite_database(pipeline_runs, pipeline_checkpoints) as database, quiet():
+            with self.assertRaises(RuntimeError), pipeline_run() as run:
+                raise RuntimeError('agent down')
+            row = database.execute('SELECT status, error FROM pipeline_runs WHERE run_id = ?',
+                                   (run.run_id,)).fetchone()
+        self.assertEqual(row, ('failed', 'RuntimeError: agent down'))
+
+
+def scoring_agent(name='agent0', weight=1.0):
+    """Registry agent stand-in, enough for the checkpoint keys and the prompt."""
+    return SimpleNamespace(name=name, model='gpt-4o-mini', weight=weight, system_prompt='Score usernames.',
+                           user_prompt=SimpleNamespace(template='$usernames'), batch_size=2,
+                           build_messages=lambda data: [{'role': 'user', 'content': ','.join(data['usernames'])}],
+                           cache_key=lambda usern: (name, usern))
+
+
+class CheckpointTests(SimpleTestCase):
+    def setUp(self):
+        self.requests = []
+
+        def request_scoring_completion(agent, messages):
+            self.requests.append(messages[0]['content'])
+            return json.dumps([{usern: 0.5} for usern in messages[0]['content'].split(',')])
+
+        patcher = mock.patch.object(step4, 'request_scoring_completion', request_scoring_completion)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_resumed_run_skips_the_batches_already_scored(self):
+        agent = scoring_agent()
+        with sqlite_database(pipeline_runs, pipeline_checkpoints) as database, quiet():
+            with self.assertRaises(RuntimeError), pipeline_run() as run:
+                first_result = score_batch(agent, ['alice', 'bob'])
+                raise RuntimeError('killed')
+
+            with pipeline_run(run_id=run.run_id):
+                self.assertEqual(score_batch(agent, ['alice', 'bob']), first_result)
+                score_batch(agent, ['carol', 'dave'])
+            checkpoints = database.execute('SELECT COUNT(*) FROM pipeline_checkpoints').fetchone()[0]
+
+        self.assertEqual(self.requests, ['alice,bob', 'carol,dave'])
+        # A run that succeeded leaves no checkpoints behind
+        self.assertEqual(checkpoints, 0)
+
+    def test_resume_in_a_fresh_process_reuses_the_batches_of_a_warm_worker(self):
+        agent = scoring_agent()
+        usernames = {'usernames': ['alice', 'bob', 'carol', 'dave']}
+        warm_cache = ScoreCache()
+        warm_cache.set(agent.cache_key('alice'), 0.5)
+        request = step4.request_scoring_completion
+
+        def killed_on_carol(agent, messages):
+            if 'carol' in messages[0]['content']:
+                raise RuntimeError('killed')
+            return request(agent, messages)
+
+        with sqlite_database(agent_scores, pipeline_runs, pipeline_checkpoints), quiet():
+            with self.assertRaises(RuntimeError), pipeline_run() as run, \
+                    mock.patch.object(step4, 'score_cache', warm_cache), \
+                    mock.patch.object(step4, 'request_scoring_completion', killed_on_carol):
+                run_scoring_agent(agent, usernames)
+            # A new process: the cache is empty, the batches are still alice,bob and carol,dave
+            with pipeline_run(run_id=run.run_id), mock.patch.object(step4, 'score_cache', ScoreCache()):
+                results = run_scoring_agent(agent, usernames)
+
+        self.assertEqual(self.requests, ['bob', 'carol,dave'])
+        self.assertEqual(results, [{usern: 0.5} for usern in usernames['usernames']])
+
+    def test_new_run_does_not_read_checkpoints(self):
+        agent = scoring_agent()
+        with sqlite_database(pipeline_runs, pipeline_checkpoints), quiet():
+            with self.assertRaises(RuntimeError), pipeline_run():
+                score_batch(agent, ['alice', 'bob'])
+                raise RuntimeError('killed')
+            with pipeline_run():
+                score_batch(agent, ['alice', 'bob'])
+        self.assertEqual(self.requests, ['alice,bob', 'alice,bob'])
+
+
+class AsyncCheckpointTests(SimpleTestCase):
+    def test_resumed_async_run_skips_the_batches_already_scored(self):
+        requests = []
+
+        async def async_request_scoring_completion(agent, messages):
+            requests.append(messages[0]['content'])
+            return json.dumps([{usern: 0.5} for usern in messages[0]['content'].split(',')])
+
+        async def scenario(pool):
+            agent = scoring_agent()
+            with self.assertRaises(RuntimeError):
+                async with pipeline_runs.async_pipeline_run(pool) as run:
+                    await async_pipeline.async_score_batch(agent, ['alice', 'bob'])
+                    raise RuntimeError('killed')
+            async with pipeline_runs.async_pipeline_run(pool, run_id=run.run_id):
+                await async_pipeline.async_score_batch(agent, ['alice', 'bob'])
+                await async_pipeline.async_score_batch(agent, ['carol', 'dave'])
+
+        with sqlite_database() as database, quiet():
+            pool = AsyncSQLitePool(database)
+
+            async def get_database_pool():
+                return pool
+
+            with mock.patch.object(async_pipeline, 'get_database_pool', get_database_pool), \
+                    mock.patch.object(async_pipeline, 'async_request_scoring_completion',
+                                      async_request_scoring_completion):
+                asyncio.run(scenario(pool))
+            checkpoints = database.execute('SELECT COUNT(*) FROM pipeline_checkpoints').fetchone()[0]
+
+        self.assertEqual(requests, ['alice,bob', 'carol,dave'])
+        self.assertEqual(checkpoints, 0)
+        # Each table is created by its first write, not before every one
+        creates = [query for query in pool.queries if 'CREATE TABLE' in query]
+        self.assertEqual(len(creates), len(set(creates)))
+
+
+# Vocabulary of the pattern model tests, {element: type} as built by learned_patterns.build_vocabulary
+PATTERN_VOCABULARY = {'anna': 'name', 'tom': 'name', 'sky': 'word', 'blue': 'word', '1990': 'year', '2001': 'year',
+                      '7': 'number', '42': 'number'}
+
+
+def pattern_history():
+    """(username, score) rows: the high scorers are name_year, the low scorers word + number without a separator."""
+    high = [(f"{name}_{year}", 0.9) for name in ('anna', 'tom') for year in ('1990', '2001')]
+    low = [(f"{word}{number}", 0.2) for word in ('sky', 'blue') for number in ('7', '42')]
+    return (high + low) * 5
+
+
+class PatternModelTests(SimpleTestCase):
+    def test_fit_favours_the_high_scorers_shapes(self):
+        model = PatternModel.fit(pattern_history(), PATTERN_VOCABULARY)
+        self.assertEqual((model.high_rows, model.low_rows), (20, 20))
+        self.assertGreater(model.transitions[START]['name'], model.transitions[START]['word'])
+        self.assertGreater(model.transitions['name']['year'], model.transitions['name']['number'])
+        self.assertGreater(model.separators['name>year'], 0.5)
+        for distribution in model.transitions.values():
+            self.assertAlmostEqual(sum(distribution.values()), 1.0)
+
+    def test_fit_skips_usernames_outside_the_vocabulary(self):
+        self.assertIsNone(PatternModel.fit([('zzz_qqq', 0.9), ('anna', 0.9)], PATTERN_VOCABULARY))
+        model = PatternModel.fit([('zzz_qqq', 0.9), ('anna_1990', 0.9)], PATTERN_VOCABULARY)
+        self.assertEqual((model.high_rows, model.low_rows), (1, 0))
+
+    def test_sampled_shapes_keep_the_fixed_generator_type_limits(self):
+        model = PatternModel.fit(pattern_history(), PATTERN_VOCABULARY)
+        # Every transition of a uniform model is as likely as any other, the rules alone keep the shapes in line
+        uniform = PatternModel({previous: dict.fromkeys(following, 1.0) for previous, following in
+                                model.transitions.items()}, dict.fromkeys(model.separators, 0.5))
+        rnd = random.Random(11)
+        for pattern_model in (model, uniform):
+            for _ in range(20000):
+                types = [element_type for element_type, _ in pattern_model.sample_shape(rnd)]
+                self.assertLessEqual(sum(element_type in NUMERIC_TYPES for element_type in types), 1, types)
+                if len(types) >= 3:
+                    self.assertGreater(len(set(types)), 1, types)
+
+    def test_sampled_shapes_respect_the_generator_rules(self):
+        model = PatternModel.fit(pattern_history(), PATTERN_VOCABULARY)
+        rnd = random.Random(3)
+        shapes = [model.sample_shape(rnd) for _ in range(500)]
+        for shape in shapes:
+            self.assertTrue(MIN_ELEMENTS <= len(shape) <= MAX_ELEMENTS)
+            self.assertIn(shape[0][0], FIRST_ELEMENT_TYPES)
+            # No separator before the first element
+            self.assertFalse(shape[0][1])
+            self.assertNotIn(END, [element_type for element_type, _ in shape])
+        name_year = sum(1 for shape in shapes if [element_type for element_type, _ in shape] == ['name', 'year'])
+        self.assertGreater(name_year, len(shapes) / 4)
+
+
+def vocabulary_generator():
+    """Fixed email generator over one entry per vocabulary table."""
+    return EmailGenerator(*[[{'word': element}] for element in ('sky', 'anna', '1990', '7')])
+
+
+class LearnedGeneratorRefitTests(SimpleTestCase):
+    def setUp(self):
+        self.versions = {}
+        self.fits = []
+
+        def load_pattern_model(vocabulary):
+            self.fits.append(vocabulary)
+            return PatternModel.fit(pattern_history(), PATTERN_VOCABULARY)
+
+        loader = SimpleNamespace(load_versions=lambda: dict(self.versions), load_table=None,
+                                 close_connection=lambda: None)
+        for patcher in (mock.patch.object(step3, 'DatabaseLoader', lambda: loader),
+                        mock.patch.object(step3, 'load_pattern_model', load_pattern_model),
+                        mock.patch.object(step3, 'EMAIL_GENERATOR_MODE', 'learned')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_refits_once_the_history_grew_enough(self):
+        generator = vocabulary_generator()
+        with quiet():
+            self.versions[HISTORY_VERSION] = PATTERN_MODEL_REFIT_ROWS - 1
+            self.assertIs(refresh_email_generator(generator), generator)
+            self.versions[HISTORY_VERSION] = PATTERN_MODEL_REFIT_ROWS
+            refitted = refresh_email_generator(generator)
+        self.assertIsInstance(refitted, LearnedEmailGenerator)
+        self.assertEqual(refitted.history_version, PATTERN_MODEL_REFIT_ROWS)
+        self.assertEqual(len(self.fits), 1)
+        self.assertEqual(self.fits[0]['anna'], 'name')
+
+    def test_failed_fit_keeps_the_generator_until_the_history_grows_again(self):
+        generator = vocabulary_generator()
+        self.versions[HISTORY_VERSION] = PATTERN_MODEL_REFIT_ROWS
+        with quiet(), mock.patch.object(step3, 'load_pattern_model', lambda vocabulary: None):
+            self.assertIs(refresh_email_generator(generator), generator)
+            self.assertIs(refresh_email_generator(generator), generator)
+        self.assertEqual(generator.history_version, PATTERN_MODEL_REFIT_ROWS)
+
+
+class VocabularyReloadTests(SimpleTestCase):
+    def test_changed_tables(self):
+        loaded = {'words': 2, 'names': 1, HISTORY_VERSION: 40}
+        self.assertEqual(changed_tables(loaded, dict(loaded)), [])
+        # Bumped, first written since the load, and the history counter is not a vocabulary table
+        current = {'words': 3, 'names': 1, 'common_years': 1, HISTORY_VERSION: 90}
+        self.assertEqual(changed_tables(loaded, current), ['words', 'common_years'])
+
+    def test_refresh_reloads_only_the_changed_tables(self):
+        generator = vocabulary_generator()
+        generator.versions = {'words': 1, 'names': 1}
+        loaded = []
+
+        def load_table(table):
+            loaded.append(table)
+            return [{'word': 'moon'}]
+
+        loader = SimpleNamespace(load_versions=lambda: {'words': 2, 'names': 1}, load_table=load_table,
+                                 close_connection=lambda: None)
+        with quiet(), mock.patch.object(step3, 'DatabaseLoader', lambda: loader):
+            self.assertIs(refresh_email_generator(generator), generator)
+        self.assertEqual(loaded, ['words'])
+        self.assertEqual(generator.words_data, [{'word': 'moon'}])
+        self.assertEqual(generator.names_data, [{'word': 'anna'}])
+        self.assertEqual(generator.versions, {'words': 2, 'names': 1})
+
+
+class PartitionCursor:
+    """Cursor stand-in answering the partition listing of information_schema, statements kept in queries."""
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.queries = []
+
+    def execute(self, query, params=()):
+        self.queries.append(query)
+
+    def fetchall(self):
+        return [(partition,) for partition in self.partitions]
+
+
+class HistoryRetentionTests(SimpleTestCase):
+    def test_expired_partitions(self):
+        partitions = ['p202603', 'p202604', 'p202605', 'p202606', 'pfuture']
+        # Three months kept on 2026-07-15: the cutoff is April 1st, March alone ends before it
+        self.assertEqual(expired_partitions(partitions, 3, today=date(2026, 7, 15)), ['p202603'])
+        self.assertEqual(expired_partitions(partitions, 2, today=date(2026, 7, 1)), ['p202603', 'p202604'])
+        self.assertEqual(expired_partitions(partitions, 12, today=date(2026, 7, 15)), [])
+
+    def test_ensure_history_partitions_splits_the_missing_months_off_the_catch_all_one(self):
+        cursor = PartitionCursor(['p202611', 'p202612', 'pfuture'])
+        self.assertEqual(ensure_history_partitions(cursor, months_ahead=1, today=date(2027, 1, 20)),
+                         ['p202701', 'p202702'])
+        self.assertEqual(cursor.queries[-1],
+                         "ALTER TABLE `high_rated_unames_history` REORGANIZE PARTITION pfuture INTO ("
+                         "PARTITION p202701 VALUES LESS THAN ('2027-02-01'), "
+                         "PARTITION p202702 VALUES LESS THAN ('2027-03-01'), "
+                         "PARTITION pfuture VALUES LESS THAN (MAXVALUE))")
+
+    def test_ensure_history_partitions_leaves_covered_and_unpartitioned_tables(self):
+        cursor = PartitionCursor(['p202612', 'p202701', 'p202702', 'pfuture'])
+        self.assertEqual(ensure_history_partitions(cursor, months_ahead=1, today=date(2027, 1, 20)), [])
+        self.assertEqual(ensure_history_partitions(PartitionCursor([]), today=date(2027, 1, 20)), [])
+        self.assertEqual(len(cursor.queries), 1)
+
+    def test_history_sync_skips_usernames_recorded_in_any_month(self):
+        database = sqlite3.connect(':memory:')
+        cursor = SQLiteCursor(database.cursor())
+        cursor.execute("CREATE TABLE high_rated_unames (ID INTEGER PRIMARY KEY, username TEXT, score REAL)")
+        cursor.executemany("INSERT INTO high_rated_unames VALUES (?, ?, ?)", [(1, 'sky_anna', 9.0), (2, 'moon7', 8.0)])
+        sync_queries = step2.history_sync_queries()
+        for query in sync_queries:
+            cursor.execute(query)
+        # Long past any recent window, the rows are still recorded
+        cursor.execute("UPDATE high_rated_unames_history SET created_at = '2020-01-01 00:00:00'")
+        cursor.execute("INSERT INTO high_rated_unames VALUES (3, 'star_1990', 7.0)")
+        for query in sync_queries:
+            cursor.execute(query)
+
+        cursor.execute("SELECT username, COUNT(*) FROM high_rated_unames_history GROUP BY username ORDER BY username")
+        self.assertEqual(cursor.fetchall(), [('moon7', 1), ('sky_anna', 1), ('star_1990', 1)])
+        database.close()
+
+
+class ScoringAgentTests(SimpleTestCase):
+    def setUp(self):
+        self.requests = []
+
+        def request_scoring_completion(agent, messages):
+            self.requests.append(messages[0]['content'])
+            return json.dumps([{usern: round(0.1 * len(usern), 2)} for usern in messages[0]['content'].split(',')])
+
+        for patcher in (mock.patch.object(step4, 'request_scoring_completion', request_scoring_completion),
+                        mock.patch.object(step4, 'score_cache', ScoreCache())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_scores_are_stored_and_cached(self):
+        agent = scoring_agent()
+        usernames = {'usernames': ['alice', 'bob', 'carol', 'alice']}
+        with sqlite_database(agent_scores, pipeline_runs, pipeline_checkpoints) as database, quiet():
+            with pipeline_run() as run:
+                results = run_scoring_agent(agent, usernames)
+            # Scored again from the cache, without a request
+            self.assertEqual(run_scoring_agent(agent, usernames), results)
+            rows = database.execute('SELECT username, agent, score, run_id FROM agent_scores '
+                                    'ORDER BY username').fetchall()
+
+        self.assertEqual(results, [{'alice': 0.5}, {'bob': 0.3}, {'carol': 0.5}])
+        self.assertEqual(self.requests, ['alice,bob', 'carol'])
+        # The second call ran outside the run, its upsert cleared the run id
+        self.assertEqual(rows, [('alice', 'agent0', 0.5, None), ('bob', 'agent0', 0.3, None),
+                                ('carol', 'agent0', 0.5, None)])
+        self.assertIsNotNone(run.run_id)
+
+
+class ScoreAggregationTests(SimpleTestCase):
+    def setUp(self):
+        import numpy as np
+
+        nan = np.nan
+        self.usernames = ['alice', 'bob', 'carol', 'dave']
+        # Agents a, b (weight 2) and c (weight 0), NaN where an agent did not score the username
+        self.scores = np.array([[0.9, 0.3, 0.1], [0.6, nan, 0.9], [nan, nan, 0.8], [0.2, 0.8, nan]])
+        self.weights = [1.0, 2.0, 0.0]
+
+    def aggregate(self, rule):
+        return [None if score != score else round(score, 4)
+                for score in aggregate_score_matrix(self.scores, self.weights, rule).tolist()]
+
+    def test_rules(self):
+        self.assertEqual(self.aggregate('mean'), [0.5, 0.6, None, 0.6])
+        self.assertEqual(self.aggregate('median'), [0.6, 0.6, None, 0.5])
+        self.assertEqual(self.aggregate('min'), [0.3, 0.6, None, 0.2])
+        self.assertEqual(self.aggregate('max'), [0.9, 0.6, None, 0.8])
+        with self.assertRaises(ValueError):
+            aggregate_score_matrix(self.scores, self.weights, 'mode')
+
+    def test_mean_matches_the_cycle_ranking(self):
+        ranking = rank_scores(self.usernames, aggregate_score_matrix(self.scores, self.weights))
+        # Ties keep the usernames' order, usernames no weighted agent scored are left out
+        self.assertEqual([usern for usern, score in ranking], ['bob', 'dave', 'alice'])
+        agent_results = [[{usern: score} for usern, score in zip(self.usernames, column) if score == score]
+                         for column in self.scores.T.tolist()]
+        cycle_ranking = calculate_average_scores(agent_results, self.weights)
+        self.assertEqual([usern for usern, score in cycle_ranking], ['bob', 'dave', 'alice'])
+        for (usern, score), (cycle_usern, cycle_score) in zip(ranking, cycle_ranking):
+            self.assertAlmostEqual(score, cycle_score)
+
+
+class VocabularyBuildTests(SimpleTestCase):
+    def test_build_inputs_diff(self):
+        inputs = build_inputs('sky\nmoon\n', 3, 8, {'darn', 'heck'})
+        self.assertEqual(build_inputs('sky\nmoon\n', 3, 8, {'heck', 'darn'}), inputs)
+        for changed in (build_inputs('sky\nmoon\nstar\n', 3, 8, {'darn', 'heck'}),
+                        build_inputs('sky\nmoon\n', 3, 9, {'darn', 'heck'}),
+                        build_inputs('sky\nmoon\n', 3, 8, {'darn'})):
+            self.assertNotEqual(changed, inputs)
+        with mock.patch('core.vocabulary_builds.LANGDETECT_SEED', 1):
+            self.assertNotEqual(build_inputs('sky\nmoon\n', 3, 8, {'darn', 'heck'})['detector'], inputs['detector'])
+
+    def test_saved_inputs_compare_equal(self):
+        inputs = build_inputs('sky\nmoon\n', 3, 8, {'darn', 'heck'})
+        database = sqlite3.connect(':memory:')
+        cursor = SQLiteCursor(database.cursor())
+        self.assertIsNone(load_build_inputs(cursor))
+        save_build_inputs(cursor, inputs)
+        save_build_inputs(cursor, inputs)
+        self.assertEqual(load_build_inputs(cursor), inputs)
+        database.close()
+
+    def test_only_unchecked_words_go_through_langdetect(self):
+        checked = []
+
+        def is_english(word):
+            checked.append(word)
+            return word != 'hund'
+
+        language_checks = {'sky': True, 'moon': True}
+        with mock.patch.object(step1, 'is_english', is_english):
+            new_checks = step1.check_languages(['hund', 'moon', 'sky', 'star'], language_checks)
+        self.assertEqual(checked, ['hund', 'star'])
+        self.assertEqual(new_checks, {'hund': False, 'star': True})
+        self.assertEqual(language_checks, {'sky': True, 'moon': True, 'hund': False, 'star': True})
+
+
+class BlocklistTests(SimpleTestCase):
+    def test_iter_matches_finds_overlapping_terms(self):
+        automaton = BlocklistAutomaton(['he', 'she', 'his', 'hers'])
+        self.assertEqual(sorted(automaton.iter_matches('uSHers')), [(1, 4), (2, 4), (2, 6)])
+        self.assertEqual(list(automaton.iter_matches('moon')), [])
+
+    def test_blocks(self):
+        automaton = BlocklistAutomaton(['sunset', 'cat', 'Tape'])
+        # Across elements, whatever the case
+        self.assertTrue(automaton.blocks(['sun', 'set']))
+        self.assertTrue(automaton.blocks(['SUN', 'Set', '1990']))
+        self.assertTrue(automaton.blocks(['sca', 'tter']))
+        self.assertTrue(automaton.blocks(['ta', 'pe']))
+        # A whole element
+        self.assertTrue(automaton.blocks(['moon', 'cat']))
+        # Inside a longer element, or not there at all
+        self.assertFalse(automaton.blocks(['catalog', '1990']))
+        self.assertFalse(automaton.blocks(['sunsets']))
+        self.assertFalse(automaton.blocks(['moon', 'sky']))
+        self.assertFalse(BlocklistAutomaton([]).blocks(['sun', 'set']))
+
+    def test_load_blocklist_terms(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', encoding='utf-8', delete=False) as file:
+            file.write('# offensive terms\nSunset\n\ncat  # short one\n')
+        self.addCleanup(os.remove, file.name)
+        self.assertEqual(load_blocklist_terms(file.name), {'sunset', 'cat'})
+
+
+class ProxyScorerTests(SimpleTestCase):
+    def setUp(self):
+        # tom_2001 and blue42 were never scored, their shapes and elements were
+        rows = [row for row in pattern_history() if row[0] not in ('tom_2001', 'blue42')]
+        self.proxy = ProxyScorer.fit(rows, PATTERN_VOCABULARY, threshold=0.5)
+
+    def test_probability(self):
+        proxy = self.proxy
+        self.assertEqual((proxy.probability('anna_1990'), proxy.probability('sky7')), (1.0, 0.0))
+        self.assertAlmostEqual(proxy.base_rate, 0.5)
+        self.assertEqual(proxy.probability('zzz'), proxy.base_rate)
+        self.assertGreater(proxy.probability('tom_2001'), 0.75)
+        self.assertLess(proxy.probability('blue42'), 0.25)
+
+    def test_effective_yield_counts_only_new_usernames(self):
+        usernames = ['anna_1990', 'anna_1990', 'tom_2001', 'tom_2001', 'blue42', 'sky7']
+        vocabulary_data = [[{'word': word}] for word in ('sky', 'anna', '1990', '7')]
+        generated = {'usernames': usernames}
+        with mock.patch.dict(generator_sweep.worker_state), \
+                mock.patch.object(generator_sweep, 'generate_usernames', lambda *args, **kwargs: generated):
+            init_sweep_worker(vocabulary_data, self.proxy)
+            result = evaluate_configuration({}, len(usernames), seed=0)
+
+        new_yield = (self.proxy.probability('tom_2001') + self.proxy.probability('blue42')) / len(usernames)
+        self.assertAlmostEqual(result['effective_yield'], new_yield)
+        self.assertAlmostEqual(result['novel_fraction'], 2 / len(usernames))
+        self.assertAlmostEqual(result['unique_fraction'], 4 / len(usernames))
+        # The known high username still counts in the plain expected yield, every time it is generated
+        self.assertGreater(result['expected_yield'], result['effective_yield'] + 2 / len(usernames) - 1e-9)
+
+
+class ResultsPageTests(SimpleTestCase):
+    def test_cursor_round_trip(self):
+        key = (Decimal('0.85'), 42, datetime(2026, 10, 19, 12, 30, 5))
+        cursor = encode_cursor(key)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), key)
+
+    def test_invalid_cursors(self):
+        for cursor in ('', 'not a cursor', encode_cursor((Decimal('0.5'), 1, datetime(2026, 1, 1)))[:-3],
+                       'WzEsMl0'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_results_page_query(self):
+        query, parameters = results_page_query()
+        self.assertNotIn('WHERE', query)
+        self.assertEqual(parameters, [])
+        key = (Decimal('0.85'), 42, datetime(2026, 10, 19))
+        query, parameters = results_page_query(key)
+        self.assertIn('WHERE score < %s', query)
+        self.assertEqual(parameters, [key[0], key[0], 42, 42, key[2]])
+
+    def test_pages_walk_the_history_once(self):
+        database = sqlite3.connect(':memory:')
+        cursor = SQLiteCursor(database.cursor())
+        cursor.execute(step2.history_sync_queries()[0])
+        # Ties on the score, and on the ID too: a recreated scoring table reuses its IDs
+        rows = [(1, 'anna_1990', 0.9, '2026-09-01 10:00:00'), (2, 'tom_2001', 0.9, '2026-09-01 10:00:00'),
+                (2, 'sky7', 0.9, '2026-10-01 10:00:00'), (3, 'blue42', 0.7, '2026-10-01 10:00:00'),
+                (4, 'moon_7', 0.5, '2026-10-02 10:00:00')]
+        cursor.executemany('INSERT INTO high_rated_unames_history (ID, username, score, created_at) '
+                           'VALUES (?, ?, ?, ?)', rows)
+
+        seen, after = [], None
+        while True:
+            query, parameters = results_page_query(after)
+            cursor.execute(query, parameters + [2])
+            page = cursor.fetchall()
+            seen.extend(usern for _, usern, _, _ in page)
+            if len(page) < 2:
+                break
+            row_id, _, score, created_at = page[-1]
+            after = decode_cursor(encode_cursor((Decimal(str(score)), row_id, datetime.fromisoformat(created_at))))
+        database.close()
+        self.assertEqual(seen, ['sky7', 'tom_2001', 'anna_1990', 'blue42', 'moon_7'])
+
+
+class ProfileListTests(SimpleTestCase):
+    def test_profiles_are_listed_newest_first_whatever_their_label(self):
+        names = ['command-20261019-120000-0a1b2c3d.prof', 'request-20261018-090000-4e5f6a7b.prof',
+                 'request-20261019-130000-8c9d0e1f.txt', 'request-20261019-130000-8c9d0e1f.prof', 'notes.txt']
+        with tempfile.TemporaryDirectory() as directory:
+            for name in names + ['other.log']:
+                open(os.path.join(directory, name), 'w').close()
+            with mock.patch('core.pipeline_profiling.PIPELINE_PROFILE_DIR', directory):
+                profiles = list_profiles()
+        self.assertEqual(profiles, ['request-20261019-130000-8c9d0e1f.txt', 'request-20261019-130000-8c9d0e1f.prof',
+                                    'command-20261019-120000-0a1b2c3d.prof', 'request-20261018-090000-4e5f6a7b.prof',
+                                    'notes.txt'])
+
+
+class AsyncCycleOptionsTests(SimpleTestCase):
+    def test_view_passes_its_cycle_options_through(self):
+        calls = []
+
+        async def async_main_script(**cycle_options):
+            calls.append(cycle_options)
+            return {'high_probability_usernames': [], 'final_table': []}
+
+        request = RequestFactory().get('/process/async/', HTTP_ACCEPT='application/json')
+        with mock.patch.object(views, 'async_main_script', async_main_script):
+            response = asyncio.run(views.process_usernames_async(request, no_of_raw_generated_usernames=140,
+                                                                 no_of_validated_records=3))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(calls, [{'no_of_raw_generated_usernames': 140, 'no_of_validated_records': 3}])
+
+    def test_async_main_script_is_sized_like_main_script(self):
+        @asynccontextmanager
+        async def async_pipeline_run(pool, run_id=None):
+            yield
+
+        stages = {name: mock.AsyncMock(return_value=[]) for name in (
+            'get_database_pool', 'async_generate_usernames_with_AI_Scoring_agents', 'async_interrogate_scoring_table',
+            'async_scrape_google_for_validity', 'async_save_final_high_prob_users', 'async_interrogate_final_table')}
+        with mock.patch.multiple(async_pipeline, async_pipeline_run=async_pipeline_run, **stages), quiet():
+            asyncio.run(async_pipeline.async_main_script(
+                no_of_raw_generated_usernames=140, limit_ai_high_scoring_records=5, no_of_validated_records=3,
+                fetch_top_production_records=7, exact_search_engine_match=True))
+
+        stages['async_generate_usernames_with_AI_Scoring_agents'].assert_awaited_once_with(no_of_raw=140,
+                                                                                           no_of_sorted=20)
+        stages['async_interrogate_scoring_table'].assert_awaited_once_with(limit_records=5)
+        stages['async_scrape_google_for_validity'].assert_awaited_once_with(3, remove_record_after=True,
+                                                                           exact_search_engine_match=True)
+        stages['async_interrogate_final_table'].assert_awaited_once_with(7)
@@ -1,8 +1,18 @@
 from django.urls import path
-from .views import process_usernames, home, index
+from .views import (process_usernames, process_usernames_stream, process_usernames_async, pipeline_job_status,
+                    pipeline_job_events, pipeline_profiles, pipeline_profile_download, results, metrics, home,
+                    index)
 
 urlpatterns = [
     path('home/', home, name='home'),  # Home Page
     path('process/', process_usernames, name='process_usernames'),  # Process page
+    path('process/stream/', process_usernames_stream, name='process_usernames_stream'),  # Process and stream events
+    path('process/async/', process_usernames_async, name='process_usernames_async'),  # Async pipeline (ASGI)
+    path('process/<str:job_id>/status/', pipeline_job_status, name='pipeline_job_status'),  # Job progress polling
+    path('process/<str:job_id>/events/', pipeline_job_events, name='pipeline_job_events'),  # Job server-sent events
+    path('profiles/', pipeline_profiles, name='pipeline_profiles'),  # Saved pipeline profiles (staff)
+    path('profiles/<str:file_name>', pipeline_profile_download, name='pipeline_profile_download'),  # Download (staff)
+    path('results/', results, name='results'),  # High scores of the history, JSON pages (cached)
+    path('metrics', metrics, name='metrics'),  # Prometheus text metrics of this process
     path('', index, name='index'),  # Base URL points to the home page
 ]
\ No newline at end of file
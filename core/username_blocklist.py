@@ -0,0 +1,100 @@
+# ###################################### ###################################### #
+# Username Blocklist
+#
+# The offensive terms of USERNAME_BLOCKLIST (offensive_words.txt by default) are compiled once per process
+# into an Aho-Corasick automaton, which finds every term occurring in a username in a single pass over it,
+# however long the list gets. Step 1 keeps the terms out of the vocabulary itself (exact words), step 3 drops
+# the generated usernames whose elements combine into a term before any of them is paid for in scoring:
+# - a term spanning two elements or covering a whole element blocks the username, separators are skipped:
+#   "dick_head" reads as "dickhead"
+# - a term inside a single longer element ("ass" in "class") does not, that element passed the vocabulary's
+#   own filter as a word of its own
+# ###################################### ###################################### #
+
+import os
+from bisect import bisect_right
+from collections import deque
+from functools import lru_cache
+
+DEFAULT_BLOCKLIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offensive_words.txt')
+USERNAME_BLOCKLIST = os.getenv('USERNAME_BLOCKLIST', DEFAULT_BLOCKLIST)
+
+
+def load_blocklist_terms(path=None):
+    """Lower-cased terms of a blocklist file, one per line, '#' starting a comment."""
+    with open(path or USERNAME_BLOCKLIST, 'r', encoding='utf-8') as file:
+        terms = (line.split('#', 1)[0].strip().lower() for line in file)
+        return {term for term in terms if term}
+
+
+class BlocklistAutomaton:
+    """Aho-Corasick automaton over a set of terms, matched case-insensitively."""
+
+    def __init__(self, terms):
+        # State 0 is the root; transitions[state] maps a character to the next state
+        self.transitions = [{}]
+        self.fail = [0]
+        # Lengths of the terms ending in each state, those of its fail states included
+        self.outputs = [()]
+        for term in terms:
+            self.add_term(term.lower())
+        self.link_failures()
+
+    def add_term(self, term):
+        if not term:
+            return
+        state = 0
+        for char in term:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][char] = next_state
+                self.transitions.append({})
+                self.fail.append(0)
+                self.outputs.append(())
+            state = next_state
+        self.outputs[state] += (len(term),)
+
+    def link_failures(self):
+        # Breadth first, a state's fail state is always shallower and already linked
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                fail_state = self.fail[state]
+                while fail_state and char not in self.transitions[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.transitions[fail_state].get(char, 0)
+                self.outputs[next_state] += self.outputs[self.fail[next_state]]
+                queue.append(next_state)
+
+    def iter_matches(self, text):
+        """Yields (start, end) of every term occurrence in text."""
+        transitions, fail, outputs = self.transitions, self.fail, self.outputs
+        state = 0
+        for end, char in enumerate(text.lower(), start=1):
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            for length in outputs[state]:
+                yield end - length, end
+
+    def blocks(self, elements):
+        """Whether a term spans two of the elements (the username's parts, separators left out) or is one."""
+        starts, position = [], 0
+        for element in elements:
+            starts.append(position)
+            position += len(element)
+
+        for start, end in self.iter_matches(''.join(elements)):
+            index = bisect_right(starts, start) - 1
+            element_end = starts[index] + len(elements[index])
+            if end > element_end or (start == starts[index] and end == element_end):
+                return True
+        return False
+
+
+@lru_cache(maxsize=1)
+def get_username_blocklist():
+    """The automaton of USERNAME_BLOCKLIST, built on first use."""
+    return BlocklistAutomaton(load_blocklist_terms())
@@ -1,8 +1,11 @@
-import time
 import os
-import io
-import sys
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, HttpResponse, JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views.decorators.http import require_GET
 from .step2_MariaDB_database_engine import (
     connect_to_database,
     interrogate_table,
@@ -16,18 +19,13 @@ from .step2_MariaDB_database_engine import (
 from .step4_scoring_potential_records_wLLM import generate_usernames_with_AI_Scoring_agents
 from .step1_words_generator_and_store_in_MariaDB import regenerate_data
 from .step5_custom_search_engine_API import scrape_google_for_validity, save_final_high_prob_users
-
-
-# Helper to capture console output
-class CaptureOutput(list):
-    def __enter__(self):
-        self._stdout = sys.stdout
-        sys.stdout = self._stringio = io.StringIO()
-        return self
-
-    def __exit__(self, *args):
-        self.extend(self._stringio.getvalue().splitlines())
-        sys.stdout = self._stdout
+from .pipeline_jobs import submit_job, get_job, job_event_stream
+from .pipeline_events import emit, event_sink, pace
+from .pipeline_metrics import count, render_prometheus, span, timed_view
+from .pipeline_runs import pipeline_run, record_validated
+from .pipeline_profiling import profile_requested, profiled, list_profiles, profile_path
+from .async_pipeline import async_main_script
+from .results_api import cached_results_page
 
 
 # Function to process user-uploaded file and insert data into database
@@ -37,7 +35,7 @@ def process_user_file_and_insert_data(subdirectory=r'User Upload', file_name='Na
     file_path = os.path.join(subdirectory, file_name)
 
     if not os.path.exists(file_path):
-        print(f"File '{file_path}' not found.")
+        emit(f"File '{file_path}' not found.")
         return
 
     with open(file_path, 'r') as file:
@@ -62,66 +60,219 @@ def regenerate_original_data(min_letters=3, max_letters=5):
 
 
 # Main script logic
-def main_script():
-    # Number of raw generate usernames to be then processed towards multiple-layers Filtering
-    no_of_raw_generated_usernames = 50
-    # User uploads file of Names and Words to be integrated in script's logic
-    upload_your_own_data = False
-    # In case of User uploaded data, if User wants to strictly use his provided data and exclude original Names&Words.
-    overwrite_existing_data = False
-    # In case words definitions & Rules are changed or Data becomes corrupted - Regenerate Data.
-    regenerate_original_datasets = False
-    # Limit number of Records shown in final step - Final Production Table
-    fetch_top_production_records = 10
-    # Remove Records after being parsed and filtered towards Main Production Table
-    remove_record_after = False
-
-    # Generate usernames based on chosen Dataset and Email Patterns Neural Network
-    generate_usernames_with_AI_Scoring_agents(no_of_raw=no_of_raw_generated_usernames,
-                                              no_of_sorted=int(no_of_raw_generated_usernames / 7))
-    time.sleep(1.5)
-
-    limit_ai_high_scoring_records = 10
-    # Review Current High Scoring usernames
-    print(f"\nCurrent top {limit_ai_high_scoring_records} High Scoring usernames from current cycle: ")
-    interrogate_scoring_table(limit_records=limit_ai_high_scoring_records)
-
-    # Final processing: Searching for top high-scoring usernames on Google and validating them
-    high_prob_real_usernames = scrape_google_for_validity(10, remove_record_after=True,
-                                                          exact_search_engine_match=False)
-
-    # Save relevant high-probability usernames
-    save_final_high_prob_users(high_prob_real_usernames)
-
-    # Display final usernames
-    print(f"\n\nCurrent top {limit_ai_high_scoring_records} Final High Scoring usernames (Final Production Table):")
-    interrogate_final_table(fetch_top_production_records)
-
-
-# Django view that runs the main script and captures the output
+def main_script(progress=None, run_id=None, no_of_raw_generated_usernames=50, no_of_sorted=None,
+                limit_ai_high_scoring_records=10, no_of_validated_records=10, fetch_top_production_records=10,
+                exact_search_engine_match=False):
+    """
+    Runs one pipeline cycle, progress(stage, fraction) is called as the cycle moves through its stages.
+    The run_id of a failed run resumes it from its checkpoints (pipeline_checkpoints).
+
+    no_of_raw_generated_usernames usernames are generated and scored, the best no_of_sorted (a seventh of them
+    by default) stored, no_of_validated_records of the stored ones searched for on the web and
+    fetch_top_production_records rows of the final table returned.
+    """
+    if progress is None:
+        def progress(stage, fraction):
+            pass
+
+    if no_of_sorted is None:
+        no_of_sorted = int(no_of_raw_generated_usernames / 7)
+
+    # Every cycle is recorded in the run ledger (pipeline_runs)
+    with pipeline_run(run_id=run_id):
+        # Generate usernames based on chosen Dataset and Email Patterns Neural Network
+        progress('generating_and_scoring', 0.05)
+        with span('generating_and_scoring'):
+            generate_usernames_with_AI_Scoring_agents(no_of_raw=no_of_raw_generated_usernames,
+                                                      no_of_sorted=no_of_sorted)
+        pace(1.5)
+
+        progress('reviewing_scores', 0.5)
+        # Review Current High Scoring usernames
+        emit(f"\nCurrent top {limit_ai_high_scoring_records} High Scoring usernames from current cycle: ")
+        with span('reviewing_scores'):
+            interrogate_scoring_table(limit_records=limit_ai_high_scoring_records)
+
+        # Final processing: Searching for top high-scoring usernames on Google and validating them
+        progress('web_validation', 0.6)
+        with span('web_validation'):
+            high_prob_real_usernames = scrape_google_for_validity(no_of_validated_records, remove_record_after=True,
+                                                                  exact_search_engine_match=exact_search_engine_match)
+
+        # Save relevant high-probability usernames
+        progress('saving_results', 0.9)
+        with span('saving_results'):
+            save_final_high_prob_users(high_prob_real_usernames)
+
+            # Display final usernames
+            emit(f"\n\nCurrent top {limit_ai_high_scoring_records} Final High Scoring usernames "
+                 f"(Final Production Table):")
+            final_rows = interrogate_final_table(fetch_top_production_records)
+        record_validated(len(high_prob_real_usernames))
+
+        return {
+            'high_probability_usernames': high_prob_real_usernames,
+            'final_table': final_rows,
+        }
+
+
+# Pipeline run executed by a background job, its output is captured by the job
+def run_pipeline(progress=None, run_id=None, regenerate_original_datasets=False, upload_your_own_data=False,
+                 overwrite_existing_data=False, **cycle_options):
+    """
+    Optionally regenerates the original dataset and loads the user upload, then runs main_script
+    with cycle_options (its sizes and search options).
+    """
+    if progress is None:
+        def progress(stage, fraction):
+            pass
+
+    # Optionally regenerate original dataset
+    if regenerate_original_datasets:
+        progress('regenerating_data', 0.0)
+        regenerate_original_data(3, 5)
+
+    # Optionally process user-provided data
+    if upload_your_own_data:
+        progress('loading_user_data', 0.0)
+        process_user_file_and_insert_data(overwrite=overwrite_existing_data)
+
+    # Run the main script to generate usernames
+    with span('pipeline_run'):
+        return main_script(progress=progress, run_id=run_id, **cycle_options)
+
+
+def pipeline_for_request(request):
+    """The pipeline run to enqueue, wrapped in the profiler when a staff user asked for it."""
+    if profile_requested(request):
+        return profiled('process', run_pipeline)
+    return run_pipeline
+
+
+# Django view that enqueues a pipeline run and returns right away
+@timed_view
 def process_usernames(request):
-    output = []
-    with CaptureOutput() as output:
-        # Flags for customization (you can make these dynamic via the front end)
-        upload_your_own_data = False
-        overwrite_existing_data = False
-        regenerate_original_datasets = False
+    job = submit_job(pipeline_for_request(request))
+    status_url = reverse('pipeline_job_status', args=[job.id])
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'job_id': job.id, 'status_url': status_url}, status=202)
 
-        # Optionally regenerate original dataset
-        if regenerate_original_datasets:
-            regenerate_original_data(3, 5)
+    # The result page follows the job's event stream (or polls the status endpoint) and shows output as it comes in
+    return render(request, 'result.html', {'job_id': job.id, 'status_url': status_url,
+                                           'events_url': reverse('pipeline_job_events', args=[job.id])})
 
-        # Optionally process user-provided data
-        if upload_your_own_data:
-            process_user_file_and_insert_data(overwrite=overwrite_existing_data)
 
-        # Run the main script to generate usernames
-        main_script()
+def event_stream_response(job, output_offset=0):
+    response = StreamingHttpResponse(job_event_stream(job, output_offset=output_offset),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies (nginx) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-    # Pass the captured output to the template for display
+
+# Streaming mode: enqueues a pipeline run and streams its events in the same response
+@timed_view
+def process_usernames_stream(request):
+    return event_stream_response(submit_job(pipeline_for_request(request)))
+
+
+@require_GET
+@timed_view
+def pipeline_job_events(request, job_id):
+    job = get_job(job_id)
+    if job is None:
+        raise Http404("Unknown pipeline job.")
+
+    # An EventSource reconnecting after a dropped connection resumes after the last output line it received
+    try:
+        output_offset = max(0, int(request.headers.get('Last-Event-ID', 0)))
+    except ValueError:
+        output_offset = 0
+    return event_stream_response(job, output_offset)
+
+
+@require_GET
+@timed_view
+def pipeline_job_status(request, job_id):
+    job = get_job(job_id)
+    if job is None:
+        raise Http404("Unknown pipeline job.")
+
+    try:
+        output_offset = max(0, int(request.GET.get('offset', 0)))
+    except ValueError:
+        output_offset = 0
+    return JsonResponse(job.to_dict(output_offset=output_offset))
+
+
+# Async counterpart of the original blocking view, for the ASGI deployment: the whole run is awaited
+# in the request, but waiting on the database, LLM or search API does not hold a worker thread.
+# cycle_options are main_script's sizes and search options, given as the extra kwargs of a URL pattern
+@timed_view
+async def process_usernames_async(request, **cycle_options):
+    output = []
+    with event_sink(lambda event: output.extend(event['message'].split('\n'))):
+        try:
+            with span('pipeline_run', mode='async'):
+                result = await async_main_script(**cycle_options)
+        except Exception:
+            count('pipeline_runs_total', status='failed', mode='async')
+            raise
+    count('pipeline_runs_total', status='succeeded', mode='async')
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'output': output, 'result': result})
     return render(request, 'result.html', {'output': output})
 
 
+# Saved pipeline profiles, newest first
+@staff_member_required
+@require_GET
+def pipeline_profiles(request):
+    return JsonResponse({'profiles': [{'name': file_name, 'url': reverse('pipeline_profile_download', args=[file_name])}
+                                      for file_name in list_profiles()]})
+
+
+@staff_member_required
+@require_GET
+def pipeline_profile_download(request, file_name):
+    path = profile_path(file_name)
+    if path is None:
+        raise Http404("Unknown profile.")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=file_name)
+
+
+# High scores of the history as JSON, best first: ?limit=N, then ?cursor=<next_cursor> of the previous page
+@require_GET
+@timed_view
+def results(request):
+    try:
+        limit = int(request.GET.get('limit', getattr(settings, 'PIPELINE_RESULTS_PAGE_SIZE', 50)))
+    except ValueError:
+        return JsonResponse({'error': "limit must be a number."}, status=400)
+    limit = min(max(limit, 1), getattr(settings, 'PIPELINE_RESULTS_MAX_PAGE_SIZE', 500))
+
+    try:
+        page, cached = cached_results_page(limit, request.GET.get('cursor') or None)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    next_url = None
+    if page['next_cursor']:
+        next_url = f"{reverse('results')}?{urlencode({'limit': limit, 'cursor': page['next_cursor']})}"
+    response = JsonResponse({**page, 'next': next_url})
+    response['X-Cache'] = 'HIT' if cached else 'MISS'
+    return response
+
+
+# Prometheus text exposition of the pipeline metrics recorded by this process
+@require_GET
+def metrics(request):
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def home(request):
     return render(request, 'home.html')
 
@@ -0,0 +1,110 @@
+# ###################################### ###################################### #
+# Vocabulary Builds
+#
+# A regeneration of the words and names tables (step 1) used to run the whole NLTK corpus through LangDetect
+# every time. Its inputs are now fingerprinted and kept with the words it accepted, so the next regeneration
+# only does what the changed inputs require:
+# I. Nothing, when the corpus, the length range, the offensive words and the detector are all unchanged.
+# II. LangDetect for the words it never checked (new corpus words, a wider length range); its verdicts are kept
+#    in vocabulary_language_checks and only thrown away when the detector (version or seed) changes.
+# III. The filters again over the kept verdicts, then only the difference to the last build's words
+#    (vocabulary_build_words) is inserted into or deleted from words and names.
+# Words added by hand or by a user upload are never part of a build, a regeneration leaves them alone.
+# ###################################### ###################################### #
+
+import hashlib
+import json
+
+# Seed of LangDetect's detector: unseeded, the same short word can come out as English on one run and not
+# on the next, which would make the kept verdicts meaningless
+LANGDETECT_SEED = 0
+
+CREATE_VOCABULARY_BUILDS_QUERY = '''
+CREATE TABLE IF NOT EXISTS vocabulary_builds (
+    build VARCHAR(32) NOT NULL PRIMARY KEY,
+    inputs TEXT NOT NULL,
+    built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
+'''
+
+CREATE_BUILD_WORDS_QUERY = '''
+CREATE TABLE IF NOT EXISTS vocabulary_build_words (
+    word VARCHAR(64) NOT NULL PRIMARY KEY,
+    NoOfLetters INT NOT NULL
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin;
+'''
+
+CREATE_LANGUAGE_CHECKS_QUERY = '''
+CREATE TABLE IF NOT EXISTS vocabulary_language_checks (
+    word VARCHAR(64) NOT NULL PRIMARY KEY,
+    english TINYINT(1) NOT NULL
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin;
+'''
+
+LOAD_BUILD_INPUTS_QUERY = '''
+SELECT inputs FROM vocabulary_builds WHERE build = %s
+'''
+
+SAVE_BUILD_INPUTS_QUERY = '''
+INSERT INTO vocabulary_builds (build, inputs) VALUES (%s, %s) ON DUPLICATE KEY UPDATE inputs = VALUES(inputs)
+'''
+
+
+def text_fingerprint(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def detector_fingerprint():
+    """LangDetect's version and seed, the verdicts kept for one detector do not hold for another."""
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        detector_version = version('langdetect')
+    except PackageNotFoundError:
+        detector_version = 'unknown'
+    return f"langdetect {detector_version} seed {LANGDETECT_SEED}"
+
+
+def build_inputs(corpus_text, min_letters, max_letters, offensive_words):
+    """What a build's outcome depends on, compared as a whole against the last build's."""
+    return {
+        'corpus': text_fingerprint(corpus_text),
+        'min_letters': min_letters,
+        'max_letters': max_letters,
+        'offensive_words': sorted(offensive_words),
+        'detector': detector_fingerprint(),
+    }
+
+
+def load_build_inputs(cur, build='words'):
+    """Inputs of the last build, None before the first one."""
+    cur.execute(CREATE_VOCABULARY_BUILDS_QUERY)
+    cur.execute(LOAD_BUILD_INPUTS_QUERY, (build,))
+    row = cur.fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def save_build_inputs(cur, inputs, build='words'):
+    cur.execute(SAVE_BUILD_INPUTS_QUERY, (build, json.dumps(inputs)))
+
+
+def load_build_words(cur):
+    """{word: NoOfLetters} the last build put into the vocabulary."""
+    cur.execute(CREATE_BUILD_WORDS_QUERY)
+    cur.execute('SELECT word, NoOfLetters FROM vocabulary_build_words')
+    return dict(cur.fetchall())
+
+
+def load_language_checks(cur, clear=False):
+    """{word: English or not} of the words LangDetect already checked, cleared first when asked to."""
+    cur.execute(CREATE_LANGUAGE_CHECKS_QUERY)
+    if clear:
+        cur.execute('DELETE FROM vocabulary_language_checks')
+        return {}
+    cur.execute('SELECT word, english FROM vocabulary_language_checks')
+    return {word: bool(english) for word, english in cur.fetchall()}
+
+
+def save_language_checks(cur, checks):
+    cur.executemany('INSERT IGNORE INTO vocabulary_language_checks (word, english) VALUES (%s, %s)',
+                    [(word, int(english)) for word, english in checks.items()])
@@ -0,0 +1,79 @@
+# ###################################### ###################################### #
+# Vocabulary Versions
+#
+# The email generator (step 3) keeps the vocabulary tables in memory for the life of the process. Every write
+# path of those tables (steps 1-2, the user upload) bumps the table's counter in vocabulary_versions through
+# its own cursor, before it commits, so no worker sees a new version ahead of its data.
+# get_email_generator() reads the counters (one small query, at most every VOCABULARY_CHECK_INTERVAL seconds)
+# and reloads only the tables whose counter moved, so uploads and regenerations reach running workers within
+# seconds, without a restart or a full reload per request.
+# ###################################### ###################################### #
+
+import os
+
+# Tables the generator draws from, element type of each
+VOCABULARY_TABLES = {
+    'words': 'word',
+    'names': 'name',
+    'common_years': 'year',
+    'common_numbers': 'number',
+}
+
+# Counter of the rows added to the scoring history, read with the vocabulary versions: a worker in the learned
+# mode refits its pattern model once the history grew enough since the fit
+HISTORY_VERSION = 'high_rated_unames_history'
+
+# Seconds between two version checks of a worker
+VOCABULARY_CHECK_INTERVAL = float(os.getenv('VOCABULARY_CHECK_INTERVAL', 5))
+
+CREATE_VOCABULARY_VERSIONS_QUERY = '''
+CREATE TABLE IF NOT EXISTS vocabulary_versions (
+    table_name VARCHAR(64) NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
+'''
+
+BUMP_VOCABULARY_VERSION_QUERY = '''
+INSERT INTO vocabulary_versions (table_name, version) VALUES (%s, 1)
+ON DUPLICATE KEY UPDATE version = version + 1
+'''
+
+BUMP_HISTORY_VERSION_QUERY = '''
+INSERT INTO vocabulary_versions (table_name, version) VALUES (%s, %s)
+ON DUPLICATE KEY UPDATE version = version + VALUES(version)
+'''
+
+VOCABULARY_VERSIONS_QUERY = '''
+SELECT table_name, version FROM vocabulary_versions
+'''
+
+
+def bump_vocabulary_versions(cur, *tables):
+    """Bumps the counters of the vocabulary tables among tables, through the writer's cursor (and transaction)."""
+    tables = [table for table in tables if table in VOCABULARY_TABLES]
+    if not tables:
+        return
+    cur.execute(CREATE_VOCABULARY_VERSIONS_QUERY)
+    for table in tables:
+        cur.execute(BUMP_VOCABULARY_VERSION_QUERY, (table,))
+
+
+def history_version_queries(rows_added):
+    """(query, params) pairs adding rows_added to the history's counter, for the blocking and the async writers."""
+    return [(CREATE_VOCABULARY_VERSIONS_QUERY, ()), (BUMP_HISTORY_VERSION_QUERY, (HISTORY_VERSION, rows_added))]
+
+
+def fetch_vocabulary_versions(cur):
+    """
+    {table: version} of the vocabulary tables, plus HISTORY_VERSION (rows added to the history so far).
+    A table never written through a bump is missing.
+    """
+    cur.execute(CREATE_VOCABULARY_VERSIONS_QUERY)
+    cur.execute(VOCABULARY_VERSIONS_QUERY)
+    return {table: version for table, version in cur.fetchall()
+            if table in VOCABULARY_TABLES or table == HISTORY_VERSION}
+
+
+def changed_tables(loaded_versions, current_versions):
+    return [table for table in VOCABULARY_TABLES if loaded_versions.get(table) != current_versions.get(table)]
@@ -125,3 +125,42 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Background pipeline jobs (core/pipeline_jobs.py)
+# Number of pipeline runs executed at the same time by each web process
+PIPELINE_JOB_WORKERS = 4
+# Finished jobs kept in memory for status polling
+PIPELINE_JOB_HISTORY = 100
+# Output lines buffered per job for polling and streaming clients
+PIPELINE_JOB_OUTPUT_LINES = 1000
+
+# Profiled pipeline runs (core/pipeline_profiling.py), requested by staff with ?profile=1 or run_pipeline --profile
+PIPELINE_PROFILE_DIR = BASE_DIR / 'profiles'
+# Functions and allocation sites listed in each profile's text report
+PIPELINE_PROFILE_TOP_ENTRIES = 40
+
+# Offline benchmark suite (core/benchmarks.py, manage.py run_benchmarks)
+PIPELINE_BENCHMARK_HISTORY = BASE_DIR / 'benchmark_history.json'
+# Allowed slowdown of a benchmark against its recent runs before the run fails (0.2 = 20%)
+PIPELINE_BENCHMARK_THRESHOLD = 0.2
+
+# History retention (core/history_retention.py, manage.py archive_history): months of history kept in the table,
+# and where the older months are archived as gzip'd CSV files before their partitions are dropped
+PIPELINE_HISTORY_RETENTION_MONTHS = 12
+PIPELINE_HISTORY_ARCHIVE_DIR = BASE_DIR / 'history_archive'
+
+# Cache of the results API pages (core/results_api.py, GET /results/). File-based, so the pipeline's writes
+# (web jobs, run_pipeline, archive_history) invalidate the pages every process of the host serves; point
+# 'default' at django.core.cache.backends.redis.RedisCache when the web processes run on several hosts
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    },
+}
+PIPELINE_RESULTS_CACHE = 'default'
+# Seconds a page is kept, a write to the history invalidates it sooner
+PIPELINE_RESULTS_CACHE_SECONDS = 300
+# Rows per page by default (?limit=N), and the most a request may ask for
+PIPELINE_RESULTS_PAGE_SIZE = 50
+PIPELINE_RESULTS_MAX_PAGE_SIZE = 500